@@ -2,10 +2,14 @@
 
 from asyncio import gather
 from datetime import datetime
-from os import getenv
+from os import cpu_count, getenv
 from pathlib import Path
 
 import bounded_channel
+from option_and_result import NONE, Some
+
+from utils import watch
+from utils.frames import release_frame_of, retain_frame_of
 
 from .modules import (
     m01_environment,
@@ -18,6 +22,16 @@ from .modules import (
     m08_aggregation,
     m09x_proxy_connector,
 )
+from .modules.m01_environment.frame_sources import (
+    parse_frame_source,
+    parse_frames_per_second,
+)
+from .modules.m02_human_detection.hog_tuning import load_hog_tuning
+from .modules.m02_human_detection.person_detectors import (
+    HOGParameters,
+    parse_input_size,
+    parse_person_detector,
+)
 
 PROXY_ENDPOINT = "ws://150.230.176.164/microcontroller"
 MICROCONTROLLER_ID = "system-number-1"
@@ -58,11 +72,13 @@ async def main():
     # From the environment module to the human detection module
     i13_motion_sender, i13_motion_receiver = bounded_channel.channel(32)
     i13_occupancy_sender, i13_occupancy_receiver = bounded_channel.channel(32)
-    i13_camera_frame_sender, i13_camera_frame_receiver = bounded_channel.channel(32)
+    # (one for camera frames from each camera, made once it's known how many there are)
     # From the environment module to the control module
     i14_sender, i14_receiver = bounded_channel.channel(32)
     # From the environment module to the aggregation module
-    i15_sender, i15_receiver = bounded_channel.channel(32)
+    i15_sender, i15_receiver = watch.channel(
+        retain=retain_frame_of, release=release_frame_of
+    )
     # From the proxy module to the aggregation module
     (
         i16_camera_feed_interest_sender,
@@ -79,6 +95,10 @@ async def main():
         i16_record_the_camera_sender,
         i16_record_the_camera_receiver,
     ) = bounded_channel.channel(32)
+    # From the human detection, person identification, and aggregation modules
+    # to the environment module
+    # (so the camera only captures while something needs its frames)
+    i17_sender, i17_receiver = bounded_channel.channel(32)
     # From the control module to the lighting module
     ih2_sender, ih2_receiver = bounded_channel.channel(32)
 
@@ -97,21 +117,343 @@ async def main():
             "but it needs to be False or True exactly"
         )
 
+    # Without the real hardware, the camera is simulated by default too
+    default_camera_source = (
+        "synthetic" if randomize_environment_module == "True" else "picamera"
+    )
+    # One for each camera, separated by commas (the first is the main camera)
+    camera_source = getenv("CAMERA_SOURCE", default_camera_source)
+    camera_frames_per_second = getenv("CAMERA_FRAMES_PER_SECOND", "24")
+
+    try:
+        if camera_source.split(",").count("picamera") > 1:
+            raise ValueError("there's only one PiCamera")
+
+        camera_frame_sources = [
+            parse_frame_source(
+                each_camera_source,
+                frames_per_second=parse_frames_per_second(camera_frames_per_second),
+            )
+            for each_camera_source in camera_source.split(",")
+        ]
+    except ValueError as error:
+        raise ValueError(
+            f"CAMERA_SOURCE is {camera_source!r} and CAMERA_FRAMES_PER_SECOND is "
+            f"{camera_frames_per_second!r} but {error}"
+        ) from error
+
+    # Camera frames come from a small pool of reused buffers (see the camera driver)
+    # so only the newest one from each camera is kept around for consumers
+    i13_camera_frame_channels = [
+        watch.channel(retain=retain_frame_of, release=release_frame_of)
+        for _camera_frame_source in camera_frame_sources
+    ]
+
+    # The fraction of a frame that has to change for it to not count as unchanged
+    camera_unchanged_threshold = getenv("CAMERA_UNCHANGED_THRESHOLD", "0.002")
+    try:
+        camera_unchanged_threshold_as_float = float(camera_unchanged_threshold)
+    except ValueError as error:
+        raise ValueError(
+            f"CAMERA_UNCHANGED_THRESHOLD is {camera_unchanged_threshold!r} "
+            "but it needs to be a number"
+        ) from error
+    if not 0 <= camera_unchanged_threshold_as_float <= 1:
+        raise ValueError(
+            f"CAMERA_UNCHANGED_THRESHOLD is {camera_unchanged_threshold!r} "
+            "but it needs to be from 0 to 1"
+        )
+
+    motion_sensor_edge_triggered = getenv("MOTION_SENSOR_EDGE_TRIGGERED", "True")
+    if motion_sensor_edge_triggered not in {"False", "True"}:
+        raise ValueError(
+            f"MOTION_SENSOR_EDGE_TRIGGERED is {motion_sensor_edge_triggered!r} "
+            "but it needs to be False or True exactly"
+        )
+
+    # Longer is more sensitive in a dark room but slower to read
+    light_sensor_integration_milliseconds = getenv(
+        "LIGHT_SENSOR_INTEGRATION_MILLISECONDS", "100"
+    )
+    if light_sensor_integration_milliseconds not in {
+        "100",
+        "200",
+        "300",
+        "400",
+        "500",
+        "600",
+    }:
+        raise ValueError(
+            "LIGHT_SENSOR_INTEGRATION_MILLISECONDS is "
+            f"{light_sensor_integration_milliseconds!r} "
+            "but it needs to be 100, 200, 300, 400, 500, or 600 exactly"
+        )
+
+    # How much the ambient light has to change by (relatively) to be passed along
+    light_sensor_deadband = getenv("LIGHT_SENSOR_DEADBAND", "0.05")
+    try:
+        light_sensor_deadband_as_float = float(light_sensor_deadband)
+    except ValueError as error:
+        raise ValueError(
+            f"LIGHT_SENSOR_DEADBAND is {light_sensor_deadband!r} "
+            "but it needs to be a number"
+        ) from error
+
     m01_environment_task = m01_environment.run(
         to_human_detection_motion=i13_motion_sender,
         to_human_detection_occupancy=i13_occupancy_sender,
-        to_human_detection_camera_frame=i13_camera_frame_sender,
+        to_human_detection_camera_frames=[
+            sender for (sender, _receiver) in i13_camera_frame_channels
+        ],
         to_control=i14_sender,
         to_aggregation=i15_sender,
+        from_camera_consumers=i17_receiver,
+        camera_frame_sources=camera_frame_sources,
+        camera_unchanged_threshold=camera_unchanged_threshold_as_float,
+        motion_sensor_edge_triggered=motion_sensor_edge_triggered == "True",
+        light_sensor_integration_milliseconds=int(
+            light_sensor_integration_milliseconds
+        ),
+        light_sensor_deadband=light_sensor_deadband_as_float,
         use_randomized_data=randomize_environment_module == "True",
     )
 
+    human_detector = getenv("HUMAN_DETECTOR", "hog")
+
+    # What the tuning benchmark recommended for HOG on this camera, if it's been run
+    # (anything set explicitly below still wins)
+    human_detection_tuning = getenv(
+        "HUMAN_DETECTION_TUNING", "human-detection-tuning.json"
+    )
+    try:
+        hog_tuning = (
+            load_hog_tuning(Path(human_detection_tuning))
+            if human_detector == "hog"
+            else NONE()
+        )
+    except ValueError as error:
+        raise ValueError(
+            f"HUMAN_DETECTION_TUNING is {human_detection_tuning!r} but {error}"
+        ) from error
+
+    # How much frames are downscaled by before looking for people in them
+    human_detection_scale = getenv(
+        "HUMAN_DETECTION_SCALE",
+        str(hog_tuning.map(lambda tuning: tuning.scale).unwrap_or(1)),
+    )
+    try:
+        human_detection_scale_as_float = float(human_detection_scale)
+    except ValueError as error:
+        raise ValueError(
+            f"HUMAN_DETECTION_SCALE is {human_detection_scale!r} "
+            "but it needs to be a number"
+        ) from error
+    if not 0 < human_detection_scale_as_float <= 1:
+        raise ValueError(
+            f"HUMAN_DETECTION_SCALE is {human_detection_scale!r} "
+            "but it needs to be more than 0 and at most 1"
+        )
+
+    human_detection_coarse_to_fine = getenv("HUMAN_DETECTION_COARSE_TO_FINE", "False")
+    if human_detection_coarse_to_fine not in {"False", "True"}:
+        raise ValueError(
+            f"HUMAN_DETECTION_COARSE_TO_FINE is {human_detection_coarse_to_fine!r} "
+            "but it needs to be False or True exactly"
+        )
+
+    # Each is a whole process with its own copy of OpenCV, so memory adds up quickly
+    human_detection_processes = getenv("HUMAN_DETECTION_PROCESSES", "1")
+    if not human_detection_processes.isdigit() or int(human_detection_processes) < 1:
+        raise ValueError(
+            f"HUMAN_DETECTION_PROCESSES is {human_detection_processes!r} "
+            "but it needs to be a whole number of at least 1"
+        )
+
+    human_detection_maximum_in_flight = getenv("HUMAN_DETECTION_MAXIMUM_IN_FLIGHT", "2")
+    if (
+        not human_detection_maximum_in_flight.isdigit()
+        or int(human_detection_maximum_in_flight) < 1
+    ):
+        raise ValueError(
+            "HUMAN_DETECTION_MAXIMUM_IN_FLIGHT is "
+            f"{human_detection_maximum_in_flight!r} "
+            "but it needs to be a whole number of at least 1"
+        )
+
+    # How many threads OpenCV can use in each of those processes
+    # (by default, the cores are shared out between them)
+    human_detection_threads = getenv(
+        "HUMAN_DETECTION_THREADS",
+        str(max((cpu_count() or 1) // int(human_detection_processes), 1)),
+    )
+    if not human_detection_threads.isdigit() or int(human_detection_threads) < 1:
+        raise ValueError(
+            f"HUMAN_DETECTION_THREADS is {human_detection_threads!r} "
+            "but it needs to be a whole number of at least 1"
+        )
+
+    # Unset means the tuned or each detector's own default
+    human_detection_confidence = getenv("HUMAN_DETECTION_CONFIDENCE")
+    try:
+        human_detection_confidence_option = (
+            hog_tuning.map(lambda tuning: tuning.confidence_threshold)
+            if human_detection_confidence is None
+            else Some(float(human_detection_confidence))
+        )
+    except ValueError as error:
+        raise ValueError(
+            f"HUMAN_DETECTION_CONFIDENCE is {human_detection_confidence!r} "
+            "but it needs to be a number"
+        ) from error
+
+    human_detection_input_size = getenv("HUMAN_DETECTION_INPUT_SIZE")
+    try:
+        human_detection_input_size_option = (
+            NONE()
+            if human_detection_input_size is None
+            else Some(parse_input_size(human_detection_input_size))
+        )
+    except ValueError as error:
+        raise ValueError(
+            f"HUMAN_DETECTION_INPUT_SIZE is {human_detection_input_size!r} but {error}"
+        ) from error
+
+    # Unset means the usual one for the style of network
+    human_detection_person_class = getenv("HUMAN_DETECTION_PERSON_CLASS")
+    if (
+        human_detection_person_class is not None
+        and not human_detection_person_class.isdigit()
+    ):
+        raise ValueError(
+            f"HUMAN_DETECTION_PERSON_CLASS is {human_detection_person_class!r} "
+            "but it needs to be a whole number"
+        )
+
+    human_detection_pixel_scale = getenv("HUMAN_DETECTION_PIXEL_SCALE")
+    try:
+        human_detection_pixel_scale_option = (
+            NONE()
+            if human_detection_pixel_scale is None
+            else Some(float(human_detection_pixel_scale))
+        )
+    except ValueError as error:
+        raise ValueError(
+            f"HUMAN_DETECTION_PIXEL_SCALE is {human_detection_pixel_scale!r} "
+            "but it needs to be a number"
+        ) from error
+    if (
+        human_detection_pixel_scale_option.is_some()
+        and human_detection_pixel_scale_option.unwrap() <= 0
+    ):
+        raise ValueError(
+            f"HUMAN_DETECTION_PIXEL_SCALE is {human_detection_pixel_scale!r} "
+            "but it needs to be more than 0"
+        )
+
+    human_detection_pixel_mean = getenv("HUMAN_DETECTION_PIXEL_MEAN")
+    try:
+        human_detection_pixel_mean_option = (
+            NONE()
+            if human_detection_pixel_mean is None
+            else Some(float(human_detection_pixel_mean))
+        )
+    except ValueError as error:
+        raise ValueError(
+            f"HUMAN_DETECTION_PIXEL_MEAN is {human_detection_pixel_mean!r} "
+            "but it needs to be a number"
+        ) from error
+
+    # The tuning's parameters were already checked when it was loaded,
+    # so anything wrong from here on is with the detector or the settings it was given
+    try:
+        person_detector = parse_person_detector(
+            human_detector,
+            confidence_threshold=human_detection_confidence_option,
+            input_size=human_detection_input_size_option,
+            scale=human_detection_scale_as_float,
+            coarse_to_fine=human_detection_coarse_to_fine == "True",
+            threads=int(human_detection_threads),
+            hog_parameters=hog_tuning.map(lambda tuning: tuning.parameters).unwrap_or(
+                HOGParameters()
+            ),
+            person_class_id=NONE()
+            if human_detection_person_class is None
+            else Some(int(human_detection_person_class)),
+            pixel_scale=human_detection_pixel_scale_option,
+            pixel_mean=human_detection_pixel_mean_option,
+        )
+    except ValueError as error:
+        raise ValueError(f"HUMAN_DETECTOR is {human_detector!r} but {error}") from error
+
+    human_detection_foreground_gating = getenv(
+        "HUMAN_DETECTION_FOREGROUND_GATING", "True"
+    )
+    if human_detection_foreground_gating not in {"False", "True"}:
+        raise ValueError(
+            "HUMAN_DETECTION_FOREGROUND_GATING is "
+            f"{human_detection_foreground_gating!r} "
+            "but it needs to be False or True exactly"
+        )
+
+    human_detection_tracking = getenv("HUMAN_DETECTION_TRACKING", "True")
+    if human_detection_tracking not in {"False", "True"}:
+        raise ValueError(
+            f"HUMAN_DETECTION_TRACKING is {human_detection_tracking!r} "
+            "but it needs to be False or True exactly"
+        )
+
+    # The fraction of the time looking for people may take
+    human_detection_cpu_budget = getenv("HUMAN_DETECTION_CPU_BUDGET", "0.25")
+    try:
+        human_detection_cpu_budget_as_float = float(human_detection_cpu_budget)
+    except ValueError as error:
+        raise ValueError(
+            f"HUMAN_DETECTION_CPU_BUDGET is {human_detection_cpu_budget!r} "
+            "but it needs to be a number"
+        ) from error
+    if not 0 < human_detection_cpu_budget_as_float <= 1:
+        raise ValueError(
+            f"HUMAN_DETECTION_CPU_BUDGET is {human_detection_cpu_budget!r} "
+            "but it needs to be more than 0 and at most 1"
+        )
+
+    human_detection_cache_size = getenv("HUMAN_DETECTION_CACHE_SIZE", "8")
+    if not human_detection_cache_size.isdigit():
+        raise ValueError(
+            f"HUMAN_DETECTION_CACHE_SIZE is {human_detection_cache_size!r} "
+            "but it needs to be a whole number"
+        )
+
+    human_detection_cache_tolerance = getenv("HUMAN_DETECTION_CACHE_TOLERANCE", "2")
+    if (
+        not human_detection_cache_tolerance.isdigit()
+        or int(human_detection_cache_tolerance) > 64
+    ):
+        raise ValueError(
+            f"HUMAN_DETECTION_CACHE_TOLERANCE is {human_detection_cache_tolerance!r} "
+            "but it needs to be a whole number of at most 64"
+        )
+
     m02_human_detection_task = m02_human_detection.run(
         from_environment_motion=i13_motion_receiver,
         from_environment_occupancy=i13_occupancy_receiver,
-        from_environment_camera_frame=i13_camera_frame_receiver,
+        from_environment_camera_frames=[
+            receiver for (_sender, receiver) in i13_camera_frame_channels
+        ],
         to_activity_recognition=i03_sender,
         to_person_identification=i04_sender,
+        to_environment_camera_demand=i17_sender,
+        person_detector=person_detector,
+        detection_processes=int(human_detection_processes),
+        detection_maximum_in_flight=int(human_detection_maximum_in_flight),
+        foreground_gating=human_detection_foreground_gating == "True",
+        person_tracking=human_detection_tracking == "True",
+        detection_cpu_budget=human_detection_cpu_budget_as_float,
+        detection_cache_size=int(human_detection_cache_size),
+        detection_cache_tolerance=int(human_detection_cache_tolerance),
+        detection_mask_path=Path(
+            getenv("HUMAN_DETECTION_MASK", "human-detection-mask.json")
+        ),
     )
 
     m03_activity_recognition_task = m03_activity_recognition.run(
@@ -121,14 +463,31 @@ async def main():
 
     trusted_users_folder = Path("trusted-users")
 
+    # How many frames can have their faces being recognized at once
+    # (while human detection moves on to the next)
+    person_identification_maximum_in_flight = getenv(
+        "PERSON_IDENTIFICATION_MAXIMUM_IN_FLIGHT", "2"
+    )
+    if (
+        not person_identification_maximum_in_flight.isdigit()
+        or int(person_identification_maximum_in_flight) < 1
+    ):
+        raise ValueError(
+            "PERSON_IDENTIFICATION_MAXIMUM_IN_FLIGHT is "
+            f"{person_identification_maximum_in_flight!r} "
+            "but it needs to be a whole number of at least 1"
+        )
+
     m04_person_identification_task = m04_person_identification.run(
         from_human_detection=i04_receiver,
         from_proxy=i08_receiver,
         to_aggregation=i10_sender,
         to_proxy=i09_sender,
         to_control=i06_sender,
+        to_environment_camera_demand=i17_sender,
         trusted_users_folder=trusted_users_folder,
         get_current_time=get_current_time,
+        recognition_maximum_in_flight=int(person_identification_maximum_in_flight),
     )
 
     m05_preferences_task = m05_preferences.run(
@@ -179,6 +538,7 @@ async def main():
         to_proxy_camera_frame=i02_camera_frame_sender,
         to_proxy_duty_cycle=i02_duty_cycle_sender,
         to_proxy_history=i02_history_sender,
+        to_environment_camera_demand=i17_sender,
         history_folder=history_folder,
         get_current_time=get_current_time,
     )
@@ -234,13 +594,14 @@ async def main():
     del i11_power_sender, i11_power_receiver
     del i13_motion_sender, i13_motion_receiver
     del i13_occupancy_sender, i13_occupancy_receiver
-    del i13_camera_frame_sender, i13_camera_frame_receiver
+    del i13_camera_frame_channels
     del i14_sender, i14_receiver
     del i15_sender, i15_receiver
     del i16_camera_feed_interest_sender, i16_camera_feed_interest_receiver
     del i16_request_duty_cycle_sender, i16_request_duty_cycle_receiver
     del i16_request_history_sender, i16_request_history_receiver
     del i16_record_the_camera_sender, i16_record_the_camera_receiver
+    del i17_sender, i17_receiver
     del ih2_sender, ih2_receiver
 
     # End of dropping extra references
@@ -13,6 +13,8 @@ import numpy as np
 from option_and_result import Option
 from PIL.Image import Image
 
+from utils.frames import Frame
+
 # Any is used as a placeholder for all the types we expect to write at a later time
 # They will use @dataclass and the | operator (actually Union because of Python version requirements)
 # discussed in the low level design specification document
@@ -50,7 +52,8 @@ class FromAggregationToProxyDutyCycle:
 
 @dataclass
 class FromAggregationToProxyCameraFrame:
-    frame: Image
+    # Already encoded (once, and shared by anything else that needed it encoded)
+    jpeg: bytes
 
     user_ids: list[str]
 
@@ -106,16 +109,51 @@ class FromAggregationToProxyHistory:
     user_id: str
 
 
+# Interfaces 03 and 04
+@dataclass
+class Detection:
+    "A person found by human detection"
+
+    # Where they are in the frame, as x start, y start, x end, y end
+    box: tuple[int, int, int, int]
+    # How sure the person detector is (on its own scale, so not always a probability)
+    confidence: float
+    # The frame they were found in
+    frame_id: int
+    # The camera that frame's from
+    camera_id: int
+    # The same for as long as they're followed from frame to frame
+    # (by that camera, since each has its own)
+    track_id: int
+    # Cropped out of that frame (in color, as RGB), resized to fit a fixed size
+    # (see person crops), and read-only since it's their entry in the crops
+    image: np.ndarray
+
+
 # Interface 03
 @dataclass
 class FromHumanDetectionToActivityRecognition:
-    images_of_humans: list[np.ndarray]
+    detections: list[Detection]
+    # Every detection's image packed together, in the same order
+    # (number of people × height × width × 3), and shared with person identification
+    crops: np.ndarray
+    # The frame they were looked for in (which results for it are joined on in control)
+    frame_id: int
+    # When that frame was captured (in the time.monotonic clock)
+    captured_at: float
 
 
 # Interface 04
 @dataclass
 class FromHumanDetectionToPersonIdentification:
-    images_of_humans: list[np.ndarray]
+    detections: list[Detection]
+    # Every detection's image packed together, in the same order
+    # (number of people × height × width × 3), and shared with activity recognition
+    crops: np.ndarray
+    # The frame they were looked for in (which results for it are joined on in control)
+    frame_id: int
+    # When that frame was captured (in the time.monotonic clock)
+    captured_at: float
 
 
 # Interface 05
@@ -129,6 +167,10 @@ class Activity(Enum):
 @dataclass
 class FromActivityRecognitionToControl:
     activities_of_humans: list[Activity]
+    # The frame the humans were found in
+    frame_id: int
+    # When that frame was captured (in the time.monotonic clock)
+    captured_at: float
 
 
 # Interface 06
@@ -143,6 +185,10 @@ IdentifiedPerson = Option[UserSlot]  # Reusing the UserSlot definition in 4.3.1.
 @dataclass
 class FromPersonIdentificationToControl:
     identified_people: list[IdentifiedPerson]
+    # The frame the people were found in
+    frame_id: int
+    # When that frame was captured (in the time.monotonic clock)
+    captured_at: float
 
 
 # Interface 07
@@ -204,6 +250,7 @@ class FromProxyToPersonIdentification:
 
     user_slot: UserSlot
 
+
 # Interface 09
 @dataclass
 class FromPersonIdentificationToProxy:
@@ -256,7 +303,8 @@ class FromEnvironmentToHumanDetectionOccupancy:
 class FromEnvironmentToHumanDetectionCameraFrame:
     "Camera feed frames"
 
-    frame: np.ndarray
+    # The receiver has to release this when it's done with it
+    frame: Frame
 
 
 # Interface 14
@@ -270,7 +318,8 @@ class FromEnvironmentToControl:
 class FromEnvironmentToAggregation:
     "Camera feed frames"
 
-    frame: np.ndarray
+    # The receiver has to release this when it's done with it
+    frame: Frame
 
 
 # Interface 16
@@ -293,6 +342,46 @@ class FromProxyToAggregationRecordTheCamera:
 
     should_record: bool
 
+
+# Interface 17
+# The camera recordings, the live feed, and enrolling faces use
+# (when there's more than one)
+MAIN_CAMERA = 0
+
+
+class CameraConsumer(Enum):
+    "Everything that needs frames from the camera"
+
+    HUMAN_DETECTION = 1
+    LIVE_FEED = 2
+    RECORDING = 3
+    ENROLLMENT = 4
+    PERSON_TRACKING = 5
+
+
+class CameraProfile(Enum):
+    "Named capture resolutions, from the least to the most detailed"
+
+    DETECTION = 1
+    STREAMING = 2
+    HIGH_DETAIL = 3
+
+
+@dataclass
+class FromCameraConsumerToEnvironment:
+    """
+    How many frames per second a consumer of the camera feed needs from now on
+    (0 when it doesn't need any, so the camera can idle if nobody else does either)
+    and how detailed they need to be
+    """
+
+    consumer: CameraConsumer
+    frames_per_second: float
+    profile: CameraProfile
+    # Which camera (only human detection looks at any but the main one)
+    camera_id: int = MAIN_CAMERA
+
+
 # Hardware interface 2
 @dataclass
 class FromControlToLighting:
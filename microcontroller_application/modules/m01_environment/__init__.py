@@ -10,8 +10,10 @@ from the room.
 from asyncio import gather
 
 import bounded_channel
+from store import writable
 
 from microcontroller_application.interfaces.message_types import (
+    FromCameraConsumerToEnvironment,
     FromEnvironmentToAggregation,
     FromEnvironmentToControl,
     FromEnvironmentToHumanDetectionCameraFrame,
@@ -19,7 +21,10 @@ from microcontroller_application.interfaces.message_types import (
     FromEnvironmentToHumanDetectionOccupancy,
 )
 from microcontroller_application.log import get_logger
+from utils import watch
 
+from .frame_sources import FrameSource
+from .sampling_scheduler import SamplingScheduler
 from .software_components import (
     sc02_camera_driver,
     sc04_light_sensor_driver,
@@ -38,11 +43,17 @@ async def run(
     to_human_detection_occupancy: bounded_channel.Sender[
         FromEnvironmentToHumanDetectionOccupancy
     ],
-    to_human_detection_camera_frame: bounded_channel.Sender[
-        FromEnvironmentToHumanDetectionCameraFrame
+    to_human_detection_camera_frames: list[
+        watch.Sender[FromEnvironmentToHumanDetectionCameraFrame]
     ],
     to_control: bounded_channel.Sender[FromEnvironmentToControl],
-    to_aggregation: bounded_channel.Sender[FromEnvironmentToAggregation],
+    to_aggregation: watch.Sender[FromEnvironmentToAggregation],
+    from_camera_consumers: bounded_channel.Receiver[FromCameraConsumerToEnvironment],
+    camera_frame_sources: list[FrameSource],
+    camera_unchanged_threshold: float,
+    motion_sensor_edge_triggered: bool,
+    light_sensor_integration_milliseconds: int,
+    light_sensor_deadband: float,
     use_randomized_data: bool,
 ):
     "Run the environment module"
@@ -55,28 +66,42 @@ async def run(
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
 
+    scheduler = SamplingScheduler()
+    occupied_store = writable(False)
+
     sc02_camera_driver_task = sc02_camera_driver.run(
-        to_human_detection=to_human_detection_camera_frame,
+        to_human_detection=to_human_detection_camera_frames,
         to_aggregation=to_aggregation,
-        use_randomized_data=use_randomized_data,
+        from_camera_consumers=from_camera_consumers,
+        frame_sources=camera_frame_sources,
+        unchanged_threshold=camera_unchanged_threshold,
     )
 
     sc04_light_sensor_driver_task = sc04_light_sensor_driver.run(
         to_control=to_control,
+        scheduler=scheduler,
+        integration_milliseconds=light_sensor_integration_milliseconds,
+        relative_deadband=light_sensor_deadband,
         use_randomized_data=use_randomized_data,
     )
 
     sc06_motion_sensor_driver_task = sc06_motion_sensor_driver.run(
         to_human_detection=to_human_detection_motion,
+        scheduler=scheduler,
+        occupied_store=occupied_store,
+        edge_triggered=motion_sensor_edge_triggered,
         use_randomized_data=use_randomized_data,
     )
 
     sc08_occupancy_sensor_driver_task = sc08_occupancy_sensor_driver.run(
         to_human_detection=to_human_detection_occupancy,
+        scheduler=scheduler,
+        occupied_store=occupied_store,
         use_randomized_data=use_randomized_data,
     )
 
     await gather(
+        scheduler.run(),
         sc02_camera_driver_task,
         sc04_light_sensor_driver_task,
         sc06_motion_sensor_driver_task,
@@ -0,0 +1,186 @@
+"""
+Module: 01. Environment
+
+Stand-ins for the Raspberry Pi's hardware, for running the drivers
+(and testing them) on any computer
+
+Each one has the same interface as the real library it replaces
+(or at least the part of it the drivers use)
+plus ways of making things happen, like a sensor's pin changing state.
+"""
+
+import os
+from threading import Lock
+from time import sleep
+from typing import Callable, Optional
+
+
+class FakeGPIO:
+    """
+    Like the RPi.GPIO module, but pins only change when `set_input` says so
+
+    Like RPi.GPIO, event callbacks are called on a thread other than the event loop's
+    (whichever thread calls `set_input`).
+    """
+
+    BCM = 11
+    IN = 1
+    OUT = 0
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+
+    def __init__(self):
+        self._levels: dict[int, int] = {}
+        self._callbacks: dict[int, tuple[int, Callable[[int], object]]] = {}
+        self._lock = Lock()
+
+    def setmode(self, _mode: int):
+        "Pins are only ever numbered one way here, so this does nothing"
+
+    def setwarnings(self, _warnings: bool):
+        "There's nothing to warn about, so this does nothing"
+
+    def setup(self, pin: int, _direction: int, pull_up_down: int = PUD_OFF):
+        "Start the pin off at whatever its pull resistor would make it read"
+
+        with self._lock:
+            self._levels.setdefault(pin, 1 if pull_up_down == self.PUD_UP else 0)
+
+    def input(self, pin: int) -> int:
+        "What the pin reads"
+
+        with self._lock:
+            return self._levels[pin]
+
+    def add_event_detect(
+        self,
+        pin: int,
+        edge: int,
+        callback: Optional[Callable[[int], object]] = None,
+        bouncetime: Optional[int] = None,  # pylint: disable=unused-argument
+    ):
+        "Call the callback on every edge of the kind asked for"
+
+        # The drivers debounce in software, so bouncetime is ignored
+        if callback is None:
+            raise NotImplementedError("only callbacks are faked")
+
+        with self._lock:
+            if pin in self._callbacks:
+                raise RuntimeError(f"edge detection is already enabled for pin {pin}")
+
+            self._callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin: int):
+        "Stop calling the pin's callback"
+
+        with self._lock:
+            self._callbacks.pop(pin, None)
+
+    def cleanup(self):
+        "Forget every pin"
+
+        with self._lock:
+            self._levels.clear()
+            self._callbacks.clear()
+
+    def set_input(self, pin: int, level: int):
+        "Change what the pin reads, calling its callback if that's an edge it's waiting for"
+
+        with self._lock:
+            previous = self._levels.get(pin, 0)
+            self._levels[pin] = level
+
+            edge_and_callback = self._callbacks.get(pin)
+
+        if edge_and_callback is None or level == previous:
+            return
+
+        edge, callback = edge_and_callback
+
+        rising = level > previous
+
+        if edge == self.BOTH or (edge == self.RISING) == rising:
+            callback(pin)
+
+    def bounce(self, pin: int, levels: list[int]):
+        "Flip the pin through several levels in a row, like a noisy contact does"
+
+        for level in levels:
+            self.set_input(pin, level)
+
+
+class FakeTSL2591:  # pylint: disable=too-few-public-methods
+    """
+    Like the TSL2591 light sensor from the adafruit_tsl2591 library
+
+    Reading `lux` blocks for as long as the integration time
+    (like the real I2C transaction does) or however long `read_seconds` says,
+    then gives whatever `lux_source` returns, or raises whatever it raises.
+    """
+
+    def __init__(
+        self,
+        lux_source: Callable[[], float],
+        *,
+        read_seconds: Optional[float] = None,
+    ):
+        self.lux_source = lux_source
+        self.read_seconds = read_seconds
+        # Like INTEGRATIONTIME_100MS from the adafruit_tsl2591 library
+        self.integration_time = 0x00
+
+    @property
+    def lux(self) -> float:
+        "The ambient light intensity (in lux)"
+
+        if self.read_seconds is None:
+            # Each step up in integration time is another 100 ms
+            sleep(0.1 * (self.integration_time + 1))
+        else:
+            sleep(self.read_seconds)
+
+        return self.lux_source()
+
+
+class FakeOccupancySensor:
+    """
+    A pseudoterminal that acts like the occupancy sensor's serial port
+    (which only exists on Linux and macOS)
+
+    The driver reads from `port_file_descriptor` (or opens `port_name`)
+    and whatever is written with `send` shows up there, just like bytes from the sensor.
+    """
+
+    def __init__(self):
+        import tty
+
+        self._sensor_end, self.port_file_descriptor = os.openpty()
+        self.port_name = os.ttyname(self.port_file_descriptor)
+
+        # Pass bytes through exactly as they're written (like a real serial port)
+        tty.setraw(self.port_file_descriptor)
+
+    def send(self, data: bytes):
+        "Write raw bytes (which can be part of a line or several lines)"
+
+        os.write(self._sensor_end, data)
+
+    def send_occupancy(self, occupied: bool):
+        "Write a whole line like the sensor does"
+
+        self.send(b"$JYBSS,%d, , , *\r\n" % occupied)
+
+    def unplug(self):
+        "Close the sensor's end, which the driver sees as the port closing"
+
+        os.close(self._sensor_end)
+
+    def close(self):
+        "Close the driver's end"
+
+        os.close(self.port_file_descriptor)
@@ -0,0 +1,393 @@
+"""
+Module: 01. Environment
+
+Where the camera driver gets its frames from
+
+The real system uses the PiCamera, but the rest of the vision pipeline
+can be driven (and load tested) on any computer by replaying a video file
+or a folder of images, or by generating frames procedurally.
+
+Every source either has a frame rate to be paced at
+or is "free-running", meaning it produces frames as fast as consumers accept them.
+
+The resolution of every source can be changed between frames,
+since the camera driver switches between resolutions depending on what they're for.
+"""
+
+from pathlib import Path
+from typing import Optional, Protocol
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option, Some
+from PIL import Image
+
+from utils.frames import Frame
+
+
+class FrameSource(Protocol):
+    "Something that frames can be captured from, one at a time, on the capture thread"
+
+    # NONE means free-running
+    frames_per_second: Option[float]
+
+    def open(self) -> None:
+        "Get ready to capture (which can block for a while)"
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        "The width and height of every frame (only known once opened)"
+
+    def change_resolution(self, resolution: tuple[int, int]) -> None:
+        "Capture frames at this width and height from now on (which can block for a while)"
+
+    def capture_into(self, frame: Frame) -> bool:
+        "Fill the frame's buffer with the next frame, returning False if there are none left"
+
+    def close(self) -> None:
+        "Let go of whatever was opened"
+
+
+class PiCameraFrameSource:
+    "The camera attached to the Raspberry Pi"
+
+    def __init__(
+        self,
+        *,
+        frames_per_second: Option[float],
+        resolution: tuple[int, int] = (768, 576),
+    ):
+        self.frames_per_second = frames_per_second
+        self._resolution = resolution
+        self._camera = None
+
+    def open(self):
+        "Start up the camera"
+
+        from picamera import PiCamera
+
+        self._camera = PiCamera()
+        self._camera.resolution = self._resolution
+
+        if self.frames_per_second.is_some():
+            self._camera.framerate = self.frames_per_second.unwrap()
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        "The width and height of every frame"
+
+        return self._resolution
+
+    def change_resolution(self, resolution: tuple[int, int]):
+        "Capture frames at this width and height from now on"
+
+        self._resolution = resolution
+
+        if self._camera is not None:
+            # The camera picks a new sensor mode for this, which takes a moment
+            self._camera.resolution = resolution
+
+    def capture_into(self, frame: Frame) -> bool:
+        "Capture straight into the frame's buffer (which is always successful)"
+
+        self._camera.capture(frame.array, "rgb")  # type: ignore
+        return True
+
+    def close(self):
+        "Let go of the camera"
+
+        if self._camera is not None:
+            self._camera.close()
+
+
+class VideoFileFrameSource:
+    "A local video file read with OpenCV (which loops back to the start when it ends)"
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        frames_per_second: Option[float],
+        resolution: Option[tuple[int, int]] = NONE(),
+        loop: bool = True,
+    ):
+        self.frames_per_second = frames_per_second
+        self.path = path
+        self.loop = loop
+        self._resolution = resolution
+        self._capture: Optional[cv2.VideoCapture] = None
+
+    def open(self):
+        "Open the video (at its own resolution, unless one was given)"
+
+        capture = cv2.VideoCapture(str(self.path))
+
+        if not capture.isOpened():
+            raise FileNotFoundError(f"could not open {self.path} as a video")
+
+        self._capture = capture
+
+        if self._resolution.is_none():
+            width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self._resolution = Some((width, height))
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        "The width and height every frame is resized to"
+
+        return self._resolution.unwrap()
+
+    def change_resolution(self, resolution: tuple[int, int]):
+        "Resize frames to this width and height from now on"
+
+        self._resolution = Some(resolution)
+
+    def capture_into(self, frame: Frame) -> bool:
+        "Read the next frame of the video into the frame's buffer"
+
+        assert self._capture is not None, "the video has to be opened first"
+
+        successful, bgr_image = self._capture.read()
+
+        if not successful and self.loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            successful, bgr_image = self._capture.read()
+
+        if not successful:
+            return False
+
+        if bgr_image.shape[1::-1] != self.resolution:
+            bgr_image = cv2.resize(bgr_image, self.resolution)
+
+        # OpenCV uses BGR but the rest of the system expects RGB
+        cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB, dst=frame.array)
+
+        return True
+
+    def close(self):
+        "Close the video"
+
+        if self._capture is not None:
+            self._capture.release()
+
+
+def image_order(path: Path) -> tuple[bool, int, str]:
+    "Sort 2.jpg before 10.jpg (and everything that isn't a number after those)"
+
+    if path.stem.isdigit():
+        return (False, int(path.stem), "")
+
+    return (True, 0, path.name)
+
+
+class ImageFolderFrameSource:
+    "A folder of JPEGs replayed in order (which loops back to the first when it ends)"
+
+    def __init__(
+        self,
+        folder: Path,
+        *,
+        frames_per_second: Option[float],
+        resolution: Option[tuple[int, int]] = NONE(),
+        loop: bool = True,
+    ):
+        self.frames_per_second = frames_per_second
+        self.folder = folder
+        self.loop = loop
+        self._resolution = resolution
+        self._paths: list[Path] = []
+        self._next_index = 0
+
+    def open(self):
+        "Find the JPEGs (and the resolution of the first, unless one was given)"
+
+        self._paths = sorted(
+            (
+                path
+                for path in self.folder.iterdir()
+                if path.suffix.lower() in {".jpg", ".jpeg"}
+            ),
+            key=image_order,
+        )
+
+        if not self._paths:
+            raise FileNotFoundError(f"there are no JPEGs in {self.folder}")
+
+        if self._resolution.is_none():
+            first_image = Image.open(self._paths[0])
+            with first_image:
+                self._resolution = Some(first_image.size)
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        "The width and height every image is resized to"
+
+        return self._resolution.unwrap()
+
+    def change_resolution(self, resolution: tuple[int, int]):
+        "Resize images to this width and height from now on"
+
+        self._resolution = Some(resolution)
+
+    def capture_into(self, frame: Frame) -> bool:
+        "Decode the next image into the frame's buffer"
+
+        if self._next_index >= len(self._paths):
+            if not self.loop:
+                return False
+
+            self._next_index = 0
+
+        path = self._paths[self._next_index]
+        self._next_index += 1
+
+        image = Image.open(path)
+        with image:
+            rgb_image = image.convert("RGB")
+
+            if rgb_image.size != self.resolution:
+                rgb_image = rgb_image.resize(self.resolution)
+
+            frame.array[:] = np.asarray(rgb_image)
+
+        return True
+
+    def close(self):
+        "There's nothing to let go of"
+
+
+class SyntheticFrameSource:
+    """
+    Procedurally generated frames of a figure walking across a gradient
+
+    This is deterministic and costs next to nothing to produce,
+    so it's the best source for measuring the throughput of everything downstream.
+    """
+
+    def __init__(
+        self,
+        *,
+        frames_per_second: Option[float],
+        resolution: tuple[int, int] = (768, 576),
+    ):
+        self.frames_per_second = frames_per_second
+        self._resolution = resolution
+        self._background = np.empty(0, dtype=np.uint8)
+        self._frame_number = 0
+
+    def open(self):
+        "Draw the background"
+
+        self._draw_background()
+
+    def _draw_background(self):
+        width, height = self._resolution
+
+        vertical = np.linspace(40, 200, height, dtype=np.uint8)
+        horizontal = np.linspace(60, 160, width, dtype=np.uint8)
+
+        self._background = np.empty((height, width, 3), dtype=np.uint8)
+        self._background[:, :, 0] = vertical[:, np.newaxis]
+        self._background[:, :, 1] = horizontal[np.newaxis, :]
+        self._background[:, :, 2] = 120
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        "The width and height of every frame"
+
+        return self._resolution
+
+    def change_resolution(self, resolution: tuple[int, int]):
+        "Draw frames at this width and height from now on"
+
+        self._resolution = resolution
+        self._draw_background()
+
+    def capture_into(self, frame: Frame) -> bool:
+        "Draw the next frame into the frame's buffer"
+
+        width, height = self._resolution
+
+        image = frame.array
+        np.copyto(image, self._background)
+
+        # Walk back and forth across the room
+        figure_height = height // 2
+        figure_width = figure_height // 3
+        stride = 4
+        travel = max(width - figure_width, 1)
+        position = (self._frame_number * stride) % (2 * travel)
+        left = position if position < travel else 2 * travel - position
+        top = height // 3
+
+        cv2.rectangle(
+            image,
+            (left, top),
+            (left + figure_width, top + figure_height),
+            (30, 30, 90),
+            thickness=-1,
+        )
+        cv2.circle(
+            image,
+            (left + figure_width // 2, top - figure_width // 3),
+            figure_width // 3,
+            (220, 180, 150),
+            thickness=-1,
+        )
+
+        self._frame_number += 1
+
+        return True
+
+    def close(self):
+        "There's nothing to let go of"
+
+
+def parse_frame_source(
+    description: str, *, frames_per_second: Option[float]
+) -> FrameSource:
+    """
+    Make a frame source from a description like the ones
+    the CAMERA_SOURCE environment variable is set to:
+    `picamera`, `synthetic`, `video:<path>`, or `images:<folder>`
+    """
+
+    kind, _separator, argument = description.partition(":")
+
+    if kind == "picamera" and not argument:
+        return PiCameraFrameSource(frames_per_second=frames_per_second)
+
+    if kind == "synthetic" and not argument:
+        return SyntheticFrameSource(frames_per_second=frames_per_second)
+
+    if kind == "video" and argument:
+        return VideoFileFrameSource(Path(argument), frames_per_second=frames_per_second)
+
+    if kind == "images" and argument:
+        return ImageFolderFrameSource(
+            Path(argument), frames_per_second=frames_per_second
+        )
+
+    raise ValueError(
+        f"{description!r} needs to be picamera, synthetic, video:<path>, or images:<folder>"
+    )
+
+
+def parse_frames_per_second(description: str) -> Option[float]:
+    "Either a positive number or `free` (for free-running)"
+
+    if description == "free":
+        return NONE()
+
+    try:
+        frames_per_second = float(description)
+    except ValueError as error:
+        raise ValueError(
+            f"{description!r} needs to be a positive number or free"
+        ) from error
+
+    if frames_per_second <= 0:
+        raise ValueError(f"{description!r} needs to be a positive number or free")
+
+    return Some(frames_per_second)
@@ -0,0 +1,296 @@
+"""
+Module: 01. Environment
+
+One scheduler for every sensor that's read periodically
+
+Rather than each driver sleeping in a loop of its own (drifting by however long
+each read takes, and waking the event loop at unrelated times), drivers hand their
+sensor reads to this. It keeps every sensor's next deadline in a heap and wakes up
+once for whichever is due first.
+
+Each sensor is read at a steady rate by the wall clock, which can be changed
+at any time (like reading a sensor faster while the room is occupied).
+A read that's still going when the next one is due makes that next one be skipped
+rather than piling up.
+
+How punctual and how fast each sensor is actually read is kept track of
+and logged every so often (and can be looked at any time with `report`).
+"""
+
+from asyncio import Event, Future, Task, TimerHandle, get_running_loop
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+from typing import Awaitable, Callable
+
+from option_and_result import NONE, Option, Some
+
+from microcontroller_application.log import get_logger
+from utils.smoothing import ExponentialMovingAverage
+
+LOGGER = get_logger(__name__)
+
+# How often every sensor's report is logged
+REPORT_LOG_PERIOD_SECONDS = 60
+
+# How much the newest interval between reads counts towards the actual rate
+INTERVAL_SMOOTHING_WEIGHT = 0.2
+
+
+@dataclass
+class SamplerReport:
+    "How a sensor's reads have been going"
+
+    name: str
+    requested_per_second: float
+    actual_per_second: float
+    samples: int
+    # Reads skipped because the one before was still going
+    overruns: int
+    # How late reads started compared to when they were due
+    mean_jitter_milliseconds: float
+    max_jitter_milliseconds: float
+
+
+class _Sampler:
+    def __init__(
+        self,
+        name: str,
+        period_seconds: float,
+        sample: Callable[[], Awaitable[None]],
+        finished: Future,
+        generation: int,
+    ):
+        self.name = name
+        self.period_seconds = period_seconds
+        self.sample = sample
+        # Settled when the sampler has to stop (with an exception if a read raised one)
+        self.finished = finished
+
+        # Replaced whenever the period changes, so older heap entries can be told apart
+        # (and unique across the scheduler, so neither can a sampler's that had its name)
+        self.generation = generation
+        self.running: Option[Task] = NONE()
+
+        self.samples = 0
+        self.overruns = 0
+        self.total_jitter_seconds = 0.0
+        self.max_jitter_seconds = 0.0
+        self.last_started: Option[float] = NONE()
+        self.interval = ExponentialMovingAverage(INTERVAL_SMOOTHING_WEIGHT)
+        self.average_interval: Option[float] = NONE()
+
+    def report(self) -> SamplerReport:
+        return SamplerReport(
+            name=self.name,
+            requested_per_second=1 / self.period_seconds,
+            actual_per_second=self.average_interval.map(
+                lambda interval: 1 / interval if interval > 0 else 0.0
+            ).unwrap_or(0.0),
+            samples=self.samples,
+            overruns=self.overruns,
+            mean_jitter_milliseconds=1000
+            * self.total_jitter_seconds
+            / max(self.samples, 1),
+            max_jitter_milliseconds=1000 * self.max_jitter_seconds,
+        )
+
+
+class SamplingScheduler:
+    "Reads every registered sensor at its own rate, from one heap of deadlines"
+
+    def __init__(self):
+        self._samplers: dict[str, _Sampler] = {}
+        # (deadline in the time.monotonic clock, tiebreaker, generation, name)
+        self._deadlines: list[tuple[float, int, int, str]] = []
+        self._tiebreakers = count()
+        self._generations = count()
+        # Replaced with a new event every time it's set
+        self._changed = Event()
+
+    async def sample_forever(
+        self,
+        name: str,
+        period_seconds: float,
+        sample: Callable[[], Awaitable[None]],
+    ):
+        """
+        Call `sample` every period until cancelled
+        (or raise whatever exception it raises)
+        """
+
+        if name in self._samplers:
+            raise ValueError(f"there's already a sensor named {name!r} being sampled")
+
+        sampler = _Sampler(
+            name,
+            period_seconds,
+            sample,
+            get_running_loop().create_future(),
+            next(self._generations),
+        )
+        self._samplers[name] = sampler
+        self._push(sampler, monotonic())
+
+        try:
+            await sampler.finished
+        finally:
+            del self._samplers[name]
+
+            if sampler.running.is_some():
+                sampler.running.unwrap().cancel()
+
+            self._notify()
+
+    def set_period(self, name: str, period_seconds: float):
+        "Change how often a sensor is read (starting from when it was last read)"
+
+        sampler = self._samplers[name]
+
+        if period_seconds == sampler.period_seconds:
+            return
+
+        LOGGER.debug(
+            "%s is read every %.3f seconds instead of every %.3f seconds now",
+            name,
+            period_seconds,
+            sampler.period_seconds,
+        )
+
+        sampler.period_seconds = period_seconds
+        sampler.generation = next(self._generations)
+
+        next_deadline = sampler.last_started.map(
+            lambda last_started: last_started + period_seconds
+        ).unwrap_or(monotonic())
+        self._push(sampler, next_deadline)
+
+    def report(self) -> list[SamplerReport]:
+        "How every sensor's reads have been going"
+
+        return [sampler.report() for sampler in self._samplers.values()]
+
+    async def run(self):
+        "Read sensors as they're due, forever"
+
+        reported_at = monotonic()
+
+        while True:
+            if monotonic() - reported_at >= REPORT_LOG_PERIOD_SECONDS:
+                reported_at = monotonic()
+                self._log_report()
+
+            sampler_option = self._next_due()
+
+            if sampler_option.is_none():
+                # Nothing's due yet, so wait until something is or something changes
+                await self._wait_for_change(self._seconds_until_next_deadline())
+                continue
+
+            sampler, deadline = sampler_option.unwrap()
+            now = monotonic()
+
+            if sampler.running.is_some() and not sampler.running.unwrap().done():
+                sampler.overruns += 1
+                LOGGER.debug(
+                    "%s is still being read, so this read is skipped", sampler.name
+                )
+            else:
+                self._start(sampler, deadline, now)
+
+            # Reads that are already late are given up on rather than rushed out
+            periods_late = int((now - deadline) // sampler.period_seconds)
+            self._push(sampler, deadline + (periods_late + 1) * sampler.period_seconds)
+
+    def _start(self, sampler: _Sampler, deadline: float, now: float):
+        jitter = now - deadline
+
+        sampler.samples += 1
+        sampler.total_jitter_seconds += jitter
+        sampler.max_jitter_seconds = max(sampler.max_jitter_seconds, jitter)
+
+        if sampler.last_started.is_some():
+            sampler.average_interval = Some(
+                sampler.interval.update(now - sampler.last_started.unwrap())
+            )
+
+        sampler.last_started = Some(now)
+
+        async def sample():
+            try:
+                await sampler.sample()
+            # Stop the driver that registered this, like if it had raised it itself
+            except Exception as error:  # pylint: disable=broad-except
+                if not sampler.finished.done():
+                    sampler.finished.set_exception(error)
+
+        sampler.running = Some(get_running_loop().create_task(sample()))
+
+    def _next_due(self) -> Option[tuple[_Sampler, float]]:
+        "Take the sampler whose deadline has passed, if any"
+
+        while self._deadlines:
+            deadline, _tiebreaker, generation, name = self._deadlines[0]
+
+            sampler = self._samplers.get(name)
+
+            # Left behind by a sampler that's gone or changed its period
+            if sampler is None or sampler.generation != generation:
+                heappop(self._deadlines)
+                continue
+
+            if deadline > monotonic():
+                return NONE()
+
+            heappop(self._deadlines)
+            return Some((sampler, deadline))
+
+        return NONE()
+
+    async def _wait_for_change(self, timeout_seconds: float | None):
+        # Not asyncio.wait_for, which can swallow a cancellation
+        # that arrives just as a change does (and then this would never stop)
+        changed = self._changed
+        timer: Option[TimerHandle] = NONE()
+
+        if timeout_seconds is not None:
+            timer = Some(get_running_loop().call_later(timeout_seconds, changed.set))
+
+        try:
+            await changed.wait()
+        finally:
+            if timer.is_some():
+                timer.unwrap().cancel()
+
+    def _seconds_until_next_deadline(self) -> float | None:
+        if not self._deadlines:
+            # Wait for a sampler to be added
+            return None
+
+        return max(self._deadlines[0][0] - monotonic(), 0)
+
+    def _push(self, sampler: _Sampler, deadline: float):
+        heappush(
+            self._deadlines,
+            (deadline, next(self._tiebreakers), sampler.generation, sampler.name),
+        )
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, Event()
+        changed.set()
+
+    def _log_report(self):
+        for report in self.report():
+            LOGGER.info(
+                "%s: read %.2f times a second (of %.2f requested), "
+                "%.1f ms late on average and %.1f ms at worst, "
+                "%d reads skipped because the one before was still going",
+                report.name,
+                report.actual_per_second,
+                report.requested_per_second,
+                report.mean_jitter_milliseconds,
+                report.max_jitter_milliseconds,
+                report.overruns,
+            )
@@ -6,63 +6,612 @@ Every frame, we can capture a frame to memory as a numpy array.
 This format is chosen because it's right for a neural network to work on,
 and it'll be easy for the aggregation module to convert it to a PIL Image
 when it's recording the feed.
+
+Capturing blocks for a good fraction of each frame, so it happens on a thread
+of its own rather than on the event loop. Frames are captured into a small pool
+of buffers that are allocated once and reused, and consumers are given
+reference-counted handles to them (that they have to release) instead of new arrays.
+
+Where frames come from (the PiCamera, a video, a folder of images, or a generator)
+is up to the frame sources this is given, one for each camera. Each camera captures
+on a thread of its own, into pools of its own, and only for whoever asked for its frames.
+Human detection looks at every camera, but only the main one's frames are recorded
+or streamed.
+
+Nothing is captured unless something needs frames: human detection,
+someone watching the live feed, or a recording. Each of those says how many
+frames per second it needs, and frames are captured at the fastest of those rates
+(up to the frame source's own rate), or not at all when nothing needs them.
+They're also captured at the resolution of the most detailed profile any of them needs,
+so human detection alone doesn't pay for frames as big as a recording's.
+
+In a quiet room, nearly every frame looks the same as the one before it.
+Each frame is compared against the last one that counted as a change,
+and if it's close enough it's marked as unchanged, so that consumers can
+reuse whatever they did for that earlier frame instead of doing it all again.
 """
 
-from asyncio import sleep
+from asyncio import gather, get_running_loop, run_coroutine_threadsafe, to_thread
+from dataclasses import dataclass, field
+from threading import Condition, Event
+from time import monotonic
+from typing import Callable
 
 import bounded_channel
+import cv2
 import numpy as np
+from option_and_result import NONE, Option, Some
 
 from microcontroller_application.interfaces.message_types import (
+    MAIN_CAMERA,
+    CameraConsumer,
+    CameraProfile,
+    FromCameraConsumerToEnvironment,
     FromEnvironmentToAggregation,
     FromEnvironmentToHumanDetectionCameraFrame,
 )
 from microcontroller_application.log import get_logger
-from utils.asynchronous import at_least_one
+from utils import watch
+from utils.asynchronous import at_least_one, in_dedicated_thread
+from utils.frames import Frame, FramePool
+from utils.pacing import FrameRateGovernor
+
+from ..frame_sources import FrameSource
 
 LOGGER = get_logger(__name__)
 
+# The width and height each profile captures at
+# (the PiCamera needs widths in multiples of 32 and heights in multiples of 16)
+PROFILE_RESOLUTIONS = {
+    # HOG finds people down to 64×128 pixels, so this is plenty for a room
+    CameraProfile.DETECTION: (512, 384),
+    CameraProfile.STREAMING: (768, 576),
+    # For recordings and for enrolling faces of trusted people
+    CameraProfile.HIGH_DETAIL: (1280, 960),
+}
+
+# Each channel holds the newest frame and each consumer holds onto one more
+# while working on it, then one more is needed for the frame being captured
+FRAME_POOL_CAPACITY = 8
+
+# How often the capture thread logs how much work unchanged frames saved
+STATISTICS_LOG_PERIOD_SECONDS = 60
+
+
+# How often the capture thread checks whether it's been told to stop while idle
+IDLE_POLL_SECONDS = 0.5
+
+
+@dataclass
+class CameraStatistics:
+    "How the camera's been capturing, for logging"
+
+    frames_captured: int = 0
+    frames_unchanged: int = 0
+    # How many times capturing resumed after idling,
+    # and how long it took from being needed again to the first frame
+    warm_ups: int = 0
+    last_warm_up_seconds: float = 0.0
+    longest_warm_up_seconds: float = 0.0
+    seconds_idle: float = 0.0
+    # How many times the profile changed,
+    # and how long it took from deciding to change to the first frame in the new one
+    profile_switches: int = 0
+    total_switch_seconds: float = 0.0
+    # Frames captured and time spent capturing them in each profile
+    frames_by_profile: dict[CameraProfile, int] = field(default_factory=dict)
+    capture_seconds_by_profile: dict[CameraProfile, float] = field(default_factory=dict)
+
+    def capture_milliseconds(self, profile: CameraProfile) -> float:
+        "The average time it took to capture a frame in the profile"
+
+        frames = self.frames_by_profile.get(profile, 0)
+
+        if frames == 0:
+            return 0.0
+
+        return 1000 * self.capture_seconds_by_profile[profile] / frames
+
+
+class CameraDemand:
+    """
+    How many frames per second each consumer needs right now
+
+    This is updated from the event loop and waited on by the capture thread.
+    """
+
+    def __init__(self):
+        self._frames_per_second: dict[CameraConsumer, float] = {}
+        self._profiles: dict[CameraConsumer, CameraProfile] = {}
+        self._condition = Condition()
+        # In the time.monotonic clock
+        self._needed_since = monotonic()
+
+    def update(
+        self,
+        consumer: CameraConsumer,
+        frames_per_second: float,
+        profile: CameraProfile,
+    ):
+        with self._condition:
+            was_idle = not self._frames_per_second
+
+            if frames_per_second > 0:
+                self._frames_per_second[consumer] = frames_per_second
+                self._profiles[consumer] = profile
+            else:
+                self._frames_per_second.pop(consumer, None)
+                self._profiles.pop(consumer, None)
+
+            if was_idle and self._frames_per_second:
+                self._needed_since = monotonic()
+
+            self._condition.notify_all()
+
+    def frames_per_second(self) -> float:
+        "The fastest rate any consumer needs (0 if none need frames at all)"
+
+        with self._condition:
+            return max(self._frames_per_second.values(), default=0.0)
+
+    def profile(self) -> Option[CameraProfile]:
+        "The most detailed profile any consumer needs (NONE if none need frames at all)"
+
+        with self._condition:
+            if not self._profiles:
+                return NONE()
+
+            return Some(max(self._profiles.values(), key=lambda profile: profile.value))
+
+    def wait_until_needed(self, stop: Event) -> Option[float]:
+        """
+        Block until some consumer needs frames, returning the time (in the time.monotonic clock)
+        since when they've been needed, or NONE if told to stop first
+        """
+
+        with self._condition:
+            while not stop.is_set():
+                if self._condition.wait_for(
+                    lambda: self._frames_per_second, IDLE_POLL_SECONDS
+                ):
+                    return Some(self._needed_since)
+
+        return NONE()
+
+
+class ChangeDetector:
+    """
+    Decides whether a frame looks different enough from the last changed frame
+    to count as a change itself
+
+    Both frames are shrunk to small grayscale thumbnails (each pixel of which is
+    the average of a block of the frame, which also averages away sensor noise)
+    and the change score is the fraction of blocks that got noticeably brighter or darker.
+
+    Comparing against the last changed frame rather than the previous frame means
+    a scene that changes slowly still counts as changed once it's changed enough.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: float,
+        thumbnail_size: tuple[int, int] = (80, 60),
+        block_difference: int = 10,
+    ):
+        if not 0 <= threshold <= 1:
+            raise ValueError(
+                f"the unchanged threshold needs to be from 0 to 1, not {threshold}"
+            )
+
+        # Frames with a change score below this are unchanged (so 0 turns this off)
+        self.threshold = threshold
+        self.thumbnail_size = thumbnail_size
+        # How many levels (out of 255) a block has to change by to count
+        self.block_difference = block_difference
+
+        self._reference: Option[tuple[int, np.ndarray]] = NONE()
+
+    def reset(self):
+        "Forget the last changed frame, so the next one counts as a change"
+
+        self._reference = NONE()
+
+    def check(self, frame: Frame):
+        "Score the frame and mark it as unchanged if it is"
+
+        thumbnail = cv2.cvtColor(
+            cv2.resize(frame.array, self.thumbnail_size, interpolation=cv2.INTER_AREA),
+            cv2.COLOR_RGB2GRAY,
+        )
+
+        if self._reference.is_none():
+            # There's nothing to compare against, so it's the first changed frame
+            frame.change_score = 1.0
+            self._reference = Some((frame.frame_id, thumbnail))
+            return
+
+        (reference_frame_id, reference_thumbnail) = self._reference.unwrap()
+
+        changed_blocks = np.count_nonzero(
+            cv2.absdiff(thumbnail, reference_thumbnail) > self.block_difference
+        )
+        change_score = changed_blocks / thumbnail.size
+
+        frame.change_score = change_score
+
+        if change_score < self.threshold:
+            frame.unchanged = True
+            frame.key_frame_id = reference_frame_id
+        else:
+            self._reference = Some((frame.frame_id, thumbnail))
+
 
 async def run(
     *,
-    to_human_detection: bounded_channel.Sender[
-        FromEnvironmentToHumanDetectionCameraFrame
-    ],
-    to_aggregation: bounded_channel.Sender[FromEnvironmentToAggregation],
-    use_randomized_data: bool,
+    to_human_detection: list[watch.Sender[FromEnvironmentToHumanDetectionCameraFrame]],
+    to_aggregation: watch.Sender[FromEnvironmentToAggregation],
+    from_camera_consumers: bounded_channel.Receiver[FromCameraConsumerToEnvironment],
+    frame_sources: list[FrameSource],
+    unchanged_threshold: float,
 ):
+    "Capture from each frame source (with the same index as its camera ID)"
+
     LOGGER.debug("startup")
 
-    if use_randomized_data:
-        LOGGER.warning("using randomized data")
-        LOGGER.error("this hasn't been programmed yet, so it doesn't do anything")
+    for (camera_id, frame_source) in enumerate(frame_sources):
+        LOGGER.info(
+            "capturing camera %d from a %s", camera_id, type(frame_source).__name__
+        )
+
+    demands = [CameraDemand() for _frame_source in frame_sources]
 
-    else:
-        from picamera import PiCamera
+    await gather(
+        receive_camera_demand(
+            from_camera_consumers=from_camera_consumers,
+            demands=demands,
+        ),
+        *(
+            capture_on_demand(
+                camera_id=camera_id,
+                to_human_detection=to_human_detection[camera_id],
+                to_aggregation=(
+                    Some(to_aggregation) if camera_id == MAIN_CAMERA else NONE()
+                ),
+                frame_source=frame_source,
+                unchanged_threshold=unchanged_threshold,
+                demand=demands[camera_id],
+            )
+            for (camera_id, frame_source) in enumerate(frame_sources)
+        ),
+    )
 
-        camera = PiCamera()
+    LOGGER.debug("shutdown")
 
-        width = 768
-        height = 576
 
-        camera.resolution = (width, height)
-        camera.framerate = 24
+async def receive_camera_demand(
+    *,
+    from_camera_consumers: bounded_channel.Receiver[FromCameraConsumerToEnvironment],
+    demands: list[CameraDemand],
+):
+    async for message in from_camera_consumers:
+        LOGGER.debug(
+            "%s needs %s frames per second in the %s profile from camera %d",
+            message.consumer.name,
+            message.frames_per_second,
+            message.profile.name,
+            message.camera_id,
+        )
 
-        while True:
-            frame = np.empty((height, width, 3), dtype=np.uint8)
-            camera.capture(frame, "rgb")
+        if not 0 <= message.camera_id < len(demands):
+            LOGGER.warning(
+                "%s asked for frames from camera %d, which doesn't exist",
+                message.consumer.name,
+                message.camera_id,
+            )
+            continue
 
-            LOGGER.info("captured camera frame")
+        demands[message.camera_id].update(
+            message.consumer, message.frames_per_second, message.profile
+        )
+
+
+async def capture_on_demand(
+    *,
+    camera_id: int,
+    to_human_detection: watch.Sender[FromEnvironmentToHumanDetectionCameraFrame],
+    to_aggregation: Option[watch.Sender[FromEnvironmentToAggregation]],
+    frame_source: FrameSource,
+    unchanged_threshold: float,
+    demand: CameraDemand,
+):
 
-            await at_least_one(
-                [
-                    to_human_detection.send(
-                        FromEnvironmentToHumanDetectionCameraFrame(frame=frame)
+    # Opening a camera or a video can take a moment
+    await to_thread(frame_source.open)
+
+    try:
+        loop = get_running_loop()
+
+        if frame_source.frames_per_second.is_some():
+
+            def distribute(frame: Frame):
+                distribute_frame(
+                    frame,
+                    to_human_detection=to_human_detection,
+                    to_aggregation=to_aggregation,
+                )
+
+            def publish(frame: Frame):
+                loop.call_soon_threadsafe(distribute, frame)
+
+        else:
+            LOGGER.info("free-running as fast as consumers accept frames")
+
+            def publish(frame: Frame):
+                # Block the capture thread until a consumer has received the frame
+                run_coroutine_threadsafe(
+                    deliver_frame(
+                        frame,
+                        to_human_detection=to_human_detection,
+                        to_aggregation=to_aggregation,
                     ),
-                    to_aggregation.send(FromEnvironmentToAggregation(frame=frame)),
-                ]
+                    loop,
+                ).result()
+
+        change_detector = ChangeDetector(threshold=unchanged_threshold)
+        statistics = CameraStatistics()
+
+        def capture(stop: Event):
+            capture_frames(
+                stop,
+                capture_into=frame_source.capture_into,
+                change_resolution=frame_source.change_resolution,
+                pool_capacity=FRAME_POOL_CAPACITY,
+                maximum_frames_per_second=frame_source.frames_per_second,
+                demand=demand,
+                change_detector=change_detector,
+                statistics=statistics,
+                publish=publish,
             )
 
-            await sleep(1 / 30)
+        await in_dedicated_thread(capture, name=f"camera {camera_id} capture")
 
-    LOGGER.debug("shutdown")
+    finally:
+        frame_source.close()
+
+
+def capture_frames(
+    stop: Event,
+    *,
+    capture_into: Callable[[Frame], bool],
+    change_resolution: Callable[[tuple[int, int]], None],
+    pool_capacity: int,
+    maximum_frames_per_second: Option[float],
+    demand: CameraDemand,
+    change_detector: ChangeDetector,
+    statistics: CameraStatistics,
+    publish: Callable[[Frame], None],
+):
+    """
+    Capture frames into the pool whenever they're in demand,
+    until told to stop or the source runs out
+    (this blocks, so it's run on its own thread)
+
+    Frames are paced to the fastest rate in demand (up to the maximum),
+    or not paced at all when there is no maximum (free-running).
+    Whenever the profile in demand changes, the source is switched to its resolution
+    and a new pool is made for it (the old one goes away once consumers release its frames).
+    """
+
+    statistics_logged_at = monotonic()
+
+    pool_option: Option[FramePool] = NONE()
+    current_profile: Option[CameraProfile] = NONE()
+    # Since when the profile has been changing, until its first frame is captured
+    switching_since: Option[float] = NONE()
+
+    governor_option: Option[FrameRateGovernor] = NONE()
+    # The rate the governor paces at
+    paced_frames_per_second = 0.0
+    # Since when frames have been needed, until the first one after idling is captured
+    warming_up_since: Option[float] = NONE()
+
+    while not stop.is_set():
+        if demand.frames_per_second() == 0:
+            LOGGER.info("idling because nothing needs camera frames")
+
+            idle_since = monotonic()
+            needed_since_option = demand.wait_until_needed(stop)
+            statistics.seconds_idle += monotonic() - idle_since
+
+            if needed_since_option.is_none():
+                break
+
+            warming_up_since = needed_since_option
+            # Pacing starts over from the first frame after idling
+            governor_option = NONE()
+            paced_frames_per_second = 0.0
+
+        # Nothing may need frames anymore, in which case the next loop around idles
+        profile_option = demand.profile()
+        if profile_option.is_none():
+            continue
+
+        profile = profile_option.unwrap()
+
+        if current_profile != profile_option:
+            LOGGER.info("switching to the %s profile", profile.name)
+
+            switching_since = Some(monotonic())
+
+            width, height = PROFILE_RESOLUTIONS[profile]
+            change_resolution((width, height))
+            pool_option = Some(
+                FramePool(shape=(height, width, 3), capacity=pool_capacity)
+            )
+
+            # Frames in different profiles can't stand in for each other
+            change_detector.reset()
+
+            current_profile = profile_option
+
+        pool = pool_option.unwrap()
+
+        if maximum_frames_per_second.is_some():
+            frames_per_second = min(
+                demand.frames_per_second(), maximum_frames_per_second.unwrap()
+            )
+
+            if frames_per_second > 0 and frames_per_second != paced_frames_per_second:
+                LOGGER.info("capturing %s frames per second", frames_per_second)
+
+                governor_option = Some(FrameRateGovernor(frames_per_second))
+                paced_frames_per_second = frames_per_second
+
+        if governor_option.is_some():
+            skipped = governor_option.unwrap().wait()
+            if skipped:
+                LOGGER.debug("fell behind by %d frames", skipped)
+
+        frame_option = pool.acquire(timeout=1.0)
+
+        if frame_option.is_none():
+            LOGGER.warning(
+                "all %d frame buffers are still held by consumers", pool.capacity
+            )
+            continue
+
+        frame = frame_option.unwrap()
+
+        capture_started = monotonic()
+
+        try:
+            captured = capture_into(frame)
+        except BaseException:
+            frame.release()
+            raise
+
+        capture_seconds = monotonic() - capture_started
+
+        if not captured:
+            frame.release()
+            LOGGER.info("the frame source ran out of frames")
+            break
+
+        change_detector.check(frame)
+
+        if warming_up_since.is_some():
+            warm_up_seconds = monotonic() - warming_up_since.take().unwrap()
+
+            statistics.warm_ups += 1
+            statistics.last_warm_up_seconds = warm_up_seconds
+            statistics.longest_warm_up_seconds = max(
+                statistics.longest_warm_up_seconds, warm_up_seconds
+            )
+
+            LOGGER.info(
+                "the first frame after idling took %.3f seconds to capture",
+                warm_up_seconds,
+            )
+
+        if switching_since.is_some():
+            switch_seconds = monotonic() - switching_since.take().unwrap()
+
+            statistics.profile_switches += 1
+            statistics.total_switch_seconds += switch_seconds
+
+            LOGGER.info(
+                "switching to the %s profile took %.3f seconds",
+                profile.name,
+                switch_seconds,
+            )
+
+        statistics.frames_by_profile[profile] = (
+            statistics.frames_by_profile.get(profile, 0) + 1
+        )
+        statistics.capture_seconds_by_profile[profile] = (
+            statistics.capture_seconds_by_profile.get(profile, 0.0) + capture_seconds
+        )
+
+        statistics.frames_captured += 1
+        if frame.unchanged:
+            statistics.frames_unchanged += 1
+
+        LOGGER.debug(
+            "captured camera frame %d (change score %.4f)",
+            frame.frame_id,
+            frame.change_score,
+        )
+
+        # Ownership of the capture thread's reference is passed along here
+        publish(frame)
+
+        if monotonic() - statistics_logged_at >= STATISTICS_LOG_PERIOD_SECONDS:
+            statistics_logged_at = monotonic()
+
+            LOGGER.info(
+                "%d of %d frames captured so far were unchanged, "
+                "and the camera idled for %.0f seconds "
+                "(warming back up %d times, taking up to %.3f seconds)",
+                statistics.frames_unchanged,
+                statistics.frames_captured,
+                statistics.seconds_idle,
+                statistics.warm_ups,
+                statistics.longest_warm_up_seconds,
+            )
+
+            LOGGER.info(
+                "switched profiles %d times (taking %.3f seconds on average), "
+                "and captured frames in %s",
+                statistics.profile_switches,
+                statistics.total_switch_seconds / max(statistics.profile_switches, 1),
+                ", ".join(
+                    f"{each.name} in {statistics.capture_milliseconds(each):.1f} ms"
+                    for each in statistics.frames_by_profile
+                ),
+            )
+
+
+def distribute_frame(
+    frame: Frame,
+    *,
+    to_human_detection: watch.Sender[FromEnvironmentToHumanDetectionCameraFrame],
+    to_aggregation: Option[watch.Sender[FromEnvironmentToAggregation]],
+):
+    """
+    Make the frame the newest one for every consumer
+
+    Whichever frame it replaces is released, so a consumer that's behind
+    skips straight to this one rather than working through stale ones.
+    """
+
+    with frame:
+        to_human_detection.send(
+            FromEnvironmentToHumanDetectionCameraFrame(frame=frame.retain())
+        )
+
+        if to_aggregation.is_some():
+            to_aggregation.unwrap().send(
+                FromEnvironmentToAggregation(frame=frame.retain())
+            )
+
+
+async def deliver_frame(
+    frame: Frame,
+    *,
+    to_human_detection: watch.Sender[FromEnvironmentToHumanDetectionCameraFrame],
+    to_aggregation: Option[watch.Sender[FromEnvironmentToAggregation]],
+):
+    "Distribute the frame and then wait until at least one consumer has received it"
+
+    distribute_frame(
+        frame,
+        to_human_detection=to_human_detection,
+        to_aggregation=to_aggregation,
+    )
+
+    received = [to_human_detection.wait_until_received()]
+    if to_aggregation.is_some():
+        received.append(to_aggregation.unwrap().wait_until_received())
+
+    await at_least_one(received)
@@ -2,46 +2,113 @@
 Module: 01. Environment
 Component: 04. Light sensor driver
 
-This gets the ambient light intensity (in lux) every second or so.
+This gets the ambient light intensity (in lux) every second or so
+(whenever the sampling scheduler says it's time to).
+
+Reading the sensor is an I2C transaction that blocks for as long as
+the sensor's integration time (up to 600 ms), so it happens on a thread of its own
+and is given up on if it takes too long.
+Readings are smoothed before being passed along to the control module,
+first by a rolling median (which ignores momentary spikes like a camera flash)
+and then by an exponential moving average (which evens out the noise).
+
+Every reading passed along makes the control module recompute the brightness,
+the duty cycle, and the power, and write to the dimmer, so a reading is only
+passed along if it's changed noticeably from the last one that was
+(or if it's been a while since then, so the control module knows the sensor's alive).
 """
 
-from asyncio import sleep
+import asyncio
+from asyncio import wait_for, wrap_future
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from time import monotonic
 
 import bounded_channel
 import numpy as np
+from option_and_result import NONE, Option, Some
 
-from microcontroller_application.interfaces.message_types import \
-    FromEnvironmentToControl
+from microcontroller_application.interfaces.message_types import (
+    FromEnvironmentToControl,
+)
 from microcontroller_application.log import get_logger
+from utils.smoothing import Deadband, ExponentialMovingAverage, RollingMedian
+
+from ..fake_hardware import FakeTSL2591
+from ..sampling_scheduler import SamplingScheduler
 
 LOGGER = get_logger(__name__)
 
+# The same as the INTEGRATIONTIME_...MS constants in the adafruit_tsl2591 library
+INTEGRATION_TIMES = {
+    100: 0x00,
+    200: 0x01,
+    300: 0x02,
+    400: 0x03,
+    500: 0x04,
+    600: 0x05,
+}
+
+SAMPLING_PERIOD_SECONDS = 1.0
+
+MEDIAN_WINDOW = 5
+
+# How much the newest (median) reading counts towards the smoothed one
+SMOOTHING_WEIGHT = 0.3
+
+# A reading is passed along anyway if none have been for this long
+HEARTBEAT_SECONDS = 30
+
+# Readings closer than this to the last one passed along aren't passed along,
+# no matter how small the relative deadband is
+ABSOLUTE_DEADBAND_LUMENS = 1.0
+
+# How often the statistics are logged
+STATISTICS_LOG_PERIOD_SECONDS = 60
+
+# This is just an approximation
+LUX_TO_LUMENS_CONVERSION_FACTOR = 800 / 170
+
+
+@dataclass
+class LightSensorStatistics:
+    "How reading the light sensor's been going, for logging"
+
+    reads: int = 0
+    successful_reads: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    # Of the successful reads
+    total_read_seconds: float = 0.0
+    longest_read_seconds: float = 0.0
+    # Readings passed along to the control module,
+    # and readings that weren't (each of which saved it from recomputing everything)
+    passed_along: int = 0
+    recomputations_avoided: int = 0
+
+    def average_read_milliseconds(self) -> float:
+        "The average time a successful read took"
+
+        if self.successful_reads == 0:
+            return 0.0
+
+        return 1000 * self.total_read_seconds / self.successful_reads
+
 
 async def run(
     *,
     to_control: bounded_channel.Sender[FromEnvironmentToControl],
+    scheduler: SamplingScheduler,
+    integration_milliseconds: int,
+    relative_deadband: float,
     use_randomized_data: bool,
 ):
     LOGGER.debug("startup")
-    
-    # This is just an approximation
-    lux_to_lumens_conversion_factor = (800 / 170)
 
     if use_randomized_data:
         LOGGER.warning("using randomized data")
 
-        while True:
-            lux = 2 ** (np.random.normal(10, 2))
-
-            LOGGER.info("(RANDOM) lux: %f", lux)
-
-            as_lumens = lux *lux_to_lumens_conversion_factor
-
-            await to_control.send(
-                FromEnvironmentToControl(ambient_brightness=as_lumens)
-            )
-
-            await sleep(1)
+        light_sensor = FakeTSL2591(lambda: 2 ** (np.random.normal(10, 2)))
 
     else:
         import adafruit_tsl2591
@@ -52,17 +119,128 @@ async def run(
 
         light_sensor = adafruit_tsl2591.TSL2591(i2c)
 
-        while True:
-            lux = light_sensor.lux
+    light_sensor.integration_time = INTEGRATION_TIMES[integration_milliseconds]
+
+    await sample_light_sensor(
+        light_sensor,
+        to_control=to_control,
+        scheduler=scheduler,
+        period_seconds=SAMPLING_PERIOD_SECONDS,
+        # The sensor takes up to twice its integration time to give a reading
+        read_timeout_seconds=2 * integration_milliseconds / 1000 + 0.25,
+        deadband=Deadband(
+            relative_tolerance=relative_deadband,
+            absolute_tolerance=ABSOLUTE_DEADBAND_LUMENS,
+            heartbeat_seconds=HEARTBEAT_SECONDS,
+        ),
+        statistics=LightSensorStatistics(),
+    )
 
-            LOGGER.info("lux: %f", lux)
+    LOGGER.debug("shutdown")
 
-            as_lumens = lux * lux_to_lumens_conversion_factor
 
-            await to_control.send(
-                FromEnvironmentToControl(ambient_brightness=as_lumens)
+async def sample_light_sensor(
+    light_sensor,
+    *,
+    to_control: bounded_channel.Sender[FromEnvironmentToControl],
+    scheduler: SamplingScheduler,
+    period_seconds: float,
+    read_timeout_seconds: float,
+    deadband: Deadband,
+    statistics: LightSensorStatistics,
+):
+    "Read the sensor every period, passing along smoothed readings that changed"
+
+    median = RollingMedian(MEDIAN_WINDOW)
+    average = ExponentialMovingAverage(SMOOTHING_WEIGHT)
+
+    def read_lux() -> float:
+        return light_sensor.lux
+
+    # Only ever one read at a time, since they're all on the same I2C bus
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="light sensor")
+
+    # A read that timed out can still be stuck on the thread
+    stuck_read: Option[Future] = NONE()
+
+    statistics_logged_at = monotonic()
+
+    async def sample():
+        nonlocal stuck_read, statistics_logged_at
+
+        if stuck_read.is_some() and not stuck_read.unwrap().done():
+            LOGGER.warning("skipping a read because the last one is still stuck")
+            return
+
+        stuck_read = NONE()
+
+        statistics.reads += 1
+        read_started = monotonic()
+
+        read = executor.submit(read_lux)
+
+        try:
+            lux = await wait_for(wrap_future(read), read_timeout_seconds)
+        except asyncio.TimeoutError:
+            statistics.timeouts += 1
+            stuck_read = Some(read)
+
+            LOGGER.warning(
+                "reading the light sensor took over %.2f seconds",
+                read_timeout_seconds,
+            )
+        # Whatever the driver raises (like the sensor saturating in very bright light),
+        # the next reading may work, so it's counted and logged rather than fatal
+        except Exception as error:  # pylint: disable=broad-except
+            statistics.failures += 1
+
+            LOGGER.warning("reading the light sensor failed: %s", error)
+        else:
+            read_seconds = monotonic() - read_started
+
+            statistics.successful_reads += 1
+            statistics.total_read_seconds += read_seconds
+            statistics.longest_read_seconds = max(
+                statistics.longest_read_seconds, read_seconds
             )
 
-            await sleep(1)
+            smoothed_lux = average.update(median.update(lux))
 
-    LOGGER.debug("shutdown")
+            LOGGER.debug("lux: %f (smoothed to %f)", lux, smoothed_lux)
+
+            as_lumens = smoothed_lux * LUX_TO_LUMENS_CONVERSION_FACTOR
+
+            if deadband.should_pass_along(as_lumens):
+                statistics.passed_along += 1
+
+                await to_control.send(
+                    FromEnvironmentToControl(ambient_brightness=as_lumens)
+                )
+            else:
+                statistics.recomputations_avoided += 1
+
+        if monotonic() - statistics_logged_at >= STATISTICS_LOG_PERIOD_SECONDS:
+            statistics_logged_at = monotonic()
+
+            LOGGER.info(
+                "%d light sensor reads so far, %d failed and %d timed out "
+                "(taking %.1f ms on average and up to %.1f ms)",
+                statistics.reads,
+                statistics.failures,
+                statistics.timeouts,
+                statistics.average_read_milliseconds(),
+                1000 * statistics.longest_read_seconds,
+            )
+
+            LOGGER.info(
+                "%d light readings were passed along to the control module "
+                "and %d weren't (avoiding that many recomputations)",
+                statistics.passed_along,
+                statistics.recomputations_avoided,
+            )
+
+    try:
+        await scheduler.sample_forever("light sensor", period_seconds, sample)
+    finally:
+        # Don't wait for a stuck read to finish
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -2,27 +2,57 @@
 Module: 01. Environment
 Component: 06. Motion sensor driver
 
-This polls the motion sensor every tenth of a second or so
-and passes that information along to the human detection module
+This passes the state of the motion sensor along to the human detection module
 whenever it (the state of motion) changes.
+
+By default, the GPIO library calls back (on a thread of its own) as soon as the pin
+changes, which is bridged into the event loop, so motion is passed along right away.
+The sensor's output can bounce between states for a moment when it changes,
+so after passing along a change, any more changes are ignored for a short while
+(and then the pin is read again in case it settled in the other state).
+
+It can also poll the pin every so often instead (whenever the sampling scheduler
+says it's time to), which is slower to notice motion.
+While the room is occupied, the pin is polled more often,
+so people moving around (or leaving) are noticed sooner.
 """
 
-from asyncio import sleep
+from asyncio import Queue, QueueEmpty, gather, get_running_loop, sleep
+from time import monotonic
+from typing import Callable
 
 import bounded_channel
 from option_and_result import NONE, Option, Some
+from store import Readable, get
 
 from microcontroller_application.interfaces.message_types import (
     FromEnvironmentToHumanDetectionMotion,
 )
 from microcontroller_application.log import get_logger
+from utils.stores import values
+
+from ..sampling_scheduler import SamplingScheduler
 
 LOGGER = get_logger(__name__)
 
+MOTION_PIN = 25
+
+POLLING_PERIOD_SECONDS = 0.3
+
+POLLING_PERIOD_WHILE_OCCUPIED_SECONDS = 0.1
+
+# What the motion sensor is called by the sampling scheduler
+SAMPLER_NAME = "motion sensor"
+
+DEBOUNCE_SECONDS = 0.05
+
 
 async def run(
     *,
     to_human_detection: bounded_channel.Sender[FromEnvironmentToHumanDetectionMotion],
+    scheduler: SamplingScheduler,
+    occupied_store: Readable[bool],
+    edge_triggered: bool,
     use_randomized_data: bool,
 ):
     LOGGER.debug("startup")
@@ -32,46 +62,180 @@ async def run(
 
         LOGGER.warning("using randomized data")
 
-        last_motion_detected = NONE()
-
-        while True:
+        def read_motion() -> bool:
             motion_detected = bool(getrandbits(1))
 
-            LOGGER.info("(RANDOM) motion_detected: %s", motion_detected)
-
-            some_motion_detected = Some(motion_detected)
+            LOGGER.debug("(RANDOM) motion_detected: %s", motion_detected)
 
-            if motion_detected != last_motion_detected:
-                message = FromEnvironmentToHumanDetectionMotion(
-                    new_state=motion_detected
-                )
-                await to_human_detection.send(message)
+            return motion_detected
 
-            last_motion_detected = some_motion_detected
-            await sleep(0.3)
+        await poll_motion(
+            read_motion,
+            to_human_detection=to_human_detection,
+            scheduler=scheduler,
+            occupied_store=occupied_store,
+        )
 
     else:
         import RPi.GPIO as GPIO
 
-        motion_pin = 25
-        GPIO.setup(motion_pin, GPIO.IN)
+        if edge_triggered:
+            await watch_motion_sensor_edges(
+                GPIO,
+                to_human_detection=to_human_detection,
+                pin=MOTION_PIN,
+                debounce_seconds=DEBOUNCE_SECONDS,
+            )
+        else:
+            await poll_motion_sensor(
+                GPIO,
+                to_human_detection=to_human_detection,
+                scheduler=scheduler,
+                occupied_store=occupied_store,
+                pin=MOTION_PIN,
+            )
+
+    LOGGER.debug("shutdown")
+
+
+async def poll_motion_sensor(
+    gpio,
+    *,
+    to_human_detection: bounded_channel.Sender[FromEnvironmentToHumanDetectionMotion],
+    scheduler: SamplingScheduler,
+    occupied_store: Readable[bool],
+    pin: int,
+):
+    "Read the pin every so often, passing along changes"
+
+    gpio.setup(pin, gpio.IN)
+
+    def read_motion() -> bool:
+        motion_detected = gpio.input(pin) == 1
+
+        LOGGER.debug("motion_detected: %s", motion_detected)
+
+        return motion_detected
+
+    await poll_motion(
+        read_motion,
+        to_human_detection=to_human_detection,
+        scheduler=scheduler,
+        occupied_store=occupied_store,
+    )
+
+
+async def poll_motion(
+    read_motion: Callable[[], bool],
+    *,
+    to_human_detection: bounded_channel.Sender[FromEnvironmentToHumanDetectionMotion],
+    scheduler: SamplingScheduler,
+    occupied_store: Readable[bool],
+):
+    "Have the scheduler read motion (more often while occupied), passing along changes"
+
+    last_motion_detected: Option[bool] = NONE()
+
+    async def sample():
+        nonlocal last_motion_detected
+
+        motion_detected = read_motion()
+        some_motion_detected = Some(motion_detected)
+
+        if some_motion_detected != last_motion_detected:
+            message = FromEnvironmentToHumanDetectionMotion(new_state=motion_detected)
+            await to_human_detection.send(message)
+
+        last_motion_detected = some_motion_detected
+
+    def period_seconds(occupied: bool) -> float:
+        if occupied:
+            return POLLING_PERIOD_WHILE_OCCUPIED_SECONDS
+
+        return POLLING_PERIOD_SECONDS
+
+    async def follow_occupancy():
+        async for occupied in values(occupied_store):
+            scheduler.set_period(SAMPLER_NAME, period_seconds(occupied))
+
+    # The sampler is added before the period is first followed
+    await gather(
+        scheduler.sample_forever(
+            SAMPLER_NAME, period_seconds(get(occupied_store)), sample
+        ),
+        follow_occupancy(),
+    )
+
+
+async def watch_motion_sensor_edges(
+    gpio,
+    *,
+    to_human_detection: bounded_channel.Sender[FromEnvironmentToHumanDetectionMotion],
+    pin: int,
+    debounce_seconds: float,
+):
+    "Wait for the pin to change, passing along changes as soon as they happen"
+
+    loop = get_running_loop()
+
+    # When each edge happened (in the time.monotonic clock)
+    edges: Queue[float] = Queue()
+
+    def on_edge(_pin: int):
+        # This is called on the GPIO library's thread
+        loop.call_soon_threadsafe(edges.put_nowait, monotonic())
+
+    gpio.setup(pin, gpio.IN)
+    gpio.add_event_detect(pin, gpio.BOTH, callback=on_edge)
+
+    last_motion_detected: Option[bool] = NONE()
+
+    async def pass_along_current_state(edge_at: Option[float]):
+        nonlocal last_motion_detected
+
+        motion_detected = gpio.input(pin) == 1
+        some_motion_detected = Some(motion_detected)
 
-        last_motion_detected: Option[bool] = NONE()
+        if some_motion_detected == last_motion_detected:
+            return
+
+        last_motion_detected = some_motion_detected
+
+        if edge_at.is_some():
+            LOGGER.debug(
+                "motion_detected: %s (%.1f ms after the edge)",
+                motion_detected,
+                1000 * (monotonic() - edge_at.unwrap()),
+            )
+
+        message = FromEnvironmentToHumanDetectionMotion(new_state=motion_detected)
+        await to_human_detection.send(message)
+
+    try:
+        # The sensor may already be sensing motion before any edge
+        await pass_along_current_state(NONE())
 
         while True:
-            motion_detected = GPIO.input(motion_pin) == 1
+            edge_at = await edges.get()
 
-            LOGGER.info("motion_detected: %s", motion_detected)
+            await pass_along_current_state(Some(edge_at))
 
-            some_motion_detected = Some(motion_detected)
+            # Ignore bouncing, then check what it settled on
+            await sleep(debounce_seconds)
 
-            if motion_detected != last_motion_detected:
-                message = FromEnvironmentToHumanDetectionMotion(
-                    new_state=motion_detected
-                )
-                await to_human_detection.send(message)
+            bounces = 0
+            while True:
+                try:
+                    edges.get_nowait()
+                except QueueEmpty:
+                    break
 
-            last_motion_detected = some_motion_detected
-            await sleep(0.3)
+                bounces += 1
 
-    LOGGER.debug("shutdown")
+            if bounces:
+                LOGGER.debug("ignored %d edges from bouncing", bounces)
+
+            await pass_along_current_state(NONE())
+
+    finally:
+        gpio.remove_event_detect(pin)
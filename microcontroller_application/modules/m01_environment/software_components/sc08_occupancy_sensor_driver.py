@@ -2,29 +2,54 @@
 Module: 01. Environment
 Component: 08. Occupancy sensor driver
 
-This polls the occupancy sensor every 5 seconds
-and passes that information along to the human detection module
-whenever it (the state of occupancy) changes.
+The occupancy sensor sends a line over UART every so often saying whether
+the room is occupied, and this passes that information along to
+the human detection module whenever it (the state of occupancy) changes.
+
+The serial port is read without blocking: the event loop watches its file descriptor
+and reads whatever bytes have arrived whenever there are some,
+so nothing else waits on the sensor.
+Lines are split out of those bytes as they arrive (which may be a partial line
+or several lines at once), and every change is passed along as soon as its line ends.
+Since the sensor decides when to send, this isn't driven by the sampling scheduler
+(except for randomized data), but it does keep the occupancy store up to date
+so other drivers can sample at different rates while the room is occupied.
 """
 
-from asyncio import sleep
+from asyncio import Queue, get_running_loop
+from os import read, set_blocking
 
 import bounded_channel
-from option_and_result import NONE, Some
+from option_and_result import NONE, Option, Some
+from store import Writable
 
 from microcontroller_application.interfaces.message_types import (
     FromEnvironmentToHumanDetectionOccupancy,
 )
 from microcontroller_application.log import get_logger
 
+from ..sampling_scheduler import SamplingScheduler
+
 LOGGER = get_logger(__name__)
 
+SERIAL_PORT = "/dev/ttyS0"
+
+BAUD_RATE = 115200
+
+# Lines from the sensor are much shorter than this,
+# so anything longer is noise (like from connecting at the wrong baud rate)
+MAXIMUM_LINE_LENGTH = 256
+
+RANDOMIZED_DATA_PERIOD_SECONDS = 5
+
 
 async def run(
     *,
     to_human_detection: bounded_channel.Sender[
         FromEnvironmentToHumanDetectionOccupancy
     ],
+    scheduler: SamplingScheduler,
+    occupied_store: Writable[bool, None],
     use_randomized_data: bool,
 ):
     LOGGER.debug("startup")
@@ -34,8 +59,11 @@ async def run(
 
         LOGGER.warning("using randomized data")
 
-        last_occupancy_detected = NONE()
-        while True:
+        last_occupancy_detected: Option[bool] = NONE()
+
+        async def sample():
+            nonlocal last_occupancy_detected
+
             occupancy_detected = bool(getrandbits(1))
 
             LOGGER.info("(RANDOM) occupancy_detected: %s", occupancy_detected)
@@ -43,6 +71,8 @@ async def run(
             some_occupancy_detected = Some(occupancy_detected)
 
             if some_occupancy_detected != last_occupancy_detected:
+                occupied_store.set(occupancy_detected)
+
                 message = FromEnvironmentToHumanDetectionOccupancy(
                     new_state=occupancy_detected
                 )
@@ -50,27 +80,143 @@ async def run(
 
             last_occupancy_detected = some_occupancy_detected
 
-            await sleep(5)
+        await scheduler.sample_forever(
+            "occupancy sensor", RANDOMIZED_DATA_PERIOD_SECONDS, sample
+        )
 
     else:
         import serial
 
-        # Initialize UART
-        ser = serial.Serial("/dev/ttyS0", baudrate=115200)
-        ser.flushInput()  # Clear UART Input buffer
-        ser.flushOutput()  # Clear UART Output buffer
+        # Initialize UART (with reads that never block)
+        ser = serial.Serial(SERIAL_PORT, baudrate=BAUD_RATE, timeout=0)
+        ser.reset_input_buffer()  # Clear UART Input buffer
+        ser.reset_output_buffer()  # Clear UART Output buffer
+
+        try:
+            await read_occupancy_sensor(
+                ser.fileno(),
+                to_human_detection=to_human_detection,
+                occupied_store=occupied_store,
+            )
+        finally:
+            ser.close()
+
+    LOGGER.debug("shutdown")
+
+
+class LineParser:
+    "Splits complete lines out of bytes as they arrive"
+
+    def __init__(self, *, maximum_line_length: int = MAXIMUM_LINE_LENGTH):
+        self.maximum_line_length = maximum_line_length
+
+        self._buffer = bytearray()
+        # Everything before this in the buffer is already known to not have a newline
+        self._scanned = 0
+
+    def feed(self, data: bytes) -> list[bytes]:
+        "Add some bytes, returning the lines they completed (without line endings)"
+
+        self._buffer += data
+
+        lines = []
+        start = 0
 
-        last_occupancy_detected = NONE()
         while True:
-            raw_response = ser.readline()
-            response = raw_response.strip()
-            occupancy_detected = response.find(b"1") != -1
+            end = self._buffer.find(b"\n", max(start, self._scanned))
+
+            if end == -1:
+                break
+
+            lines.append(bytes(self._buffer[start:end]).strip())
+            start = end + 1
+
+        # Only the start of the buffer is ever removed, and only once per feed
+        del self._buffer[:start]
+        self._scanned = len(self._buffer)
+
+        if len(self._buffer) > self.maximum_line_length:
+            LOGGER.warning(
+                "discarding %d bytes from the occupancy sensor without a line ending",
+                len(self._buffer),
+            )
+
+            self._buffer.clear()
+            self._scanned = 0
+
+        return lines
+
+
+def parse_occupancy(line: bytes) -> bool:
+    "Whether a line from the sensor says the room is occupied"
 
-            LOGGER.info("occupancy_detected: %s", occupancy_detected)
+    return line.find(b"1") != -1
+
+
+async def read_occupancy_sensor(
+    file_descriptor: int,
+    *,
+    to_human_detection: bounded_channel.Sender[
+        FromEnvironmentToHumanDetectionOccupancy
+    ],
+    occupied_store: Writable[bool, None],
+):
+    "Read lines from the sensor as they arrive, until the port is closed"
+
+    loop = get_running_loop()
+
+    parser = LineParser()
+    # Each line as it ends, then NONE once the port closes
+    lines: Queue[Option[bytes]] = Queue()
+
+    set_blocking(file_descriptor, False)
+
+    def on_readable():
+        # This is called on the event loop whenever there are bytes to read
+        try:
+            data = read(file_descriptor, 4096)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            # Like EIO when the other end of a pseudoterminal closes
+            LOGGER.warning("the occupancy sensor's port closed: %s", error)
+            data = b""
+
+        if not data:
+            loop.remove_reader(file_descriptor)
+            lines.put_nowait(NONE())
+            return
+
+        for line in parser.feed(data):
+            lines.put_nowait(Some(line))
+
+    loop.add_reader(file_descriptor, on_readable)
+
+    last_occupancy_detected: Option[bool] = NONE()
+
+    try:
+        while True:
+            line_option = await lines.get()
+
+            if line_option.is_none():
+                break
+
+            line = line_option.unwrap()
+
+            if not line:
+                continue
+
+            occupancy_detected = parse_occupancy(line)
+
+            LOGGER.debug("occupancy_detected: %s (from %r)", occupancy_detected, line)
 
             some_occupancy_detected = Some(occupancy_detected)
 
             if some_occupancy_detected != last_occupancy_detected:
+                LOGGER.info("occupancy_detected changed to %s", occupancy_detected)
+
+                occupied_store.set(occupancy_detected)
+
                 message = FromEnvironmentToHumanDetectionOccupancy(
                     new_state=occupancy_detected
                 )
@@ -78,6 +224,5 @@ async def run(
 
             last_occupancy_detected = some_occupancy_detected
 
-            await sleep(5)
-
-    LOGGER.debug("shutdown")
+    finally:
+        loop.remove_reader(file_descriptor)
@@ -6,10 +6,12 @@ are present in the room and where they are.
 """
 
 from asyncio import gather
+from pathlib import Path
 
 from bounded_channel import Receiver, Sender
 
 from microcontroller_application.interfaces.message_types import (
+    FromCameraConsumerToEnvironment,
     FromEnvironmentToHumanDetectionCameraFrame,
     FromEnvironmentToHumanDetectionMotion,
     FromEnvironmentToHumanDetectionOccupancy,
@@ -17,7 +19,9 @@ from microcontroller_application.interfaces.message_types import (
     FromHumanDetectionToPersonIdentification,
 )
 from microcontroller_application.log import get_logger
+from utils import watch
 
+from .person_detectors import PersonDetector
 from .software_components import sc02_ai_human_detection
 
 LOGGER = get_logger(__name__)
@@ -27,9 +31,21 @@ async def run(
     *,
     from_environment_motion: Receiver[FromEnvironmentToHumanDetectionMotion],
     from_environment_occupancy: Receiver[FromEnvironmentToHumanDetectionOccupancy],
-    from_environment_camera_frame: Receiver[FromEnvironmentToHumanDetectionCameraFrame],
+    from_environment_camera_frames: list[
+        watch.Receiver[FromEnvironmentToHumanDetectionCameraFrame]
+    ],
     to_activity_recognition: Sender[FromHumanDetectionToActivityRecognition],
     to_person_identification: Sender[FromHumanDetectionToPersonIdentification],
+    to_environment_camera_demand: Sender[FromCameraConsumerToEnvironment],
+    person_detector: PersonDetector,
+    detection_processes: int,
+    detection_maximum_in_flight: int,
+    foreground_gating: bool,
+    person_tracking: bool,
+    detection_cpu_budget: float,
+    detection_cache_size: int,
+    detection_cache_tolerance: int,
+    detection_mask_path: Path,
 ):
     "Run the human detection module"
 
@@ -38,9 +54,19 @@ async def run(
     sc02_ai_human_detection_task = sc02_ai_human_detection.run(
         from_environment_motion=from_environment_motion,
         from_environment_occupancy=from_environment_occupancy,
-        from_environment_camera_frame=from_environment_camera_frame,
+        from_environment_camera_frames=from_environment_camera_frames,
         to_activity_recognition=to_activity_recognition,
         to_person_identification=to_person_identification,
+        to_environment_camera_demand=to_environment_camera_demand,
+        person_detector=person_detector,
+        detection_processes=detection_processes,
+        detection_maximum_in_flight=detection_maximum_in_flight,
+        foreground_gating=foreground_gating,
+        person_tracking=person_tracking,
+        detection_cpu_budget=detection_cpu_budget,
+        detection_cache_size=detection_cache_size,
+        detection_cache_tolerance=detection_cache_tolerance,
+        detection_mask_path=detection_mask_path,
     )
 
     await gather(sc02_ai_human_detection_task)
@@ -0,0 +1,90 @@
+"""
+Module: 02. Human detection
+
+Which camera to look for people in next, when there's more than one
+
+Every camera shares the same worker processes (and the same CPU budget, see the
+detection scheduler), so each scan is of one camera, chosen by weighted fair queuing:
+each camera's share of the scanning time is its weight, which is
+how much it's been seeing change lately (plus a little, so quiet cameras still
+get looked at). Each camera has a virtual time that goes up by how long its scans
+take divided by its weight, and the camera furthest behind is scanned next.
+
+How much a camera's seeing change is only known when it's scanned, and one
+that was quiet for a long time would be so far ahead that it'd be ages before
+anyone noticed something happening in view of it. So none can get more than
+one scan (at its current weight) ahead of the one furthest behind. Then however long
+a camera's been quiet, it's looked at again as soon as its next turn would've come.
+"""
+
+from dataclasses import dataclass
+
+# Every camera's weight is at least this, even when nothing in view has changed
+MINIMUM_WEIGHT = 0.05
+
+# How much each scan's change counts towards how much a camera's seeing change,
+# with the rest from the scans before (an exponentially weighted moving average)
+CHANGE_SMOOTHING = 0.5
+
+
+@dataclass
+class CameraShare:
+    "How much one camera is being scanned"
+
+    # How much it's been seeing change lately (from 0 to 1)
+    change: float = 0.0
+    # The scanning time it's had, divided by its weight (so in virtual seconds)
+    virtual_seconds: float = 0.0
+    # How long its last scan took
+    last_seconds: float = 0.0
+    scans: int = 0
+    seconds: float = 0.0
+
+    def weight(self) -> float:
+        return MINIMUM_WEIGHT + self.change
+
+
+class CameraScheduler:
+    "Shares scanning fairly between cameras, weighted by how much each sees changing"
+
+    def __init__(self, camera_count: int, *, smoothing: float = CHANGE_SMOOTHING):
+        if camera_count < 1:
+            raise ValueError(f"there needs to be at least 1 camera, not {camera_count}")
+
+        self.smoothing = smoothing
+        self.shares = [CameraShare() for _ in range(camera_count)]
+
+    def next_camera(self) -> int:
+        "The camera to scan next"
+
+        furthest_behind = min(share.virtual_seconds for share in self.shares)
+
+        for share in self.shares:
+            share.virtual_seconds = min(
+                share.virtual_seconds,
+                furthest_behind + share.last_seconds / share.weight(),
+            )
+
+        # The first camera wins ties
+        return min(
+            range(len(self.shares)),
+            key=lambda camera_id: self.shares[camera_id].virtual_seconds,
+        )
+
+    def finished(self, camera_id: int, *, seconds: float, change: float):
+        """
+        A camera was scanned, taking `seconds`,
+        with `change` of its frame different from its background
+        """
+
+        share = self.shares[camera_id]
+
+        share.change = (
+            self.smoothing * change + (1 - self.smoothing) * share.change
+            if share.scans
+            else change
+        )
+        share.virtual_seconds += seconds / share.weight()
+        share.last_seconds = seconds
+        share.scans += 1
+        share.seconds += seconds
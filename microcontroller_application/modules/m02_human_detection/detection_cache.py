@@ -0,0 +1,148 @@
+"""
+Module: 02. Human detection
+
+Remembering who was found in scenes that look the same
+
+Each scan's results are remembered by a perceptual hash of the frame
+(a fingerprint of its overall look that barely changes with noise or compression),
+and a frame whose hash is within a few bits of a remembered one reuses those results
+instead of being scanned. That's the case when the room goes back to how it looked
+before (like the lights turning back on or someone leaving), or whenever the
+foreground gate isn't being used. Only the most recently used few are remembered.
+
+The hash is computed the same way as `imagehash.phash` does, just with OpenCV
+(so only the shrinking, which is OpenCV's area averaging rather than Lanczos,
+can differ a little).
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from math import sqrt
+from typing import Sequence
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option, Some
+
+# How many scans' results are remembered
+CACHE_SIZE = 8
+
+# How many bits (out of 64) a frame's hash can differ by and still look the same
+HAMMING_TOLERANCE = 2
+
+# What size the frame is shrunk to before the DCT, and how much of that is kept
+HASH_IMAGE_SIZE = 32
+HASH_SIZE = 8
+
+
+@dataclass
+class CachedDetection:
+    # Where people were, as x start, y start, x end, y end
+    # (in fractions of the frame's width and height, since a frame that looks the same
+    # can be at another resolution)
+    boxes: np.ndarray
+    confidences: np.ndarray
+    # How long finding them took
+    seconds: float
+
+    def boxes_in(self, shape: tuple[int, ...]) -> np.ndarray:
+        "Where people were in a frame of this shape, in pixels"
+
+        height, width = shape[:2]
+
+        return self.boxes.reshape(-1, 4) * (width, height, width, height)
+
+
+@dataclass
+class DetectionCacheStatistics:
+    lookups: int = 0
+    hits: int = 0
+    # Scanning time not spent thanks to hits
+    saved_seconds: float = 0.0
+
+    def hit_rate(self) -> float:
+        if self.lookups == 0:
+            return 0.0
+
+        return self.hits / self.lookups
+
+
+class DetectionCache:
+    "The results of the last few scans, by what the frame looked like"
+
+    def __init__(self, *, size: int = CACHE_SIZE, tolerance: int = HAMMING_TOLERANCE):
+        if size < 1:
+            raise ValueError(f"the cache needs to fit at least 1 result, not {size}")
+
+        self.size = size
+        self.tolerance = tolerance
+        self.statistics = DetectionCacheStatistics()
+
+        # The least recently used first
+        self._entries: OrderedDict[int, CachedDetection] = OrderedDict()
+
+    def get(self, image_hash: int) -> Option[CachedDetection]:
+        "The results for the closest looking frame (within the tolerance), if any"
+
+        self.statistics.lookups += 1
+
+        closest: Option[tuple[int, int]] = NONE()
+
+        for cached_hash in self._entries:
+            distance = hamming_distance(image_hash, cached_hash)
+
+            if distance <= self.tolerance and (
+                closest.is_none() or distance < closest.unwrap()[1]
+            ):
+                closest = Some((cached_hash, distance))
+
+        if closest.is_none():
+            return NONE()
+
+        cached_hash = closest.unwrap()[0]
+        self._entries.move_to_end(cached_hash)
+
+        cached = self._entries[cached_hash]
+        self.statistics.hits += 1
+        self.statistics.saved_seconds += cached.seconds
+
+        return Some(cached)
+
+    def put(self, image_hash: int, cached: CachedDetection):
+        self._entries[image_hash] = cached
+        self._entries.move_to_end(image_hash)
+
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+def normalized(boxes: Sequence[np.ndarray], shape: tuple[int, ...]) -> np.ndarray:
+    "Boxes in a frame of this shape, as fractions of its width and height"
+
+    height, width = shape[:2]
+
+    return np.array(boxes, dtype=float).reshape(-1, 4) / (width, height, width, height)
+
+
+def perceptual_hash(grayscale: np.ndarray) -> int:
+    "A 64 bit perceptual hash of an image, computed like `imagehash.phash`"
+
+    small = cv2.resize(
+        grayscale, (HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), interpolation=cv2.INTER_AREA
+    ).astype(np.float32)
+
+    # OpenCV's DCT is orthonormal, which scales the first row and column
+    # down by another square root of 2 compared to SciPy's (which imagehash uses)
+    coefficients = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE]
+    coefficients[0, :] *= sqrt(2)
+    coefficients[:, 0] *= sqrt(2)
+
+    bits = (coefficients > np.median(coefficients)).reshape(-1)
+
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    "How many bits two hashes differ by"
+
+    return (a ^ b).bit_count()
@@ -0,0 +1,213 @@
+"""
+Module: 02. Human detection
+
+Which parts of the room people are looked for in
+
+Parts of the frame like the ceiling, windows, and TV screens never have anyone
+worth finding in them, but they cost as much to scan as anywhere else
+(and the TV can have people in it). The room's detection mask is a list of
+polygons to include (everywhere, if there are none) and a list to exclude,
+with each point as a fraction of the frame's width and height (so it doesn't
+matter what resolution the camera's at), like:
+
+    {
+        "include": [[[0, 0.3], [1, 0.3], [1, 1], [0, 1]]],
+        "exclude": [[[0.6, 0.35], [0.8, 0.35], [0.8, 0.55], [0.6, 0.55]]]
+    }
+
+Each camera has a mask of its own (see `mask_path_for_camera`).
+It's drawn into a bitmap once for each frame size. Only the box around
+what's included is scanned, movement elsewhere is ignored,
+and anyone found standing (by where their feet are) somewhere excluded is thrown out.
+"""
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option, Some
+
+from microcontroller_application.interfaces.message_types import MAIN_CAMERA
+from microcontroller_application.log import get_logger
+
+from .person_detectors import fit_within
+
+LOGGER = get_logger(__name__)
+
+Polygon = list[tuple[float, float]]
+
+
+@dataclass
+class RasterizedMask:
+    "A detection mask drawn for one size of frame"
+
+    # 255 wherever people are looked for, and 0 everywhere else
+    bitmap: np.ndarray
+    # The box around everywhere included, as x start, y start, x end, y end
+    bounds: tuple[int, int, int, int]
+
+    def clip(
+        self,
+        regions: list[tuple[int, int, int, int]],
+        *,
+        minimum_size: tuple[int, int],
+    ) -> list[tuple[int, int, int, int]]:
+        """
+        Shrink the regions to what's inside the bounds, leaving out any that aren't
+        (but keeping them at least `minimum_size`, the bounds permitting)
+        """
+
+        bounds_x_start, bounds_y_start, bounds_x_end, bounds_y_end = self.bounds
+        minimum_width, minimum_height = minimum_size
+
+        def grow(
+            start: int, end: int, minimum: int, bounds_start: int, bounds_end: int
+        ):
+            missing = max(minimum - (end - start), 0)
+            start, end = start - missing // 2, end + (missing - missing // 2)
+
+            # Shifted within the bounds rather than cut off by them
+            start, end = fit_within(
+                start - bounds_start, end - bounds_start, bounds_end - bounds_start
+            )
+
+            return start + bounds_start, end + bounds_start
+
+        clipped = []
+
+        for (x_start, y_start, x_end, y_end) in regions:
+            x_start, x_end = max(x_start, bounds_x_start), min(x_end, bounds_x_end)
+            y_start, y_end = max(y_start, bounds_y_start), min(y_end, bounds_y_end)
+
+            if x_start >= x_end or y_start >= y_end:
+                continue
+
+            x_start, x_end = grow(
+                x_start, x_end, minimum_width, bounds_x_start, bounds_x_end
+            )
+            y_start, y_end = grow(
+                y_start, y_end, minimum_height, bounds_y_start, bounds_y_end
+            )
+
+            clipped.append((x_start, y_start, x_end, y_end))
+
+        return clipped
+
+    def includes_feet(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Whether where the feet would be (the middle of the bottom) of each box
+        (as x start, y start, x end, y end) is included
+        """
+
+        height: int
+        width: int
+        (height, width) = self.bitmap.shape[:2]
+        boxes = np.asarray(boxes).reshape(-1, 4)
+
+        feet_x = np.clip((boxes[:, 0] + boxes[:, 2]) // 2, 0, width - 1).astype(int)
+        feet_y = np.clip(boxes[:, 3] - 1, 0, height - 1).astype(int)
+
+        return self.bitmap[feet_y, feet_x] > 0
+
+
+@dataclass
+class DetectionMask:
+    "Where to look for people, as polygons (in fractions of the frame's size)"
+
+    include: list[Polygon]
+    exclude: list[Polygon]
+
+    _rasterized: dict[tuple[int, int], RasterizedMask] = field(
+        default_factory=dict, repr=False
+    )
+
+    def rasterize(self, image_size: tuple[int, int]) -> RasterizedMask:
+        "The mask drawn for frames that are (height, width) big"
+
+        if image_size not in self._rasterized:
+            self._rasterized[image_size] = self._draw(image_size)
+
+        return self._rasterized[image_size]
+
+    def _draw(self, image_size: tuple[int, int]) -> RasterizedMask:
+        height, width = image_size
+
+        def in_pixels(polygon: Polygon) -> np.ndarray:
+            return np.rint(np.array(polygon) * [width, height]).astype(np.int32)
+
+        if self.include:
+            bitmap = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(bitmap, [in_pixels(polygon) for polygon in self.include], 255)
+        else:
+            bitmap = np.full((height, width), 255, dtype=np.uint8)
+
+        if self.exclude:
+            cv2.fillPoly(bitmap, [in_pixels(polygon) for polygon in self.exclude], 0)
+
+        (x_start, y_start, box_width, box_height) = cv2.boundingRect(bitmap)
+
+        if box_width == 0 or box_height == 0:
+            LOGGER.warning("the detection mask doesn't include anywhere to look")
+
+        return RasterizedMask(
+            bitmap, (x_start, y_start, x_start + box_width, y_start + box_height)
+        )
+
+
+def load_detection_mask(path: Path) -> Option[DetectionMask]:
+    "Load a room's detection mask (which it's fine not to have)"
+
+    try:
+        with open(path, "r", encoding="utf8") as mask_file:
+            description = json.load(mask_file)
+    except FileNotFoundError:
+        LOGGER.info("looking for people everywhere since there's no mask at %s", path)
+        return NONE()
+
+    return Some(parse_detection_mask(description))
+
+
+def mask_path_for_camera(path: Path, camera_id: int) -> Path:
+    """
+    Where a camera's mask is: the path given for the main camera,
+    and with the camera's ID after the name for the rest
+    (like `human-detection-mask-1.json`)
+    """
+
+    if camera_id == MAIN_CAMERA:
+        return path
+
+    return path.with_name(f"{path.stem}-{camera_id}{path.suffix}")
+
+
+def parse_detection_mask(description: dict) -> DetectionMask:
+    "A detection mask from how it's described in JSON"
+
+    unknown = set(description) - {"include", "exclude"}
+    if unknown:
+        raise ValueError(
+            f"detection masks only have include and exclude, not {sorted(unknown)}"
+        )
+
+    def parse_polygons(key: str) -> list[Polygon]:
+        polygons = []
+
+        for polygon in description.get(key, []):
+            if len(polygon) < 3 or any(
+                len(point) != 2 or not all(0 <= value <= 1 for value in point)
+                for point in polygon
+            ):
+                raise ValueError(
+                    f"{polygon!r} isn't a polygon of at least 3 points "
+                    "with each coordinate from 0 to 1"
+                )
+
+            polygons.append([(float(x), float(y)) for (x, y) in polygon])
+
+        return polygons
+
+    return DetectionMask(
+        include=parse_polygons("include"), exclude=parse_polygons("exclude")
+    )
@@ -0,0 +1,202 @@
+"""
+Module: 02. Human detection
+
+Worker processes for looking for people in frames
+
+On the default executor, HOG competes with every other `to_thread` user
+(like face recognition) and only part of its work lets go of the GIL,
+so it's run in processes of its own instead.
+
+Each worker loads the person detector (like the HOG descriptor
+or a neural network) once, when it starts.
+Frames aren't pickled to get to a worker: each request that's in flight has
+a block of shared memory that the frame is copied into, and the worker
+just looks at that block. Only the boxes and weights found come back.
+
+A request can be a batch of images (like every region of a frame that changed),
+which are copied into the block one after another and looked at together,
+so a neural network only has to run once for all of them.
+"""
+
+from asyncio import Queue, get_running_loop, wrap_future
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from math import prod
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+from option_and_result import NONE, Option, Some
+
+from microcontroller_application.log import get_logger
+
+from .person_detectors import PersonDetector
+
+LOGGER = get_logger(__name__)
+
+# The person detector of this worker process (loaded once, when the worker starts)
+_worker_person_detector: Optional[PersonDetector] = None
+
+
+def _start_worker(person_detector: PersonDetector):
+    global _worker_person_detector  # pylint: disable=global-statement
+
+    person_detector.load()
+
+    _worker_person_detector = person_detector
+
+
+def _detect_in_worker(
+    shared_memory_name: str, shapes: list[tuple[int, ...]]
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    assert _worker_person_detector is not None, "it's loaded when the worker starts"
+
+    shared_memory = SharedMemory(shared_memory_name)
+
+    try:
+        images = [
+            np.ndarray(shape, dtype=np.uint8, buffer=shared_memory.buf, offset=offset)
+            for (shape, offset) in zip(shapes, _offsets_of(shapes))
+        ]
+
+        results = _worker_person_detector.detect_batch(images)
+
+        # The views have to go before the shared memory can be closed
+        del images
+    finally:
+        shared_memory.close()
+
+    return results
+
+
+def _offsets_of(shapes: list[tuple[int, ...]]) -> list[int]:
+    "Where each image starts in a block of shared memory they're packed into"
+
+    return list(accumulate((prod(shape) for shape in shapes[:-1]), initial=0))
+
+
+class DetectionPool:
+    """
+    Worker processes that look for people in images
+
+    At most `maximum_in_flight` images are being looked at (or waiting for a worker)
+    at once, and anything else asking waits its turn.
+    """
+
+    def __init__(
+        self,
+        person_detector: PersonDetector,
+        *,
+        processes: int,
+        maximum_in_flight: int,
+    ):
+        if processes < 1:
+            raise ValueError(f"there needs to be at least 1 process, not {processes}")
+
+        if maximum_in_flight < 1:
+            raise ValueError(
+                "at least 1 image needs to be allowed in flight, "
+                f"not {maximum_in_flight}"
+            )
+
+        # Not loaded in this process, just copied to each worker
+        self.person_detector = person_detector
+        self.processes = processes
+
+        # Spawned rather than forked, since this process has threads of its own
+        # (like the camera's) that a fork could copy mid-way through holding a lock
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context("spawn"),
+            initializer=_start_worker,
+            initargs=(person_detector,),
+        )
+
+        # Shared memory for each request that can be in flight,
+        # made (or remade bigger) once there's an image for it
+        self._shared_memory: Queue[Option[SharedMemory]] = Queue()
+        for _ in range(maximum_in_flight):
+            self._shared_memory.put_nowait(NONE())
+
+        self._all_shared_memory: set[SharedMemory] = set()
+
+    async def detect(self, image: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        "Where people are (as x, y, width, height) and how confident it is about each"
+
+        ((boxes, weights),) = await self.detect_batch([image])
+
+        return boxes, weights
+
+    async def detect_batch(
+        self, images: list[np.ndarray]
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        "Like `detect` for each image, but all of them in one request to one worker"
+
+        if not images:
+            return []
+
+        shapes = [image.shape for image in images]
+        size = sum(image.nbytes for image in images)
+
+        shared_memory_option = await self._shared_memory.get()
+
+        try:
+            if (
+                shared_memory_option.is_none()
+                or shared_memory_option.unwrap().size < size
+            ):
+                if shared_memory_option.is_some():
+                    self._free(shared_memory_option.take().unwrap())
+
+                shared_memory_option = Some(SharedMemory(create=True, size=size))
+                self._all_shared_memory.add(shared_memory_option.unwrap())
+
+            shared_memory = shared_memory_option.unwrap()
+
+            for (image, offset) in zip(images, _offsets_of(shapes)):
+                view = np.ndarray(
+                    image.shape, dtype=np.uint8, buffer=shared_memory.buf, offset=offset
+                )
+                view[...] = image
+                del view
+
+            future = self._executor.submit(
+                _detect_in_worker, shared_memory.name, shapes
+            )
+        except BaseException:
+            self._shared_memory.put_nowait(shared_memory_option)
+            raise
+
+        loop = get_running_loop()
+
+        def hand_back(_future):
+            # This is called on the executor's thread
+            try:
+                loop.call_soon_threadsafe(
+                    self._shared_memory.put_nowait, Some(shared_memory)
+                )
+            except RuntimeError:
+                # The event loop already closed so nobody is waiting for this anymore
+                pass
+
+        # Only once the worker's done with it, even if this is cancelled before then
+        future.add_done_callback(hand_back)
+
+        return await wrap_future(future)
+
+    def close(self):
+        "Stop the workers (once they finish what they're doing) and free the shared memory"
+
+        # Not waiting, so the event loop isn't held up by a scan that's part way through
+        # (a worker that already has shared memory open keeps it until it's done)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+        for shared_memory in list(self._all_shared_memory):
+            self._free(shared_memory)
+
+    def _free(self, shared_memory: SharedMemory):
+        self._all_shared_memory.discard(shared_memory)
+
+        shared_memory.close()
+        shared_memory.unlink()
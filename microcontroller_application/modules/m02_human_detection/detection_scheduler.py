@@ -0,0 +1,232 @@
+"""
+Module: 02. Human detection
+
+Deciding when to look for people next
+
+Motion (and the room becoming occupied) asks for a scan straight away.
+Otherwise, how soon the next scan is due depends on what the last one saw:
+soon while things are moving, every so often while people are around
+but still, and rarely once the room is empty (backing off gradually,
+so someone who just sat down is still checked on fairly soon).
+With more than one camera, that's worked out for each camera from its own scans,
+and the next scan is due as soon as any of them needs one.
+
+Whatever asks for it, scans are kept within a CPU budget: the fraction of
+the time that may be spent scanning. Since a scan takes about as long as
+the last few did, there's at least enough of a gap between scans for that.
+
+Asking for a scan while one is already going means one more scan after it
+(no matter how many times it was asked for in the meantime).
+"""
+
+from asyncio import Event, TimerHandle, get_running_loop, sleep
+from dataclasses import dataclass
+from time import monotonic
+
+from option_and_result import NONE, Option, Some
+
+# How soon the next scan is due while things are moving
+ACTIVE_INTERVAL_SECONDS = 2.0
+
+# While people are around (or the occupancy sensor says so) but nothing's moving
+OCCUPIED_INTERVAL_SECONDS = 15.0
+
+# While the room seems empty
+IDLE_INTERVAL_SECONDS = 5 * 60.0
+
+# How much (as a fraction of the frame) has to change for things to count as moving
+MINIMUM_CHANGE = 0.01
+
+# How much the interval grows each scan as things settle down
+BACK_OFF_FACTOR = 2.0
+
+# How much each scan's time counts towards the recent average
+LATENCY_SMOOTHING = 0.3
+
+
+@dataclass
+class DetectionSchedulerReport:
+    "How scanning has been going"
+
+    # The fraction of the time scanning may take
+    cpu_budget: float
+    # The fraction of the time scanning did take
+    cpu_used: float
+    scans_per_minute: float
+    # The most scans a minute the budget allows (at the recent scan time)
+    budgeted_scans_per_minute: float
+    scans: int
+    requests: int
+    # Requests made while a scan was already going or asked for
+    coalesced: int
+    mean_scan_milliseconds: float
+    # How soon the next scan is due unless something asks for one
+    interval_seconds: float
+
+
+class DetectionScheduler:
+    "Decides when to look for people next"
+
+    def __init__(self, *, cpu_budget: float, cameras: int = 1):
+        if not 0 < cpu_budget <= 1:
+            raise ValueError(
+                f"the CPU budget needs to be above 0 and at most 1, not {cpu_budget}"
+            )
+
+        if cameras < 1:
+            raise ValueError(f"there needs to be at least 1 camera, not {cameras}")
+
+        self.cpu_budget = cpu_budget
+
+        self._requested = False
+        # Set whenever a scan's asked for
+        self._changed = Event()
+        self._scanning = False
+        self._occupied = False
+
+        # For each camera, by what its own scans saw
+        self._intervals_seconds = [IDLE_INTERVAL_SECONDS] * cameras
+        self._latency_seconds: Option[float] = NONE()
+
+        self._started_at = monotonic()
+        self._last_scan_finished_at = monotonic()
+        self._scans = 0
+        self._requests = 0
+        self._coalesced = 0
+        self._total_scan_seconds = 0.0
+
+    def request(self):
+        "Ask for a scan as soon as the budget allows"
+
+        self._requests += 1
+
+        if self._scanning or self._requested:
+            self._coalesced += 1
+
+        self._requested = True
+        self._changed.set()
+
+    def set_occupied(self, occupied: bool):
+        "Tell it whether the occupancy sensor thinks someone's there"
+
+        if occupied and not self._occupied:
+            self.request()
+
+        self._occupied = occupied
+
+        if occupied:
+            self._intervals_seconds = [
+                min(interval_seconds, OCCUPIED_INTERVAL_SECONDS)
+                for interval_seconds in self._intervals_seconds
+            ]
+
+    async def wait(self):
+        "Wait until the next scan is due (or asked for) and the budget allows it"
+
+        while not self._requested:
+            due_in = (
+                self._last_scan_finished_at + self._interval_seconds() - monotonic()
+            )
+
+            if due_in <= 0:
+                break
+
+            self._changed.clear()
+            await self._wait_for_change(due_in)
+
+        # Even if it was asked for, the budget comes first
+        allowed_in = (
+            self._last_scan_finished_at + self._minimum_gap_seconds() - monotonic()
+        )
+
+        if allowed_in > 0:
+            await sleep(allowed_in)
+
+        # Anything asking from now on is asking for the scan after this one
+        self._requested = False
+        self._scanning = True
+
+    def finished(
+        self, *, seconds: float, change: float, people: bool, camera_id: int = 0
+    ):
+        """
+        Count a scan of a camera that took `seconds`, where `change`
+        (as a fraction of the frame) changed since the background was learned
+        and whether it found `people`
+        """
+
+        self._scanning = False
+        self._last_scan_finished_at = monotonic()
+        self._scans += 1
+        self._total_scan_seconds += seconds
+
+        self._latency_seconds = Some(
+            seconds
+            if self._latency_seconds.is_none()
+            else LATENCY_SMOOTHING * seconds
+            + (1 - LATENCY_SMOOTHING) * self._latency_seconds.unwrap()
+        )
+
+        if change >= MINIMUM_CHANGE:
+            target = ACTIVE_INTERVAL_SECONDS
+        elif people or self._occupied:
+            target = OCCUPIED_INTERVAL_SECONDS
+        else:
+            target = IDLE_INTERVAL_SECONDS
+
+        interval_seconds = self._intervals_seconds[camera_id]
+
+        if target > interval_seconds:
+            # Settling down, so gradually
+            self._intervals_seconds[camera_id] = min(
+                interval_seconds * BACK_OFF_FACTOR, target
+            )
+        else:
+            self._intervals_seconds[camera_id] = target
+
+    def interval_seconds_of(self, camera_id: int) -> float:
+        "How soon a camera's next scan is due, going by what its own scans saw"
+
+        return self._intervals_seconds[camera_id]
+
+    def report(self) -> DetectionSchedulerReport:
+        elapsed_seconds = max(monotonic() - self._started_at, 1e-9)
+        latency_seconds = self._latency_seconds.unwrap_or(0.0)
+
+        if latency_seconds > 0:
+            budgeted_scans_per_minute = 60 * self.cpu_budget / latency_seconds
+        else:
+            budgeted_scans_per_minute = float("inf")
+
+        return DetectionSchedulerReport(
+            cpu_budget=self.cpu_budget,
+            cpu_used=self._total_scan_seconds / elapsed_seconds,
+            scans_per_minute=60 * self._scans / elapsed_seconds,
+            budgeted_scans_per_minute=budgeted_scans_per_minute,
+            scans=self._scans,
+            requests=self._requests,
+            coalesced=self._coalesced,
+            mean_scan_milliseconds=(
+                1000 * self._total_scan_seconds / self._scans if self._scans else 0.0
+            ),
+            interval_seconds=self._interval_seconds(),
+        )
+
+    def _interval_seconds(self) -> float:
+        # Whichever camera needs a scan soonest
+        return min(self._intervals_seconds)
+
+    def _minimum_gap_seconds(self) -> float:
+        # Scanning for latency out of every latency + gap seconds is within budget
+        return self._latency_seconds.unwrap_or(0.0) * (1 / self.cpu_budget - 1)
+
+    async def _wait_for_change(self, timeout_seconds: float):
+        # Not asyncio.wait_for, which can swallow a cancellation
+        # that arrives just as a request does (and then this would never stop)
+        changed = self._changed
+        timer: TimerHandle = get_running_loop().call_later(timeout_seconds, changed.set)
+
+        try:
+            await changed.wait()
+        finally:
+            timer.cancel()
@@ -0,0 +1,154 @@
+"""
+Module: 02. Human detection
+
+Finding what's changed in the room, so only that is looked at for people
+
+A background model (OpenCV's MOG2) learns what the empty room looks like
+from a small, cheap thumbnail of every frame human detection gets.
+Whatever doesn't fit that model is foreground (like someone who moved),
+and only the areas around the foreground need to be looked at for people.
+
+When nothing's in the foreground, nothing moved since the background was learned,
+so whatever was found last time is still there.
+"""
+
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option, Some
+
+from .person_detectors import regions_around
+
+# Wide enough to see a person's outline, small enough to be nearly free
+THUMBNAIL_WIDTH = 160
+
+# How many frames the background model remembers
+# (frames only come in when human detection is requested, so this is a long time)
+BACKGROUND_HISTORY = 20
+
+# Frames before the background model is trusted (the whole frame is scanned until then)
+WARM_UP_FRAMES = 3
+
+# Foreground smaller than this fraction of the frame is just noise
+MINIMUM_FOREGROUND_FRACTION = 0.002
+
+# How much (as a fraction of its size) around the foreground is scanned too
+# (since a moving hand only shows part of the person it belongs to)
+FOREGROUND_PADDING = 0.5
+
+# Scanning regions that cover this much of the frame is no cheaper than the whole thing
+FULL_FRAME_FRACTION = 0.6
+
+# What MOG2 marks shadows as (rather than 255 for foreground)
+SHADOW_VALUE = 127
+
+
+@dataclass
+class ForegroundGateStatistics:
+    frames: int = 0
+    # Frames with no foreground at all
+    empty: int = 0
+    # Frames that had to be scanned whole
+    full_frames: int = 0
+    # Of every frame, how much of it had to be scanned
+    total_fraction_scanned: float = 0.0
+
+    def average_fraction_scanned(self) -> float:
+        if self.frames == 0:
+            return 0.0
+
+        return self.total_fraction_scanned / self.frames
+
+
+class ForegroundGate:
+    "Keeps a background model of the room and finds the areas that don't fit it"
+
+    def __init__(self):
+        self._background = cv2.createBackgroundSubtractorMOG2(
+            history=BACKGROUND_HISTORY, detectShadows=True
+        )
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.statistics = ForegroundGateStatistics()
+
+    def regions(
+        self,
+        grayscale: np.ndarray,
+        *,
+        minimum_size: tuple[int, int],
+        mask: Option[np.ndarray] = NONE(),
+    ) -> Option[list[tuple[int, int, int, int]]]:
+        """
+        Update the background model with a frame, returning where the foreground is
+        (as x start, y start, x end, y end, padded to at least `minimum_size`)
+        or NONE if the whole frame needs scanning
+
+        Any foreground outside of the `mask` (where it's 0) is ignored.
+        """
+
+        height, width = grayscale.shape[:2]
+        scale = THUMBNAIL_WIDTH / width
+
+        thumbnail = cv2.resize(
+            grayscale,
+            (THUMBNAIL_WIDTH, max(round(height * scale), 1)),
+            interpolation=cv2.INTER_AREA,
+        )
+
+        foreground = self._background.apply(thumbnail)
+
+        self.statistics.frames += 1
+
+        if self.statistics.frames <= WARM_UP_FRAMES:
+            return self._whole_frame()
+
+        # Shadows aren't people, and specks are noise
+        foreground = np.where(foreground > SHADOW_VALUE, 255, 0).astype(np.uint8)
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_OPEN, self._kernel)
+
+        if mask.is_some():
+            foreground &= cv2.resize(
+                mask.unwrap(),
+                (thumbnail.shape[1], thumbnail.shape[0]),
+                interpolation=cv2.INTER_NEAREST,
+            )
+
+        _count, _labels, stats, _centroids = cv2.connectedComponentsWithStats(
+            foreground
+        )
+
+        # The first component is the background
+        minimum_area = MINIMUM_FOREGROUND_FRACTION * foreground.size
+        boxes = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= minimum_area][:, :4]
+
+        if len(boxes) == 0:
+            self.statistics.empty += 1
+            return Some([])
+
+        # Back to the frame's resolution
+        boxes = np.rint(boxes / scale).astype(int)
+
+        regions = regions_around(
+            boxes,
+            image_size=(width, height),
+            padding=FOREGROUND_PADDING,
+            minimum_size=minimum_size,
+        )
+
+        fraction = sum(
+            (x_end - x_start) * (y_end - y_start)
+            for (x_start, y_start, x_end, y_end) in regions
+        ) / (width * height)
+
+        if fraction >= FULL_FRAME_FRACTION:
+            return self._whole_frame()
+
+        self.statistics.total_fraction_scanned += fraction
+
+        return Some(regions)
+
+    def _whole_frame(self) -> Option[list[tuple[int, int, int, int]]]:
+        self.statistics.full_frames += 1
+        self.statistics.total_fraction_scanned += 1
+
+        return NONE()
@@ -0,0 +1,443 @@
+"""
+Module: 02. Human detection
+
+Finding the HOG settings that suit a camera best
+
+HOG's speed and accuracy depend on how far its window moves each step,
+how much the image is padded, how much bigger the window gets between pyramid
+levels, how much the frame's downscaled first, and how confident it has to be.
+This sweeps all of those over a folder of recorded frames, measuring
+how long each frame took (as percentiles) and the precision and recall of
+what was found, and recommends the fastest settings that are about as accurate
+as the most accurate ones. The recommendation is saved as the tuning file
+the application loads at startup (see HUMAN_DETECTION_TUNING).
+
+Frames are resized to the resolution human detection looks at, since they're
+usually recorded at a higher one (and HOG's window is a fixed number of pixels).
+They're labelled by a JSON file of each frame's file name to the boxes
+(as x start, y start, x end, y end, in the recorded frame) of the people in it,
+with frames that aren't in it left out. Without labels, what the most thorough settings find
+stands in for them, so the report is how well the faster settings agree
+with the slowest (and false positives count as much as anything).
+
+Run it like:
+
+    python -m microcontroller_application.modules.m02_human_detection.hog_tuning \\
+        recorded-frames --labels recorded-frames/labels.json
+"""
+
+import json
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass
+from itertools import product
+from pathlib import Path
+from time import perf_counter
+from typing import Sequence
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option, Some
+
+from microcontroller_application.interfaces.message_types import CameraProfile
+from microcontroller_application.log import get_logger
+
+from ..m01_environment.software_components.sc02_camera_driver import (
+    PROFILE_RESOLUTIONS,
+)
+from .person_detectors import HOG_CONFIDENCE_THRESHOLD, HOGParameters, detect_people
+from .person_tracker import intersection_over_union
+
+LOGGER = get_logger(__name__)
+
+# What's swept by default (a few hundred combinations, with the thresholds
+# costing nothing extra since they're applied to what was already found)
+WIN_STRIDES = ((8, 8), (16, 16))
+PADDINGS = ((0, 0), (16, 16))
+PYRAMID_SCALES = (1.05, 1.1, 1.2)
+SCALES = (1.0, 0.75, 0.5)
+CONFIDENCE_THRESHOLDS = (0.0, 0.3, 0.5, 0.8, 1.0, 1.2)
+
+# The settings whose findings stand in for labels when there aren't any
+THOROUGH_PARAMETERS = HOGParameters(
+    win_stride=(8, 8), padding=(16, 16), pyramid_scale=1.03
+)
+
+# How much a box found has to overlap a labelled one to count as finding them
+MINIMUM_OVERLAP = 0.5
+
+# How far below the most accurate (by F1 score) the recommendation can be
+F1_TOLERANCE = 0.05
+
+
+@dataclass
+class HOGTuning:
+    "HOG settings for a camera"
+
+    scale: float
+    confidence_threshold: float
+    parameters: HOGParameters
+
+
+@dataclass
+class SweepResult:
+    "How fast and accurate some HOG settings were"
+
+    tuning: HOGTuning
+    # How long each frame took
+    p50_milliseconds: float
+    p90_milliseconds: float
+    p99_milliseconds: float
+    true_positives: int
+    false_positives: int
+    false_negatives: int
+
+    def precision(self) -> float:
+        "Of everyone found, how many were really there"
+
+        found = self.true_positives + self.false_positives
+
+        # Finding nobody is never wrong
+        return self.true_positives / found if found else 1.0
+
+    def recall(self) -> float:
+        "Of everyone really there, how many were found"
+
+        expected = self.true_positives + self.false_negatives
+
+        return self.true_positives / expected if expected else 1.0
+
+    def f1_score(self) -> float:
+        "Precision and recall together (their harmonic mean)"
+
+        precision, recall = self.precision(), self.recall()
+
+        if precision + recall == 0:
+            return 0.0
+
+        return 2 * precision * recall / (precision + recall)
+
+
+def load_hog_tuning(path: Path) -> Option[HOGTuning]:
+    "Load HOG settings saved by the tuning benchmark (which it's fine not to have run)"
+
+    try:
+        with open(path, "r", encoding="utf8") as tuning_file:
+            description = json.load(tuning_file)
+    except FileNotFoundError:
+        return NONE()
+
+    try:
+        parameters = description["parameters"]
+
+        tuning = HOGTuning(
+            scale=float(description["scale"]),
+            confidence_threshold=float(description["confidence_threshold"]),
+            parameters=HOGParameters(
+                win_stride=pair_of(parameters["win_stride"]),
+                padding=pair_of(parameters["padding"]),
+                pyramid_scale=float(parameters["pyramid_scale"]),
+            ),
+        )
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"{path} isn't HOG tuning saved by the benchmark") from error
+
+    if not 0 < tuning.scale <= 1:
+        raise ValueError(f"the scale in {path} needs to be more than 0 and at most 1")
+
+    # Otherwise OpenCV would only complain once people are looked for
+    if not all(
+        stride > 0 and stride % 8 == 0 for stride in tuning.parameters.win_stride
+    ):
+        raise ValueError(f"the window stride in {path} needs to be multiples of 8")
+    if not all(padding >= 0 for padding in tuning.parameters.padding):
+        raise ValueError(f"the padding in {path} can't be negative")
+    if not tuning.parameters.pyramid_scale > 1:
+        raise ValueError(f"the pyramid scale in {path} needs to be more than 1")
+
+    LOGGER.info("using HOG settings tuned for this camera: %r", tuning)
+
+    return Some(tuning)
+
+
+def save_hog_tuning(path: Path, tuning: HOGTuning):
+    "Save HOG settings for the application to load"
+
+    with open(path, "w", encoding="utf8") as tuning_file:
+        json.dump(asdict(tuning), tuning_file, indent=4)
+
+
+def sweep(
+    images: list[np.ndarray],
+    labels: list[np.ndarray],
+    *,
+    win_strides: Sequence[tuple[int, int]] = WIN_STRIDES,
+    paddings: Sequence[tuple[int, int]] = PADDINGS,
+    pyramid_scales: Sequence[float] = PYRAMID_SCALES,
+    scales: Sequence[float] = SCALES,
+    confidence_thresholds: Sequence[float] = CONFIDENCE_THRESHOLDS,
+) -> list[SweepResult]:
+    """
+    How fast and accurate every combination of settings is
+    on grayscale images with people labelled (as x start, y start, x end, y end)
+    """
+
+    hog = cv2.HOGDescriptor()
+    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    results = []
+
+    for (win_stride, padding, pyramid_scale, scale) in product(
+        win_strides, paddings, pyramid_scales, scales
+    ):
+        parameters = HOGParameters(win_stride, padding, pyramid_scale)
+
+        milliseconds = []
+        found = []
+
+        for image in images:
+            started_at = perf_counter()
+            boxes, weights = detect_people(
+                hog, image, scale=scale, coarse_to_fine=False, parameters=parameters
+            )
+            milliseconds.append(1000 * (perf_counter() - started_at))
+
+            found.append((corners_of(boxes), weights))
+
+        p50, p90, p99 = np.percentile(milliseconds, [50, 90, 99])
+
+        for confidence_threshold in confidence_thresholds:
+            true_positives = false_positives = false_negatives = 0
+
+            for ((boxes, weights), labelled) in zip(found, labels):
+                matched = match(boxes[weights >= confidence_threshold], labelled)
+
+                true_positives += matched[0]
+                false_positives += matched[1]
+                false_negatives += matched[2]
+
+            results.append(
+                SweepResult(
+                    HOGTuning(scale, confidence_threshold, parameters),
+                    p50,
+                    p90,
+                    p99,
+                    true_positives,
+                    false_positives,
+                    false_negatives,
+                )
+            )
+
+    return results
+
+
+def match(found: np.ndarray, labelled: np.ndarray) -> tuple[int, int, int]:
+    """
+    How many of the boxes found are people who were labelled, aren't,
+    and how many people labelled weren't found (as true positives,
+    false positives, and false negatives), with each person only found once
+    """
+
+    if len(found) == 0 or len(labelled) == 0:
+        return 0, len(found), len(labelled)
+
+    overlaps = intersection_over_union(found, labelled)
+
+    true_positives = 0
+    matched_labels = set()
+
+    # Best matches first
+    for found_index in np.argsort(-overlaps.max(axis=1)):
+        for label_index in np.argsort(-overlaps[found_index]):
+            if overlaps[found_index, label_index] < MINIMUM_OVERLAP:
+                break
+
+            if label_index not in matched_labels:
+                matched_labels.add(label_index)
+                true_positives += 1
+                break
+
+    return (
+        true_positives,
+        len(found) - true_positives,
+        len(labelled) - true_positives,
+    )
+
+
+def pareto_front(results: list[SweepResult]) -> list[SweepResult]:
+    "The results nothing else is both at least as fast (at the median) and as accurate as"
+
+    front: list[SweepResult] = []
+
+    for result in sorted(
+        results, key=lambda result: (result.p50_milliseconds, -result.f1_score())
+    ):
+        if not front or result.f1_score() > front[-1].f1_score():
+            front.append(result)
+
+    return front
+
+
+def recommend(
+    results: list[SweepResult], *, f1_tolerance: float = F1_TOLERANCE
+) -> SweepResult:
+    """
+    The fastest settings (by how long the slowest frames took, at the 90th percentile)
+    about as accurate as the most accurate ones
+    """
+
+    best_f1_score = max(result.f1_score() for result in results)
+
+    return min(
+        (
+            result
+            for result in results
+            if result.f1_score() >= best_f1_score - f1_tolerance
+        ),
+        key=lambda result: (result.p90_milliseconds, -result.f1_score()),
+    )
+
+
+def pair_of(value) -> tuple[int, int]:
+    "Two whole numbers (like a stride) from how they're saved in JSON"
+
+    (first, second) = value
+
+    return (int(first), int(second))
+
+
+def recorded_frames(folder: Path) -> list[Path]:
+    "The JPEGs in a folder (recordings are saved as .jpeg, other tools use .jpg)"
+
+    return sorted([*folder.glob("*.jpg"), *folder.glob("*.jpeg")])
+
+
+def at_detection_resolution(
+    image: np.ndarray, boxes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    "A frame resized to what human detection looks at, and its boxes along with it"
+
+    width, height = PROFILE_RESOLUTIONS[CameraProfile.DETECTION]
+    image_height, image_width = image.shape[:2]
+
+    resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    x_scale, y_scale = width / image_width, height / image_height
+
+    return resized, boxes * (x_scale, y_scale, x_scale, y_scale)
+
+
+def corners_of(boxes: np.ndarray) -> np.ndarray:
+    "From x, y, width, height to x start, y start, x end, y end"
+
+    boxes = np.asarray(boxes).reshape(-1, 4)
+
+    return np.column_stack([boxes[:, 0:2], boxes[:, 0:2] + boxes[:, 2:4]])
+
+
+def main():
+    "Sweep a folder of recorded frames and save the recommended settings"
+
+    parser = ArgumentParser(description="Find the HOG settings that suit a camera")
+    parser.add_argument("frames", type=Path, help="a folder of recorded JPEGs")
+    parser.add_argument(
+        "--labels",
+        type=Path,
+        help="a JSON file of each frame's file name to the boxes of the people in it",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("human-detection-tuning.json"),
+        help="where to save the recommended settings",
+    )
+    parser.add_argument(
+        "--report", type=Path, help="where to save every result as JSON too"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=1, help="how many threads OpenCV can use"
+    )
+    arguments = parser.parse_args()
+
+    cv2.setNumThreads(arguments.threads)
+
+    paths = recorded_frames(arguments.frames)
+    labels_by_name = {}
+
+    if arguments.labels is not None:
+        with open(arguments.labels, "r", encoding="utf8") as labels_file:
+            labels_by_name = json.load(labels_file)
+
+        paths = [path for path in paths if path.name in labels_by_name]
+
+    if not paths:
+        raise ValueError(f"there are no (labelled) JPEGs in {arguments.frames}")
+
+    # At the resolution they'd really be looked at
+    resized = [
+        at_detection_resolution(
+            cv2.imread(str(path), cv2.IMREAD_GRAYSCALE),
+            np.array(labels_by_name.get(path.name, []), dtype=float).reshape(-1, 4),
+        )
+        for path in paths
+    ]
+    images = [image for (image, _boxes) in resized]
+    labels = [boxes for (_image, boxes) in resized]
+
+    if arguments.labels is None:
+        print("no labels, so comparing against the most thorough settings instead")
+
+        hog = cv2.HOGDescriptor()
+        hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+        labels = []
+        for image in images:
+            boxes, weights = detect_people(
+                hog,
+                image,
+                scale=1,
+                coarse_to_fine=False,
+                parameters=THOROUGH_PARAMETERS,
+            )
+            labels.append(corners_of(boxes[weights >= HOG_CONFIDENCE_THRESHOLD]))
+
+    results = sweep(images, labels)
+
+    print(
+        f"{'stride':>8} {'padding':>8} {'pyramid':>8} {'scale':>6} {'threshold':>9} "
+        f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+        f"{'precision':>9} {'recall':>7} {'F1':>5}"
+    )
+    for result in pareto_front(results):
+        tuning = result.tuning
+        print(
+            f"{str(tuning.parameters.win_stride[0]):>8} "
+            f"{str(tuning.parameters.padding[0]):>8} "
+            f"{tuning.parameters.pyramid_scale:>8} {tuning.scale:>6} "
+            f"{tuning.confidence_threshold:>9} "
+            f"{result.p50_milliseconds:>8.0f} {result.p90_milliseconds:>8.0f} "
+            f"{result.p99_milliseconds:>8.0f} "
+            f"{result.precision():>9.2f} {result.recall():>7.2f} {result.f1_score():>5.2f}"
+        )
+
+    recommended = recommend(results)
+    save_hog_tuning(arguments.output, recommended.tuning)
+    print(f"recommended {recommended.tuning!r}, saved to {arguments.output}")
+
+    if arguments.report is not None:
+        with open(arguments.report, "w", encoding="utf8") as report_file:
+            json.dump(
+                [
+                    asdict(result)
+                    | {
+                        "precision": result.precision(),
+                        "recall": result.recall(),
+                        "f1_score": result.f1_score(),
+                    }
+                    for result in results
+                ],
+                report_file,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Module: 02. Human detection
+
+Cropping the people found out of a frame, ready to be looked at
+
+Activity recognition and person identification both look at each person found,
+so everyone's cropped out once, the same way for both. Each crop's resized
+to the same size (keeping its shape, with the spare space left black
+and the person centered), and they're all packed into one contiguous batch
+of RGB images (number of people × height × width × 3). The batch is read-only,
+since both get the same one, and it doesn't need the frame to stay around.
+"""
+
+import cv2
+import numpy as np
+
+# How big each crop is (width, height), which is tall enough for faces
+# to be recognizable when people are further away
+PERSON_CROP_SIZE = (192, 384)
+
+
+def crop_people(
+    image: np.ndarray,
+    boxes: list[tuple[int, int, int, int]],
+    *,
+    size: tuple[int, int] = PERSON_CROP_SIZE,
+) -> np.ndarray:
+    """
+    Crop the boxes (as x start, y start, x end, y end, inside the image)
+    out of an RGB image, as a read-only batch of crops that are all `size` big
+    """
+
+    crop_width, crop_height = size
+
+    crops = np.zeros((len(boxes), crop_height, crop_width, 3), dtype=np.uint8)
+
+    for (crop, (x_start, y_start, x_end, y_end)) in zip(crops, boxes):
+        width, height = x_end - x_start, y_end - y_start
+
+        if width <= 0 or height <= 0:
+            continue
+
+        scale = min(crop_width / width, crop_height / height)
+        scaled_width = min(max(round(width * scale), 1), crop_width)
+        scaled_height = min(max(round(height * scale), 1), crop_height)
+
+        scaled = cv2.resize(
+            image[y_start:y_end, x_start:x_end],
+            (scaled_width, scaled_height),
+            # Area averaging doesn't alias when shrinking, but blurs when enlarging
+            interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR,
+        )
+
+        x_offset = (crop_width - scaled_width) // 2
+        y_offset = (crop_height - scaled_height) // 2
+        crop[
+            y_offset : y_offset + scaled_height, x_offset : x_offset + scaled_width
+        ] = scaled
+
+    crops.setflags(write=False)
+
+    return crops
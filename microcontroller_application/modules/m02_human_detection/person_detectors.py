@@ -0,0 +1,605 @@
+"""
+Module: 02. Human detection
+
+What people are looked for with
+
+Every backend has the same interface, so which one's used is just a setting
+(the HUMAN_DETECTOR environment variable):
+
+- HOG, OpenCV's built in people detector, which needs no model file
+  but is slow and misses people who aren't standing upright
+- A neural network loaded from a local ONNX file with OpenCV's DNN module,
+  like MobileNet-SSD or a small YOLO, which is both faster and more accurate on a Pi
+
+Backends are made in one process and used in another (a detection pool's worker),
+so they only hold their settings until they're loaded.
+"""
+
+from dataclasses import dataclass
+from math import ceil
+from pathlib import Path
+from typing import Optional, Protocol
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option
+
+# HOG's detection window (width, height), the smallest a person can be found at
+HOG_WINDOW_SIZE = (64, 128)
+
+# How far (as a fraction of a coarse hit's size) around a coarse hit is scanned again
+COARSE_TO_FINE_PADDING = 0.5
+
+# HOG's weights aren't probabilities, so this is a threshold of its own
+HOG_CONFIDENCE_THRESHOLD = 0.8
+
+DNN_CONFIDENCE_THRESHOLD = 0.5
+
+DNN_INPUT_SIZE = (320, 320)
+
+# In COCO, which YOLO models are trained on
+YOLO_PERSON_CLASS_ID = 0
+
+# SSDs count the background as class 0, so COCO's person is 1
+# (but it's 15 for MobileNet-SSD, which is trained on Pascal VOC instead)
+SSD_PERSON_CLASS_ID = 1
+
+# How pixels are scaled and shifted for a neural network unless it's told otherwise
+# (YOLO models take 0 to 1, but MobileNet-SSD wants 1 / 127.5 with a mean of 127.5)
+DNN_PIXEL_SCALE = 1 / 255
+DNN_PIXEL_MEAN = 0.0
+
+# How much boxes from a neural network can overlap before they count as the same person
+NMS_OVERLAP_THRESHOLD = 0.45
+
+
+@dataclass(frozen=True)
+class HOGParameters:
+    "How HOG looks through an image (OpenCV's defaults, unless tuned for the camera)"
+
+    # How far the window moves each step (a multiple of HOG's 8 pixel block stride)
+    win_stride: tuple[int, int] = (8, 8)
+    # How much the image is padded around its edges
+    padding: tuple[int, int] = (0, 0)
+    # How much bigger the window gets at each level of the image pyramid
+    pyramid_scale: float = 1.05
+
+
+class PersonDetector(Protocol):
+    "Something that can find people in images, loaded in the process it's used in"
+
+    confidence_threshold: float
+
+    # How many threads OpenCV can use in the process this is loaded in
+    threads: int
+
+    # Whether images need to be in color (RGB) rather than grayscale
+    needs_color: bool
+
+    def load(self) -> None:
+        "Get ready to look for people (which can take a while)"
+
+    def input_size(self, image_size: tuple[int, int]) -> tuple[int, int]:
+        "The width and height images of this size are looked at in"
+
+    def minimum_image_size(self) -> tuple[int, int]:
+        "The smallest width and height of an image anyone can be found in"
+
+    def detect_batch(
+        self, images: list[np.ndarray]
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        For each image, where people are (as x, y, width, height in that image)
+        and how confident the detector is about each,
+        leaving out people it's less confident about than its threshold
+        """
+
+
+class HOGPersonDetector:
+    """
+    OpenCV's built in HOG people detector
+
+    Images are looked at downscaled by `scale` (and optionally coarse to fine,
+    with just the areas around what was found looked at again at full resolution).
+    """
+
+    needs_color = False
+
+    def __init__(
+        self,
+        *,
+        scale: float = 1,
+        coarse_to_fine: bool = False,
+        confidence_threshold: float = HOG_CONFIDENCE_THRESHOLD,
+        threads: int = 1,
+        parameters: HOGParameters = HOGParameters(),
+    ):
+        self.scale = scale
+        self.coarse_to_fine = coarse_to_fine
+        self.confidence_threshold = confidence_threshold
+        self.threads = threads
+        self.parameters = parameters
+
+        self._hog = None
+
+    def load(self):
+        cv2.setNumThreads(self.threads)
+
+        self._hog = cv2.HOGDescriptor()
+        self._hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def input_size(self, image_size: tuple[int, int]) -> tuple[int, int]:
+        width, height = image_size
+
+        return round(width * self.scale), round(height * self.scale)
+
+    def minimum_image_size(self) -> tuple[int, int]:
+        window_width, window_height = HOG_WINDOW_SIZE
+
+        return ceil(window_width / self.scale), ceil(window_height / self.scale)
+
+    def detect_batch(
+        self, images: list[np.ndarray]
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        # HOG has no batching of its own, so this is just one after another
+        results = []
+
+        for image in images:
+            boxes, weights = detect_people(
+                self._hog,
+                image,
+                scale=self.scale,
+                coarse_to_fine=self.coarse_to_fine,
+                parameters=self.parameters,
+            )
+
+            confident = weights >= self.confidence_threshold
+            results.append((boxes[confident], weights[confident]))
+
+        return results
+
+
+class DNNPersonDetector:
+    """
+    A neural network loaded from an ONNX file with OpenCV's DNN module
+
+    Both SSD style outputs (rows of image, class, confidence, and corners,
+    like MobileNet-SSD's) and YOLO style outputs (rows of center, size,
+    and class scores, with or without an objectness score) are understood.
+
+    Pixels are multiplied by `pixel_scale` after `pixel_mean` is subtracted,
+    which depends on how the network was trained. So does the person's class ID,
+    which (unless it's given) is the COCO one for whichever style the output is.
+    """
+
+    needs_color = True
+
+    def __init__(
+        self,
+        model_path: Path,
+        *,
+        input_size: tuple[int, int] = DNN_INPUT_SIZE,
+        confidence_threshold: float = DNN_CONFIDENCE_THRESHOLD,
+        person_class_id: Option[int] = NONE(),
+        pixel_scale: float = DNN_PIXEL_SCALE,
+        pixel_mean: float = DNN_PIXEL_MEAN,
+        threads: int = 1,
+    ):
+        self.model_path = model_path
+        self._input_size = input_size
+        self.confidence_threshold = confidence_threshold
+        self.person_class_id = person_class_id
+        self.pixel_scale = pixel_scale
+        self.pixel_mean = pixel_mean
+        self.threads = threads
+
+        self._network: Optional[cv2.dnn.Net] = None
+        # Networks exported with a fixed batch size of 1 can only look at one at a time
+        self._batches_work = True
+
+    def load(self):
+        cv2.setNumThreads(self.threads)
+
+        self._network = cv2.dnn.readNetFromONNX(str(self.model_path))
+
+    def input_size(self, image_size: tuple[int, int]) -> tuple[int, int]:
+        return self._input_size
+
+    def minimum_image_size(self) -> tuple[int, int]:
+        # Anything smaller is stretched to fit, which is fine
+        return (1, 1)
+
+    def detect_batch(
+        self, images: list[np.ndarray]
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        if len(images) > 1 and self._batches_work:
+            try:
+                return self._detect_together(images)
+            except cv2.error:
+                self._batches_work = False
+
+        results = []
+
+        for image in images:
+            results.extend(self._detect_together([image]))
+
+        return results
+
+    def _detect_together(
+        self, images: list[np.ndarray]
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        # Frames are already RGB, so red and blue don't need swapping
+        blob = cv2.dnn.blobFromImages(
+            images,
+            scalefactor=self.pixel_scale,
+            size=self._input_size,
+            mean=(self.pixel_mean,) * 3,
+            swapRB=False,
+            crop=False,
+        )
+
+        assert self._network is not None, "the network has to be loaded first"
+
+        self._network.setInput(blob)
+        output = self._network.forward()
+
+        image_sizes = [(image.shape[1], image.shape[0]) for image in images]
+
+        if output.shape[-1] == 7:
+            return parse_ssd_output(
+                output,
+                image_sizes=image_sizes,
+                person_class_id=self.person_class_id.unwrap_or(SSD_PERSON_CLASS_ID),
+                confidence_threshold=self.confidence_threshold,
+            )
+
+        return [
+            parse_yolo_output(
+                image_output,
+                input_size=self._input_size,
+                image_size=image_size,
+                person_class_id=self.person_class_id.unwrap_or(YOLO_PERSON_CLASS_ID),
+                confidence_threshold=self.confidence_threshold,
+            )
+            for (image_output, image_size) in zip(output, image_sizes)
+        ]
+
+
+def parse_ssd_output(
+    output: np.ndarray,
+    *,
+    image_sizes: list[tuple[int, int]],
+    person_class_id: int,
+    confidence_threshold: float,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    People in an SSD style output, whose rows are which image in the batch,
+    the class, the confidence, and the corners (as fractions of the image's size)
+    """
+
+    rows = output.reshape(-1, 7)
+
+    results = []
+
+    for (index, (width, height)) in enumerate(image_sizes):
+        people = rows[
+            (rows[:, 0] == index)
+            & (rows[:, 1] == person_class_id)
+            & (rows[:, 2] >= confidence_threshold)
+        ]
+
+        corners = np.clip(people[:, 3:7], 0, 1) * [width, height, width, height]
+        boxes = np.column_stack(
+            [corners[:, 0:2], corners[:, 2:4] - corners[:, 0:2]]
+        ).reshape(-1, 4)
+
+        results.append((np.rint(boxes).astype(int), people[:, 2].astype(float)))
+
+    return results
+
+
+def parse_yolo_output(
+    output: np.ndarray,
+    *,
+    input_size: tuple[int, int],
+    image_size: tuple[int, int],
+    person_class_id: int,
+    confidence_threshold: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    People in one image's YOLO style output, whose rows are the center and size
+    (in the network's input's pixels), then an objectness score (before YOLOv8),
+    then a score for each of the 80 COCO classes
+    """
+
+    rows = output.reshape(-1, output.shape[-1])
+
+    # YOLOv8 has a row per value rather than per box
+    if rows.shape[1] not in (84, 85) and rows.shape[0] in (84, 85):
+        rows = rows.T
+
+    if rows.shape[1] == 85:
+        confidences = rows[:, 4] * rows[:, 5 + person_class_id]
+    elif rows.shape[1] == 84:
+        confidences = rows[:, 4 + person_class_id]
+    else:
+        raise ValueError(
+            f"YOLO outputs need 84 or 85 values per box, not {rows.shape[1]}"
+        )
+
+    confident = confidences >= confidence_threshold
+    rows = rows[confident]
+    confidences = confidences[confident]
+
+    input_width, input_height = input_size
+    width, height = image_size
+
+    centers_and_sizes = rows[:, 0:4] * [
+        width / input_width,
+        height / input_height,
+        width / input_width,
+        height / input_height,
+    ]
+    boxes = np.column_stack(
+        [
+            centers_and_sizes[:, 0:2] - centers_and_sizes[:, 2:4] / 2,
+            centers_and_sizes[:, 2:4],
+        ]
+    ).reshape(-1, 4)
+
+    # YOLO finds everyone several times over, in slightly different boxes
+    boxes, confidences = non_max_suppression(boxes, confidences)
+
+    return np.rint(boxes).astype(int), confidences.astype(float)
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    weights: np.ndarray,
+    *,
+    overlap_threshold: float = NMS_OVERLAP_THRESHOLD,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Only the most confident of each group of boxes (as x, y, width, height)
+    that overlap more than `overlap_threshold` (intersection over union),
+    most confident first
+    """
+
+    if len(boxes) == 0:
+        return boxes.reshape(-1, 4), weights.reshape(-1)
+
+    kept = np.asarray(
+        cv2.dnn.NMSBoxes(
+            np.asarray(boxes, dtype=float).tolist(),
+            # Shifted to be above 0 (which OpenCV only keeps) keeping their order,
+            # since they were already thresholded by the person detector
+            (np.asarray(weights, dtype=float) - np.min(weights) + 1).tolist(),
+            0,
+            overlap_threshold,
+        ),
+        dtype=int,
+    ).reshape(-1)
+
+    return boxes[kept], weights[kept]
+
+
+def parse_person_detector(
+    description: str,
+    *,
+    confidence_threshold: Option[float],
+    input_size: Option[tuple[int, int]],
+    scale: float,
+    coarse_to_fine: bool,
+    threads: int,
+    hog_parameters: HOGParameters = HOGParameters(),
+    person_class_id: Option[int] = NONE(),
+    pixel_scale: Option[float] = NONE(),
+    pixel_mean: Option[float] = NONE(),
+) -> PersonDetector:
+    """
+    Make a person detector from a description like the ones
+    the HUMAN_DETECTOR environment variable is set to: `hog` or `dnn:<path>`
+    """
+
+    kind, _separator, argument = description.partition(":")
+
+    if kind == "hog" and not argument:
+        if input_size.is_some():
+            raise ValueError("HOG's input size comes from the scale instead")
+
+        if person_class_id.is_some() or pixel_scale.is_some() or pixel_mean.is_some():
+            raise ValueError(
+                "HOG doesn't have a person class ID, pixel scale, or pixel mean"
+            )
+
+        return HOGPersonDetector(
+            scale=scale,
+            coarse_to_fine=coarse_to_fine,
+            confidence_threshold=confidence_threshold.unwrap_or(
+                HOG_CONFIDENCE_THRESHOLD
+            ),
+            threads=threads,
+            parameters=hog_parameters,
+        )
+
+    if kind == "dnn" and argument:
+        model_path = Path(argument)
+
+        if not model_path.is_file():
+            raise ValueError(f"there's no model at {model_path}")
+
+        return DNNPersonDetector(
+            model_path,
+            input_size=input_size.unwrap_or(DNN_INPUT_SIZE),
+            confidence_threshold=confidence_threshold.unwrap_or(
+                DNN_CONFIDENCE_THRESHOLD
+            ),
+            person_class_id=person_class_id,
+            pixel_scale=pixel_scale.unwrap_or(DNN_PIXEL_SCALE),
+            pixel_mean=pixel_mean.unwrap_or(DNN_PIXEL_MEAN),
+            threads=threads,
+        )
+
+    raise ValueError(f"{description!r} needs to be hog or dnn:<path>")
+
+
+def parse_input_size(description: str) -> tuple[int, int]:
+    "A width and height like `320x320`"
+
+    width, separator, height = description.partition("x")
+
+    if not separator or not width.isdigit() or not height.isdigit():
+        raise ValueError(f"{description!r} needs to be a width and height like 320x320")
+
+    return int(width), int(height)
+
+
+def detect_people(
+    hog,
+    grayscale: np.ndarray,
+    *,
+    scale: float,
+    coarse_to_fine: bool,
+    parameters: HOGParameters = HOGParameters(),
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Where people are (as x, y, width, height in the full resolution image)
+    and how confident HOG is about each
+    """
+
+    boxes, weights = detect_at_scale(hog, grayscale, scale, parameters)
+
+    if not coarse_to_fine or scale >= 1 or len(boxes) == 0:
+        return boxes, weights
+
+    # Only what was found at the coarse scale is looked at closely,
+    # which also drops whatever was only found because of the lost detail
+    fine_boxes = []
+    fine_weights = []
+
+    for (x_start, y_start, x_end, y_end) in regions_around(
+        boxes, image_size=(grayscale.shape[1], grayscale.shape[0])
+    ):
+        region_boxes, region_weights = detect_at_scale(
+            hog, grayscale[y_start:y_end, x_start:x_end], 1, parameters
+        )
+
+        fine_boxes.append(region_boxes + [x_start, y_start, 0, 0])
+        fine_weights.append(region_weights)
+
+    return np.concatenate(fine_boxes), np.concatenate(fine_weights)
+
+
+def detect_at_scale(
+    hog,
+    grayscale: np.ndarray,
+    scale: float,
+    parameters: HOGParameters = HOGParameters(),
+) -> tuple[np.ndarray, np.ndarray]:
+    "Run HOG on the image downscaled, with the boxes scaled back up to the image's size"
+
+    height, width = grayscale.shape[:2]
+
+    scaled_width = round(width * scale)
+    scaled_height = round(height * scale)
+
+    window_width, window_height = HOG_WINDOW_SIZE
+
+    # Too small for anyone to fit
+    if scaled_width < window_width or scaled_height < window_height:
+        return np.empty((0, 4), dtype=int), np.empty(0)
+
+    if scale == 1:
+        scaled = grayscale
+    else:
+        # Area averaging doesn't alias the edges HOG looks at like skipping pixels does
+        scaled = cv2.resize(
+            grayscale, (scaled_width, scaled_height), interpolation=cv2.INTER_AREA
+        )
+
+    boxes, weights = hog.detectMultiScale(
+        scaled,
+        winStride=parameters.win_stride,
+        padding=parameters.padding,
+        scale=parameters.pyramid_scale,
+    )
+
+    # From the scaled image back to the original one (each axis rounded on its own)
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    boxes *= [
+        width / scaled_width,
+        height / scaled_height,
+        width / scaled_width,
+        height / scaled_height,
+    ]
+
+    return np.rint(boxes).astype(int), np.asarray(weights, dtype=float).reshape(-1)
+
+
+def regions_around(
+    boxes: np.ndarray,
+    *,
+    image_size: tuple[int, int],
+    padding: float = COARSE_TO_FINE_PADDING,
+    minimum_size: tuple[int, int] = HOG_WINDOW_SIZE,
+) -> list[tuple[int, int, int, int]]:
+    """
+    Padded areas (as x start, y start, x end, y end) around boxes
+    (as x, y, width, height), with overlapping ones merged so nothing is scanned twice
+
+    Each box is padded by `padding` (as a fraction of its size) on every side,
+    or more if it's still smaller than `minimum_size` (the image's edges permitting).
+    """
+
+    image_width, image_height = image_size
+    minimum_width, minimum_height = minimum_size
+
+    regions = []
+
+    for (x, y, w, h) in boxes:
+        padding_x = max(round(w * padding), (minimum_width - w + 1) // 2)
+        padding_y = max(round(h * padding), (minimum_height - h + 1) // 2)
+
+        # Shifted away from the image's edges rather than cut off by them
+        x_start, x_end = fit_within(x - padding_x, x + w + padding_x, image_width)
+        y_start, y_end = fit_within(y - padding_y, y + h + padding_y, image_height)
+
+        regions.append([x_start, y_start, x_end, y_end])
+
+    # Keep merging until no two overlap (there are only ever a handful)
+    merged = True
+    while merged:
+        merged = False
+
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [
+                        min(a[0], b[0]),
+                        min(a[1], b[1]),
+                        max(a[2], b[2]),
+                        max(a[3], b[3]),
+                    ]
+                    del regions[j]
+                    merged = True
+                    break
+
+            if merged:
+                break
+
+    return [
+        (x_start, y_start, x_end, y_end) for [x_start, y_start, x_end, y_end] in regions
+    ]
+
+
+def fit_within(start: int, end: int, length: int) -> tuple[int, int]:
+    "Move a span to be within 0 and the length (and then cut it to fit if it's still too long)"
+
+    if start < 0:
+        start, end = 0, end - start
+    elif end > length:
+        start, end = start - (end - length), length
+
+    return max(start, 0), min(end, length)
@@ -0,0 +1,416 @@
+"""
+Module: 02. Human detection
+
+Following people between scans, so they don't need finding every time
+
+Each person found gets a track with an ID that stays the same for as long as
+they're followed. Scans are seconds apart, which is too far for optical flow,
+so while there are tracks they're followed through a few frames a second
+in between: points inside each track's box are followed
+with (pyramidal Lucas-Kanade) optical flow, and the box moves by however much
+most of its points did. A point only counts if following it back lands where
+it started, and a track that's left with too few of those (like when someone
+moved too far since the last frame) is lost.
+
+When people are looked for again, who was found is matched up with the tracks
+by how much their boxes overlap, so the same person keeps the same track ID.
+"""
+
+from dataclasses import dataclass
+from time import monotonic, perf_counter
+from typing import Callable
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option, Some
+
+from .detection_scheduler import OCCUPIED_INTERVAL_SECONDS
+
+# Optical flow on a smaller frame is much cheaper and plenty accurate for a box
+TRACKING_WIDTH = 320
+
+# Points followed in each track's box
+POINTS_PER_TRACK = 20
+
+# A track with fewer points than this that could be followed is lost
+MINIMUM_POINTS_FOLLOWED = 4
+
+# How far (in tracking pixels) following a point back can land from where it started
+MAXIMUM_FORWARD_BACKWARD_ERROR = 1.0
+
+# Boxes found and tracked have to overlap this much (intersection over union)
+# to be the same person
+MINIMUM_OVERLAP = 0.3
+
+# Each track drifts a little every time it's followed, so people are looked for
+# again at least this often (at most every other scan while they're around but still)
+MAXIMUM_SECONDS_TRACKED = 2 * OCCUPIED_INTERVAL_SECONDS
+
+OPTICAL_FLOW_WINDOW_SIZE = (21, 21)
+OPTICAL_FLOW_PYRAMID_LEVELS = 3
+OPTICAL_FLOW_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+
+
+@dataclass
+class Track:
+    "Someone being followed"
+
+    track_id: int
+    # Where they are in the frame, as x start, y start, x end, y end
+    box: np.ndarray
+    # How confident the person detector was when they were last found
+    confidence: float
+
+
+@dataclass
+class PersonTrackerStatistics:
+    "How following people's been going, for logging"
+
+    frames: int = 0
+    # Frames nobody needed to be looked for in since everyone was followed
+    tracked_frames: int = 0
+    # Frames people were looked for in
+    detected_frames: int = 0
+    # Tracks that were lost or not found again
+    lost: int = 0
+    # Of every frame, how many tracks there were
+    total_tracks: int = 0
+    # Of every frame, how long following the tracks took
+    total_seconds: float = 0.0
+
+    def average_tracks(self) -> float:
+        "How many tracks there were in each frame"
+
+        if self.frames == 0:
+            return 0.0
+
+        return self.total_tracks / self.frames
+
+    def average_milliseconds(self) -> float:
+        "How long following the tracks took in each frame"
+
+        if self.frames == 0:
+            return 0.0
+
+        return 1000 * self.total_seconds / self.frames
+
+
+class PersonTracker:
+    "Keeps track of where each person is, and who's who"
+
+    def __init__(self, *, clock: Callable[[], float] = monotonic):
+        self.tracks: list[Track] = []
+        self.statistics = PersonTrackerStatistics()
+
+        self._clock = clock
+        # When people were last looked for (in the clock's time)
+        self._detected_at = clock()
+        # Whether anyone's been lost since then
+        self._lost_since_detected = False
+
+        # The last frame followed (shrunk for tracking) and how much it was shrunk by
+        self._previous: Option[tuple[np.ndarray, float]] = NONE()
+        self._next_track_id = 0
+
+    def follow(self, grayscale: np.ndarray) -> bool:
+        "Move the tracks along to a new frame, returning whether none were lost"
+
+        started_at = perf_counter()
+
+        height, width = grayscale.shape[:2]
+        scale = min(TRACKING_WIDTH / width, 1.0)
+
+        small = cv2.resize(
+            grayscale,
+            (max(round(width * scale), 1), max(round(height * scale), 1)),
+            interpolation=cv2.INTER_AREA,
+        )
+
+        followed_all = True
+
+        if self.tracks:
+            if (
+                self._previous.is_none()
+                or self._previous.unwrap()[0].shape != small.shape
+            ):
+                # Nothing to follow them from
+                followed_all = False
+                self._lose(self.tracks)
+                self.tracks = []
+            else:
+                previous, previous_scale = self._previous.unwrap()
+
+                # The camera's resolution changes with whatever else is using it,
+                # but frames shrunk for tracking are the same size at any of them
+                for track in self.tracks:
+                    track.box = track.box * (previous_scale / scale)
+
+                followed_all = self._follow(previous, small, scale)
+
+        self._previous = Some((small, scale))
+
+        self.statistics.frames += 1
+        self.statistics.total_tracks += len(self.tracks)
+        self.statistics.total_seconds += perf_counter() - started_at
+
+        return followed_all
+
+    def covers(self, regions: list[tuple[int, int, int, int]]) -> bool:
+        "Whether every region (as x start, y start, x end, y end) overlaps a track"
+
+        if not regions:
+            return True
+
+        if not self.tracks:
+            return False
+
+        return bool(
+            overlapping(regions, [track.box for track in self.tracks]).any(axis=1).all()
+        )
+
+    def needs_detection(self) -> bool:
+        """
+        Whether anyone's been lost since people were last looked for,
+        or the tracks have been followed for long enough that they need correcting
+        """
+
+        return (
+            self._lost_since_detected
+            or self._clock() - self._detected_at >= MAXIMUM_SECONDS_TRACKED
+        )
+
+    def tracked(self) -> None:
+        "Count a frame where following everyone was enough"
+
+        self.statistics.tracked_frames += 1
+
+    def detected(
+        self,
+        boxes: np.ndarray,
+        confidences: np.ndarray,
+        *,
+        looked_in: Option[list[tuple[int, int, int, int]]],
+    ):
+        """
+        Update the tracks with the people found (as x start, y start, x end, y end),
+        who keep their track ID if they were already being tracked
+
+        If only some regions were looked in, the tracks outside of them
+        are kept as they are (since nobody looked for them).
+        """
+
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+
+        self.statistics.detected_frames += 1
+        self._detected_at = self._clock()
+
+        if looked_in.is_none() or not self.tracks:
+            kept = []
+            looked_for = self.tracks
+        else:
+            inside = np.any(
+                overlapping([track.box for track in self.tracks], looked_in.unwrap()),
+                axis=1,
+            )
+
+            kept = [
+                track
+                for (track, is_inside) in zip(self.tracks, inside)
+                if not is_inside
+            ]
+            looked_for = [
+                track for (track, is_inside) in zip(self.tracks, inside) if is_inside
+            ]
+
+        track_ids: list[Option[int]] = [NONE() for _ in boxes]
+
+        if looked_for and len(boxes) > 0:
+            overlaps = intersection_over_union(
+                boxes, np.array([track.box for track in looked_for])
+            )
+
+            matched_tracks = set()
+
+            # The best matches first, and each box and track can only be matched once
+            for flat_index in np.argsort(overlaps, axis=None)[::-1]:
+                (box_index, track_index) = divmod(int(flat_index), len(looked_for))
+
+                if overlaps[box_index, track_index] < MINIMUM_OVERLAP:
+                    break
+
+                if track_ids[box_index].is_some() or track_index in matched_tracks:
+                    continue
+
+                track_ids[box_index] = Some(looked_for[track_index].track_id)
+                matched_tracks.add(track_index)
+
+        matched = {track_id.unwrap() for track_id in track_ids if track_id.is_some()}
+        self._lose([track for track in looked_for if track.track_id not in matched])
+
+        self.tracks = kept
+
+        for (box, confidence, track_id) in zip(boxes, confidences, track_ids):
+            if track_id.is_none():
+                track_id = Some(self._next_track_id)
+                self._next_track_id += 1
+
+            self.tracks.append(Track(track_id.unwrap(), box, float(confidence)))
+
+        self._lost_since_detected = False
+
+    def _follow(self, previous: np.ndarray, current: np.ndarray, scale: float) -> bool:
+        # Points to follow inside each track's box, all followed at once
+        all_points = []
+        # The index of the track each point is in
+        all_owners = []
+
+        for (index, track) in enumerate(self.tracks):
+            points = points_inside(previous, track.box * scale)
+
+            all_points.append(points)
+            all_owners.append(np.full(len(points), index))
+
+        points = np.concatenate(all_points).astype(np.float32).reshape((-1, 1, 2))
+        owners = np.concatenate(all_owners)
+
+        if len(points) == 0:
+            self._lose(self.tracks)
+            self.tracks = []
+            return False
+
+        (forward, status) = follow_points(previous, current, points)
+        (backward, back_status) = follow_points(current, previous, forward)
+
+        forward_backward_error = np.linalg.norm(
+            (points - backward).reshape(-1, 2), axis=1
+        )
+        good = (
+            status
+            & back_status
+            & (forward_backward_error <= MAXIMUM_FORWARD_BACKWARD_ERROR)
+        )
+
+        moved = (forward - points).reshape(-1, 2) / scale
+
+        followed = []
+        lost = []
+
+        for (index, track) in enumerate(self.tracks):
+            mine = good & (owners == index)
+
+            if np.count_nonzero(mine) < MINIMUM_POINTS_FOLLOWED:
+                lost.append(track)
+                continue
+
+            shift_x, shift_y = np.median(moved[mine], axis=0)
+            track.box = track.box + [shift_x, shift_y, shift_x, shift_y]
+            followed.append(track)
+
+        self._lose(lost)
+        self.tracks = followed
+
+        return not lost
+
+    def _lose(self, tracks: list[Track]):
+        self.statistics.lost += len(tracks)
+
+        if tracks:
+            self._lost_since_detected = True
+
+
+def follow_points(
+    previous: np.ndarray, current: np.ndarray, points: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    "Where each point moved to between two frames, and whether it could be followed"
+
+    moved_to: np.ndarray
+    status: np.ndarray
+    (moved_to, status, _error) = cv2.calcOpticalFlowPyrLK(
+        previous,
+        current,
+        points,
+        np.empty_like(points),
+        winSize=OPTICAL_FLOW_WINDOW_SIZE,
+        maxLevel=OPTICAL_FLOW_PYRAMID_LEVELS,
+        criteria=OPTICAL_FLOW_CRITERIA,
+    )
+
+    return moved_to, status.reshape(-1) == 1
+
+
+def points_inside(grayscale: np.ndarray, box: np.ndarray) -> np.ndarray:
+    "Good points to follow inside a box (as x start, y start, x end, y end)"
+
+    height, width = grayscale.shape[:2]
+    x_start, y_start, x_end, y_end = np.clip(
+        np.rint(box).astype(int), 0, [width, height, width, height]
+    )
+
+    if x_end - x_start < 2 or y_end - y_start < 2:
+        return np.empty((0, 2), dtype=np.float32)
+
+    mask = np.zeros_like(grayscale)
+    mask[y_start:y_end, x_start:x_end] = 255
+
+    corners = cv2.goodFeaturesToTrack(
+        grayscale,
+        maxCorners=POINTS_PER_TRACK,
+        qualityLevel=0.01,
+        minDistance=3,
+        mask=mask,
+    )
+
+    if corners is None:
+        return np.empty((0, 2), dtype=np.float32)
+
+    return corners.reshape(-1, 2)
+
+
+def overlapping(boxes, others) -> np.ndarray:
+    """
+    Whether each of the boxes overlaps each of the others
+    (all as x start, y start, x end, y end), with a row per box
+    """
+
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 1, 4)
+    others = np.asarray(others, dtype=float).reshape(1, -1, 4)
+
+    return (
+        (boxes[..., 0] < others[..., 2])
+        & (others[..., 0] < boxes[..., 2])
+        & (boxes[..., 1] < others[..., 3])
+        & (others[..., 1] < boxes[..., 3])
+    )
+
+
+def intersection_over_union(boxes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    How much each of the boxes overlaps each of the others
+    (all as x start, y start, x end, y end), with a row per box
+    """
+
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 1, 4)
+    others = np.asarray(others, dtype=float).reshape(1, -1, 4)
+
+    intersection_width = np.clip(
+        np.minimum(boxes[..., 2], others[..., 2])
+        - np.maximum(boxes[..., 0], others[..., 0]),
+        0,
+        None,
+    )
+    intersection_height = np.clip(
+        np.minimum(boxes[..., 3], others[..., 3])
+        - np.maximum(boxes[..., 1], others[..., 1]),
+        0,
+        None,
+    )
+    intersection = intersection_width * intersection_height
+
+    def area(corners: np.ndarray) -> np.ndarray:
+        return (corners[..., 2] - corners[..., 0]) * (corners[..., 3] - corners[..., 1])
+
+    union = area(boxes) + area(others) - intersection
+
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
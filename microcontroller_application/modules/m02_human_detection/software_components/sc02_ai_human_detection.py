@@ -1,15 +1,57 @@
 """
 Module: 02. Human detection
 Component: 02. AI human detection
+
+When to look for people is up to the detection scheduler, which hears about
+motion and occupancy, and about how much changed and how long each scan took.
+
+The camera only captures while something needs its frames,
+so it's asked for frames from when a scan starts
+until a fresh frame has been received.
+
+People are looked for by whichever person detector is configured
+(see the person detectors), in worker processes (see the detection pool).
+Overlapping boxes are narrowed down to the most confident of each,
+and wherever people were found, they're cropped out of the full resolution color frame
+(all the same size, and packed together, see the person crops)
+and sent on with where they are, how confident it is, and which frame they're in.
+
+Only the areas around what changed since the background was learned are looked at
+(see the foreground gate), and when nothing changed, nobody's looked for at all.
+
+Everyone found is followed between scans (see the person tracker), through
+a few frames a second that the camera's asked for while anyone's being followed,
+so when the only things that changed are people who were followed there,
+they aren't looked for again either.
+
+And a frame that looks like one that was scanned recently (see the detection cache)
+reuses what that scan found.
+
+Parts of the room nobody's worth finding in can be left out (see the detection mask).
+
+With more than one camera, each scan is of one of them, with the time spent scanning
+shared between them by how much each has been seeing change (see the camera scheduler).
+Each camera keeps its own background, tracks, remembered scans, and mask,
+and everyone each camera saw in its latest scan (unless that's too old to go by)
+is sent on together, as the people in the room.
 """
 
-from asyncio import Event, gather, sleep, to_thread
+from asyncio import Event, create_task, gather
+from dataclasses import dataclass, field, replace
+from itertools import chain
+from pathlib import Path
+from time import monotonic, perf_counter
 
 import bounded_channel
-import cv2
 import numpy as np
+from option_and_result import NONE, Option, Some
 
 from microcontroller_application.interfaces.message_types import (
+    MAIN_CAMERA,
+    CameraConsumer,
+    CameraProfile,
+    Detection,
+    FromCameraConsumerToEnvironment,
     FromEnvironmentToHumanDetectionCameraFrame,
     FromEnvironmentToHumanDetectionMotion,
     FromEnvironmentToHumanDetectionOccupancy,
@@ -17,10 +59,68 @@ from microcontroller_application.interfaces.message_types import (
     FromHumanDetectionToPersonIdentification,
 )
 from microcontroller_application.log import get_logger
-from utils.asynchronous import at_least_one
+from utils import watch
+from utils.frames import Frame
+
+from ..camera_scheduler import CameraScheduler
+from ..detection_cache import (
+    CachedDetection,
+    DetectionCache,
+    normalized,
+    perceptual_hash,
+)
+from ..detection_mask import (
+    DetectionMask,
+    RasterizedMask,
+    load_detection_mask,
+    mask_path_for_camera,
+)
+from ..detection_pool import DetectionPool
+from ..detection_scheduler import DetectionScheduler
+from ..foreground_gate import ForegroundGate
+from ..person_crops import crop_people
+from ..person_detectors import PersonDetector, non_max_suppression
+from ..person_tracker import PersonTracker, Track
 
 LOGGER = get_logger(__name__)
 
+# Only one frame is needed per scan, but asking for a few a second
+# means not waiting long for it
+CAMERA_FRAMES_PER_SECOND = 4.0
+
+# Tracks are followed through this many frames a second between scans
+# (optical flow can't follow anyone through the seconds between scans)
+TRACKING_FRAMES_PER_SECOND = 4.0
+
+# How often the statistics are logged
+STATISTICS_LOG_PERIOD_SECONDS = 60
+
+
+@dataclass
+class Camera:
+    "What's kept about each camera between scans of it"
+
+    camera_id: int
+    from_environment_camera_frame: watch.Receiver[
+        FromEnvironmentToHumanDetectionCameraFrame
+    ]
+    foreground_gate: Option[ForegroundGate]
+    person_tracker: PersonTracker
+    detection_cache: Option[DetectionCache]
+    detection_mask: Option[DetectionMask]
+    # The results (and crops) for the last frame that changed (and its shape),
+    # reused for frames that look the same
+    last_detection: Option[
+        tuple[int, tuple[int, ...], list[Detection], np.ndarray]
+    ] = NONE()
+    # When its latest scan was (in the time.monotonic clock),
+    # and who it saw then (and their crops)
+    latest: Option[tuple[float, list[Detection], np.ndarray]] = NONE()
+    # Set while there are tracks to follow between scans
+    people_to_follow: Event = field(default_factory=Event)
+    # Whether a scan of it is under way (which follows the tracks itself)
+    scanning: bool = False
+
 
 async def run(
     *,
@@ -30,8 +130,8 @@ async def run(
     from_environment_occupancy: bounded_channel.Receiver[
         FromEnvironmentToHumanDetectionOccupancy
     ],
-    from_environment_camera_frame: bounded_channel.Receiver[
-        FromEnvironmentToHumanDetectionCameraFrame
+    from_environment_camera_frames: list[
+        watch.Receiver[FromEnvironmentToHumanDetectionCameraFrame]
     ],
     to_activity_recognition: bounded_channel.Sender[
         FromHumanDetectionToActivityRecognition
@@ -39,56 +139,164 @@ async def run(
     to_person_identification: bounded_channel.Sender[
         FromHumanDetectionToPersonIdentification
     ],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
+    person_detector: PersonDetector,
+    detection_processes: int,
+    detection_maximum_in_flight: int,
+    foreground_gating: bool,
+    person_tracking: bool,
+    detection_cpu_budget: float,
+    detection_cache_size: int,
+    detection_cache_tolerance: int,
+    detection_mask_path: Path,
 ):
-    "Run the AI human detection software component"
+    """
+    Run the AI human detection software component
+    (with a frame receiver for each camera, in order of their IDs)
+    """
 
     LOGGER.debug("startup")
 
-    requested_human_detection = Event()
+    cameras = [
+        Camera(
+            camera_id=camera_id,
+            from_environment_camera_frame=from_environment_camera_frame,
+            foreground_gate=Some(ForegroundGate()) if foreground_gating else NONE(),
+            person_tracker=PersonTracker(),
+            detection_cache=(
+                Some(
+                    DetectionCache(
+                        size=detection_cache_size,
+                        tolerance=detection_cache_tolerance,
+                    )
+                )
+                if detection_cache_size > 0
+                else NONE()
+            ),
+            detection_mask=load_detection_mask(
+                mask_path_for_camera(detection_mask_path, camera_id)
+            ),
+        )
+        for (camera_id, from_environment_camera_frame) in enumerate(
+            from_environment_camera_frames
+        )
+    ]
 
-    occupied = Event()
+    detection_pool = DetectionPool(
+        person_detector,
+        processes=detection_processes,
+        maximum_in_flight=detection_maximum_in_flight,
+    )
 
-    # Run all the tasks concurrently
-    await gather(
-        check_motion_sensor(
-            from_environment_motion=from_environment_motion,
-            requested_human_detection=requested_human_detection,
-        ),
-        check_occupancy_sensor(
-            from_environment_occupancy=from_environment_occupancy,
-            occupied=occupied,
-            requested_human_detection=requested_human_detection,
-        ),
-        interval_while_occupied(
-            occupied=occupied,
-            requested_human_detection=requested_human_detection,
-        ),
-        slow_interval(
-            requested_human_detection=requested_human_detection,
-        ),
-        # This is defined in the next code sample
-        do_human_detection_when_triggered(
-            from_environment_camera_frame=from_environment_camera_frame,
-            to_activity_recognition=to_activity_recognition,
-            to_person_identification=to_person_identification,
-            requested_human_detection=requested_human_detection,
-        ),
+    detection_scheduler = DetectionScheduler(
+        cpu_budget=detection_cpu_budget, cameras=len(cameras)
     )
 
+    # Following people is only any use while there are scans to follow them between
+    followers = [
+        create_task(
+            follow_people_between_scans(
+                camera=camera,
+                to_environment_camera_demand=to_environment_camera_demand,
+            )
+        )
+        for camera in cameras
+        if person_tracking
+    ]
+
+    # Run all the tasks concurrently
+    try:
+        await gather(
+            check_motion_sensor(
+                from_environment_motion=from_environment_motion,
+                detection_scheduler=detection_scheduler,
+            ),
+            check_occupancy_sensor(
+                from_environment_occupancy=from_environment_occupancy,
+                detection_scheduler=detection_scheduler,
+            ),
+            do_human_detection_when_triggered(
+                cameras=cameras,
+                to_activity_recognition=to_activity_recognition,
+                to_person_identification=to_person_identification,
+                to_environment_camera_demand=to_environment_camera_demand,
+                detection_scheduler=detection_scheduler,
+                camera_scheduler=CameraScheduler(len(cameras)),
+                detection_pool=detection_pool,
+                person_tracking=person_tracking,
+            ),
+        )
+    finally:
+        for follower in followers:
+            follower.cancel()
+
+        detection_pool.close()
+
     LOGGER.debug("shutdown")
 
 
+async def follow_people_between_scans(
+    *,
+    camera: Camera,
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
+):
+    "Follow a camera's tracks through a few frames a second for as long as there are any"
+
+    # Its own receiver, so scans still get the newest frame too
+    from_environment_camera_frame = camera.from_environment_camera_frame.clone()
+    person_tracker = camera.person_tracker
+
+    while True:
+        await camera.people_to_follow.wait()
+
+        await to_environment_camera_demand.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.PERSON_TRACKING,
+                TRACKING_FRAMES_PER_SECOND,
+                CameraProfile.DETECTION,
+                camera.camera_id,
+            )
+        )
+
+        while person_tracker.tracks:
+            message_option = await from_environment_camera_frame.recv()
+
+            if message_option.is_none():
+                return
+
+            with message_option.unwrap().frame as frame:
+                # Nothing to follow anyone through if nothing changed
+                if not camera.scanning and not frame.unchanged:
+                    person_tracker.follow(frame.grayscale())
+
+        # Everyone's been lost, so until the next scan finds someone
+        camera.people_to_follow.clear()
+
+        await to_environment_camera_demand.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.PERSON_TRACKING,
+                0,
+                CameraProfile.DETECTION,
+                camera.camera_id,
+            )
+        )
+
+
 async def check_motion_sensor(
     *,
     from_environment_motion: bounded_channel.Receiver[
         FromEnvironmentToHumanDetectionMotion
     ],
-    requested_human_detection: Event,
+    detection_scheduler: DetectionScheduler,
 ):
     async for message in from_environment_motion:
         # Run human detection once motion is detected
         if message.new_state:
-            requested_human_detection.set()
+            detection_scheduler.request()
 
 
 async def check_occupancy_sensor(
@@ -96,128 +304,600 @@ async def check_occupancy_sensor(
     from_environment_occupancy: bounded_channel.Receiver[
         FromEnvironmentToHumanDetectionOccupancy
     ],
-    occupied: Event,
-    requested_human_detection: Event,
+    detection_scheduler: DetectionScheduler,
 ):
     async for message in from_environment_occupancy:
-        # Run human detection once occupancy is detected
-        if message.new_state:
-            occupied.set()
-            requested_human_detection.set()
-        else:
-            occupied.clear()
-
-
-async def interval_while_occupied(
-    *,
-    occupied: Event,
-    requested_human_detection: Event,
-):
-    while True:
-        # Wait until the event is set
-        await occupied.wait()
-        await sleep(15)
-        # The occupied event could have been cleared since, but that’s okay
-        # It’s just one extra human detection scan that wasn’t needed
-        requested_human_detection.set()
-
-
-async def slow_interval(
-    *,
-    requested_human_detection: Event,
-):
-    while True:
-        await sleep(5 * 60)
-        requested_human_detection.set()
+        # Run human detection once occupancy is detected (and more often while it is)
+        detection_scheduler.set_occupied(message.new_state)
 
 
 async def do_human_detection_when_triggered(
     *,
-    from_environment_camera_frame: bounded_channel.Receiver[
-        FromEnvironmentToHumanDetectionCameraFrame
-    ],
+    cameras: list[Camera],
     to_activity_recognition: bounded_channel.Sender[
         FromHumanDetectionToActivityRecognition
     ],
     to_person_identification: bounded_channel.Sender[
         FromHumanDetectionToPersonIdentification
     ],
-    requested_human_detection: Event,
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
+    detection_scheduler: DetectionScheduler,
+    camera_scheduler: CameraScheduler,
+    detection_pool: DetectionPool,
+    person_tracking: bool,
 ):
-    hog = cv2.HOGDescriptor()
-    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+    reused_count = 0
+    # Scans that were skipped because nothing moved
+    skipped_count = 0
+
+    statistics_logged_at = monotonic()
 
     while True:
-        await requested_human_detection.wait()
+        await detection_scheduler.wait()
+
+        camera = cameras[camera_scheduler.next_camera()]
+        foreground_gate = camera.foreground_gate
+        person_tracker = camera.person_tracker
+        detection_cache = camera.detection_cache
+        detection_mask = camera.detection_mask
+
         LOGGER.info(
-            "performing human detection once an image is received from the camera..."
+            "performing human detection once an image is received from camera %d...",
+            camera.camera_id,
         )
 
-        # This is expected to finish immediately in most situations
-        message_option = (
-            await from_environment_camera_frame.recv()
-        )  # TODO: switch to the pusher/puller thing I need to make
+        requested_at = monotonic()
+
+        # The camera may have been idle, so start it up
+        await to_environment_camera_demand.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.HUMAN_DETECTION,
+                CAMERA_FRAMES_PER_SECOND,
+                CameraProfile.DETECTION,
+                camera.camera_id,
+            )
+        )
+
+        # This is expected to finish quickly in most situations
+        # (since it's the newest frame rather than the oldest unread one)
+        # but the newest frame could be from before the camera last went idle,
+        # so wait for one captured since the request
+        message_option = await receive_frame_captured_since(
+            camera.from_environment_camera_frame, requested_at
+        )
+
+        # And it can go back to idling (unless something else needs it)
+        await to_environment_camera_demand.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.HUMAN_DETECTION,
+                0,
+                CameraProfile.DETECTION,
+                camera.camera_id,
+            )
+        )
 
         if message_option.is_none():
             break
 
         message = message_option.unwrap()
 
-        image = message.frame
+        # The camera's time isn't counted, just the work on the frame
+        started_at = perf_counter()
+
+        # What the results are sent as being for (even once the frame's released)
+        frame_id = message.frame.frame_id
+        captured_at = message.frame.captured_at
+
+        camera.scanning = True
+
+        with message.frame as frame:
+            # Only reused for frames the same size as the one they're for,
+            # since the resolution changes with whatever else is using the camera
+            last_detection = camera.last_detection.filter(
+                lambda detection: detection[1] == frame.array.shape
+            )
+
+            if (
+                last_detection.is_some()
+                and last_detection.unwrap()[0] == frame.key_frame_id
+            ):
+                # Nothing in view has changed since the last scan,
+                # so neither would what it found
+                _key_frame_id, _shape, detections, crops = last_detection.unwrap()
+                change = 0.0
+                reused_count += 1
+
+                LOGGER.info(
+                    "reused the last human detection results for unchanged frame %d "
+                    "(%d times so far)",
+                    frame.frame_id,
+                    reused_count,
+                )
+            else:
+                grayscale = frame.grayscale()
+
+                # Cheap enough to do every time, even if they'll be looked for anyway
+                followed_everyone = person_tracker.follow(grayscale)
+
+                minimum_size = detection_pool.person_detector.minimum_image_size()
+
+                # Drawn once for each frame size
+                rasterized_mask = detection_mask.map(
+                    lambda mask: mask.rasterize(grayscale.shape[:2])
+                )
+
+                regions = foreground_gate.map(
+                    lambda gate: gate.regions(
+                        grayscale,
+                        minimum_size=minimum_size,
+                        mask=rasterized_mask.map(lambda mask: mask.bitmap),
+                    )
+                ).unwrap_or(NONE())
+
+                if rasterized_mask.is_some():
+                    # Never any further than where people are looked for
+                    regions = Some(
+                        rasterized_mask.unwrap().clip(
+                            regions.unwrap_or([rasterized_mask.unwrap().bounds]),
+                            minimum_size=minimum_size,
+                        )
+                    )
+
+                # How much of the frame changed (all of it, as far as anyone knows,
+                # without regions)
+                change = regions.map(
+                    lambda regions: fraction_of(regions, frame.array.shape[:2])
+                ).unwrap_or(1.0)
+
+                if regions.is_some() and not regions.unwrap():
+                    # Nothing moved since the background was learned,
+                    # so whoever was found last time is still there (and nobody else)
+                    detections, crops = last_detection.map(
+                        lambda detection: detection[2:]
+                    ).unwrap_or(([], crop_people(frame.array, [])))
+                    skipped_count += 1
+
+                    LOGGER.info(
+                        "skipped human detection since nothing moved (%d times so far)",
+                        skipped_count,
+                    )
+                elif (
+                    person_tracking
+                    and person_tracker.tracks
+                    and followed_everyone
+                    and regions.is_some()
+                    and person_tracker.covers(regions.unwrap())
+                    and not person_tracker.needs_detection()
+                ):
+                    # Everything that moved is someone who was followed there
+                    person_tracker.tracked()
+                    detections, crops = detections_of(
+                        person_tracker.tracks, frame, camera.camera_id
+                    )
+                else:
+                    image_hash = perceptual_hash(grayscale)
+                    cached = detection_cache.map(
+                        lambda cache: cache.get(image_hash)
+                    ).unwrap_or(NONE())
+
+                    if cached.is_some():
+                        # It looks just like a frame that was scanned recently
+                        person_tracker.detected(
+                            cached.unwrap().boxes_in(frame.array.shape),
+                            cached.unwrap().confidences,
+                            looked_in=NONE(),
+                        )
+                        detections, crops = detections_of(
+                            person_tracker.tracks, frame, camera.camera_id
+                        )
+
+                        LOGGER.info(
+                            "reused the human detection results of a frame that looked the same"
+                        )
+                    else:
+                        detection_started_at = perf_counter()
+
+                        # This is a long (multi-second) astoundingly computationally
+                        # expensive process so it's sent to a worker process
+                        # to prevent blocking the main thread. Tasks are
+                        # cooperatively scheduled, so diligence like this is needed.
+                        detections, crops = await do_human_detection(
+                            detection_pool,
+                            frame,
+                            regions,
+                            person_tracker,
+                            rasterized_mask,
+                            camera_id=camera.camera_id,
+                        )
+
+                        if detection_cache.is_some():
+                            # Everyone tracked, even anyone outside the regions looked in
+                            detection_cache.unwrap().put(
+                                image_hash,
+                                CachedDetection(
+                                    boxes=normalized(
+                                        [track.box for track in person_tracker.tracks],
+                                        frame.array.shape,
+                                    ),
+                                    confidences=np.array(
+                                        [
+                                            track.confidence
+                                            for track in person_tracker.tracks
+                                        ]
+                                    ),
+                                    seconds=perf_counter() - detection_started_at,
+                                ),
+                            )
+
+                camera.last_detection = Some(
+                    (frame.key_frame_id, frame.array.shape, detections, crops)
+                )
+
+        camera.scanning = False
+        camera.latest = Some((monotonic(), detections, crops))
+
+        if person_tracker.tracks:
+            camera.people_to_follow.set()
+
+        scan_seconds = perf_counter() - started_at
+        detection_scheduler.finished(
+            seconds=scan_seconds,
+            change=change,
+            people=bool(detections),
+            camera_id=camera.camera_id,
+        )
+        camera_scheduler.finished(camera.camera_id, seconds=scan_seconds, change=change)
+
+        # Everyone in the room, as far as the latest scan of each camera goes
+        detections, crops = in_the_room(current_results(cameras, detection_scheduler))
+
+        if monotonic() - statistics_logged_at >= STATISTICS_LOG_PERIOD_SECONDS:
+            statistics_logged_at = monotonic()
 
-        # This is a long (multi-second) astoundingly computationally expensive process
-        # so calling it is sent to a new thread to prevent blocking the main thread.
-        # Tasks are cooperatively scheduled, so diligence like this is needed.
-        images_of_humans = await to_thread(do_human_detection, hog, image)
-        # do_human_detection is defined in the next code sample
+            report = detection_scheduler.report()
 
-        LOGGER.info("human detection results: %r", images_of_humans)
+            LOGGER.info(
+                "%.1f scans a minute (the CPU budget of %.0f%% allows %.1f), "
+                "using %.1f%% of the time, %.0f ms each on average, "
+                "%d of %d requests coalesced, next due within %.0f s",
+                report.scans_per_minute,
+                100 * report.cpu_budget,
+                report.budgeted_scans_per_minute,
+                100 * report.cpu_used,
+                report.mean_scan_milliseconds,
+                report.coalesced,
+                report.requests,
+                report.interval_seconds,
+            )
 
-        # events remain set until cleared
-        requested_human_detection.clear()
-        # clearing it now means that another human detection request can be serviced
-        # next loop around (i.e. right after either one of these messages is sent:)
+            for each in cameras:
+                log_camera_statistics(each, camera_scheduler)
 
-        to_activity_recognition_message = FromHumanDetectionToActivityRecognition(
-            images_of_humans
+        LOGGER.info(
+            "human detection results: %r",
+            [
+                (
+                    detection.camera_id,
+                    detection.track_id,
+                    detection.box,
+                    detection.confidence,
+                )
+                for detection in detections
+            ],
         )
 
-        to_person_identification_message = FromHumanDetectionToPersonIdentification(
-            images_of_humans
+        # Both get the same crops, which are read-only
+        send_to_both(
+            to_activity_recognition,
+            FromHumanDetectionToActivityRecognition(
+                detections, crops, frame_id, captured_at
+            ),
+            to_person_identification,
+            FromHumanDetectionToPersonIdentification(
+                detections, crops, frame_id, captured_at
+            ),
         )
 
-        await at_least_one(
-            [
-                to_activity_recognition.send(to_activity_recognition_message),
-                to_person_identification.send(to_person_identification_message),
-            ]
+
+def send_to_both(
+    to_activity_recognition: bounded_channel.Sender[
+        FromHumanDetectionToActivityRecognition
+    ],
+    to_activity_recognition_message: FromHumanDetectionToActivityRecognition,
+    to_person_identification: bounded_channel.Sender[
+        FromHumanDetectionToPersonIdentification
+    ],
+    to_person_identification_message: FromHumanDetectionToPersonIdentification,
+) -> bool:
+    """
+    Send a frame's results to both without waiting on either, returning whether they were
+
+    Control pairs their results up by frame, so either both get a frame or neither does
+    (or the one that did would have nothing to be paired with). If either is still
+    working through earlier frames, this one's dropped, since the next scan's are newer.
+    """
+
+    if (
+        to_activity_recognition.capacity() == 0
+        or to_person_identification.capacity() == 0
+    ):
+        LOGGER.info(
+            "dropped results for frame %d since activity recognition "
+            "or person identification is behind",
+            to_activity_recognition_message.frame_id,
+        )
+        return False
+
+    # Nothing can be received in between, so neither of these can find it full
+    to_activity_recognition.try_send(to_activity_recognition_message)
+    to_person_identification.try_send(to_person_identification_message)
+
+    return True
+
+
+def log_camera_statistics(camera: Camera, camera_scheduler: CameraScheduler):
+    share = camera_scheduler.shares[camera.camera_id]
+
+    LOGGER.info(
+        "camera %d was scanned %d times, taking %.1f s, and has a weight of %.2f",
+        camera.camera_id,
+        share.scans,
+        share.seconds,
+        share.weight(),
+    )
+
+    if camera.foreground_gate.is_some():
+        statistics = camera.foreground_gate.unwrap().statistics
+
+        LOGGER.info(
+            "camera %d: %.1f%% of each changed frame scanned on average, "
+            "%d of %d skipped since nothing moved, "
+            "and %d scanned whole",
+            camera.camera_id,
+            100 * statistics.average_fraction_scanned(),
+            statistics.empty,
+            statistics.frames,
+            statistics.full_frames,
         )
 
-        # DEMO manipulation
-        if images_of_humans:
-            await sleep(10.0)
+    if camera.detection_cache.is_some():
+        cache_statistics = camera.detection_cache.unwrap().statistics
+
+        LOGGER.info(
+            "camera %d: %.0f%% of %d scans reused a frame that looked the same, "
+            "saving %.1f s of scanning",
+            camera.camera_id,
+            100 * cache_statistics.hit_rate(),
+            cache_statistics.lookups,
+            cache_statistics.saved_seconds,
+        )
+
+    tracker_statistics = camera.person_tracker.statistics
+
+    LOGGER.info(
+        "camera %d: %.1f people tracked per frame on average, taking %.1f ms each, "
+        "%d of %d frames only tracked (and %d looked for people in), "
+        "and %d tracks lost",
+        camera.camera_id,
+        tracker_statistics.average_tracks(),
+        tracker_statistics.average_milliseconds(),
+        tracker_statistics.tracked_frames,
+        tracker_statistics.frames,
+        tracker_statistics.detected_frames,
+        tracker_statistics.lost,
+    )
+
+
+async def receive_frame_captured_since(
+    from_environment_camera_frame: watch.Receiver[
+        FromEnvironmentToHumanDetectionCameraFrame
+    ],
+    captured_since: float,
+) -> Option[FromEnvironmentToHumanDetectionCameraFrame]:
+    "Receive frames until one was captured at or after the given time.monotonic time"
+
+    while True:
+        message_option = await from_environment_camera_frame.recv()
+
+        if message_option.is_none():
+            return message_option
+
+        message = message_option.unwrap()
+
+        if message.frame.captured_at >= captured_since:
+            return message_option
+
+        message.frame.release()
 
 
+async def do_human_detection(
+    detection_pool: DetectionPool,
+    frame: Frame,
+    regions: Option[list[tuple[int, int, int, int]]],
+    person_tracker: PersonTracker,
+    rasterized_mask: Option[RasterizedMask] = NONE(),
+    *,
+    camera_id: int = MAIN_CAMERA,
+) -> tuple[list[Detection], np.ndarray]:
+    """
+    Find people (in just the regions given, or the whole frame, and only standing
+    where the mask includes), update the tracks with them, and crop everyone tracked out
+    """
+
+    # Some detectors (like HOG) only look at gradients, which are just as visible
+    # without color, and a third of the data is much faster to copy to a worker
+    if detection_pool.person_detector.needs_color:
+        detected_in = frame.array
+    else:
+        detected_in = frame.grayscale()
+
+    if regions.is_none():
+        boxes, weights = await detection_pool.detect(detected_in)
+    else:
+        # A batch for each worker, so a neural network runs once per worker
+        # and HOG (which goes through a batch one at a time) still uses them all
+        region_batches = [
+            regions.unwrap()[start :: detection_pool.processes]
+            for start in range(min(detection_pool.processes, len(regions.unwrap())))
+        ]
+        found_in_batches = await gather(
+            *(
+                detection_pool.detect_batch(
+                    [
+                        detected_in[y_start:y_end, x_start:x_end]
+                        for (x_start, y_start, x_end, y_end) in batch
+                    ]
+                )
+                for batch in region_batches
+            )
+        )
+
+        # From each region's coordinates back to the frame's
+        boxes = np.concatenate(
+            [np.empty((0, 4), dtype=int)]
+            + [
+                region_boxes + [region[0], region[1], 0, 0]
+                for ((region_boxes, _weights), region) in zip(
+                    chain.from_iterable(found_in_batches),
+                    chain.from_iterable(region_batches),
+                )
+            ]
+        )
+        weights = np.concatenate(
+            [np.empty(0)]
+            + [
+                region_weights
+                for (_boxes, region_weights) in chain.from_iterable(found_in_batches)
+            ]
+        )
+
+    # The same person can be found more than once (like in overlapping regions)
+    boxes, weights = non_max_suppression(boxes, weights)
 
-def do_human_detection(hog, image: np.ndarray) -> list[np.ndarray]:
-    boxes, weights = hog.detectMultiScale(image, winStride=(8, 8))
+    height, width = frame.array.shape[:2]
 
     LOGGER.debug("%s, %s", boxes, weights)
 
-    rectangles = np.array([[x, y, x + w, y + h] for (x, y, w, h) in boxes])
+    # From x, y, width, height to x start, y start, x end, y end (inside the frame)
+    rectangles = np.column_stack([boxes[:, 0:2], boxes[:, 0:2] + boxes[:, 2:4]])
+    rectangles = np.clip(rectangles, 0, [width, height, width, height])
 
     LOGGER.debug("found people in %s", rectangles)
 
-    people_images = []
+    if rasterized_mask.is_some():
+        # Like someone on the TV, or a reflection in a window
+        included = rasterized_mask.unwrap().includes_feet(rectangles)
+        rectangles, weights = rectangles[included], weights[included]
+
+    person_tracker.detected(rectangles, weights, looked_in=regions)
+
+    return detections_of(person_tracker.tracks, frame, camera_id)
+
+
+def fraction_of(
+    regions: list[tuple[int, int, int, int]], image_size: tuple[int, int]
+) -> float:
+    "How much of an image (height, width) the regions cover"
+
+    height, width = image_size
+
+    return sum(
+        (x_end - x_start) * (y_end - y_start)
+        for (x_start, y_start, x_end, y_end) in regions
+    ) / (width * height)
+
 
-    for (rectangle, weight) in zip(rectangles, weights):
-        if weight < 0.8:
+def detections_of(
+    tracks: list[Track], frame: Frame, camera_id: int
+) -> tuple[list[Detection], np.ndarray]:
+    "Crop everyone tracked out of a frame, as detections and the crops they're in"
+
+    # The people found are cropped out in full color (and full resolution)
+    image = frame.array
+    height, width = image.shape[:2]
+
+    boxes: list[tuple[int, int, int, int]] = []
+
+    for track in tracks:
+        (x_start, y_start, x_end, y_end) = np.clip(
+            np.rint(track.box), 0, [width, height, width, height]
+        )
+        boxes.append((int(x_start), int(y_start), int(x_end), int(y_end)))
+
+    # Copied out (so the frame can be released) into one batch
+    crops = crop_people(image, boxes)
+
+    detections = [
+        Detection(
+            box=box,
+            confidence=track.confidence,
+            frame_id=frame.frame_id,
+            camera_id=camera_id,
+            track_id=track.track_id,
+            image=crop,
+        )
+        for (track, box, crop) in zip(tracks, boxes, crops)
+    ]
+
+    return detections, crops
+
+
+def current_results(
+    cameras: list[Camera], detection_scheduler: DetectionScheduler
+) -> list[tuple[list[Detection], np.ndarray]]:
+    """
+    Who each camera saw in its latest scan, leaving out any camera whose latest
+    scan is too old to go by (like one that's gone unscanned for a while
+    because the others had all the motion)
+
+    A camera's scan counts for as long as its next one is due, once for every camera
+    (since they take turns) and once more (for the CPU budget holding scans up).
+    """
+
+    now = monotonic()
+    turns = len(cameras) + 1
+    results = []
+
+    for camera in cameras:
+        if camera.latest.is_none():
             continue
 
-        x_start, y_start, x_end, y_end = rectangle
+        scanned_at, detections, crops = camera.latest.unwrap()
+
+        if now - scanned_at <= turns * detection_scheduler.interval_seconds_of(
+            camera.camera_id
+        ):
+            results.append((detections, crops))
+
+    return results
+
 
-        cropped_image = image[x_start:x_end, y_start:y_end]
+def in_the_room(
+    results: list[tuple[list[Detection], np.ndarray]]
+) -> tuple[list[Detection], np.ndarray]:
+    """
+    Everyone each camera (at least one) saw,
+    as one list of detections (and one batch of crops)
 
-        people_images.append(cropped_image)
+    Cameras are expected to each look at a different part of the room
+    (with their detection masks leaving out where they overlap),
+    so nobody's counted twice.
+    """
+
+    if len(results) == 1:
+        return results[0]
+
+    crops = np.concatenate([crops for (_detections, crops) in results])
+    crops.setflags(write=False)
+
+    detections = [
+        # Pointing at the merged crops instead
+        replace(detection, image=crop)
+        for (detection, crop) in zip(
+            chain.from_iterable(detections for (detections, _crops) in results), crops
+        )
+    ]
 
-    return people_images
+    return detections, crops
@@ -27,12 +27,16 @@ async def run(
     LOGGER.debug("startup")
 
     async for message in from_human_detection:
-        humans = message.images_of_humans
+        humans = message.detections
 
         activities_of_humans = [Activity.NEITHER for _human in humans]
 
         await to_control.send(
-            FromActivityRecognitionToControl(activities_of_humans=activities_of_humans)
+            FromActivityRecognitionToControl(
+                activities_of_humans=activities_of_humans,
+                frame_id=message.frame_id,
+                captured_at=message.captured_at,
+            )
         )
 
     LOGGER.debug("shutdown")
@@ -14,6 +14,7 @@ import bounded_channel
 from store import writable
 
 from microcontroller_application.interfaces.message_types import (
+    FromCameraConsumerToEnvironment,
     FromHumanDetectionToPersonIdentification,
     FromPersonIdentificationToAggregation,
     FromPersonIdentificationToControl,
@@ -41,8 +42,12 @@ async def run(
     to_aggregation: bounded_channel.Sender[FromPersonIdentificationToAggregation],
     to_proxy: bounded_channel.Sender[FromPersonIdentificationToProxy],
     to_control: bounded_channel.Sender[FromPersonIdentificationToControl],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
     trusted_users_folder: Path,
     get_current_time: Callable[[], datetime],
+    recognition_maximum_in_flight: int,
 ):
     "Run the person identification module"
 
@@ -58,6 +63,7 @@ async def run(
         user_face_encodings=user_face_encodings,
         identified_people_store=identified_people_store,
         use_demo_data=True,
+        maximum_in_flight=recognition_maximum_in_flight,
     )
 
     sc04_intruder_alert_task = sc04_intruder_alert.run(
@@ -71,6 +77,7 @@ async def run(
     sc05_add_new_trusted_people_task = sc05_add_new_trusted_people.run(
         from_human_detection=from_human_detection,
         from_proxy_add_new_user=from_proxy,
+        to_environment_camera_demand=to_environment_camera_demand,
         trusted_users_folder=trusted_users_folder,
         user_face_encodings=user_face_encodings,
     )
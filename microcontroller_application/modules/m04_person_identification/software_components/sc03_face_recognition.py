@@ -4,7 +4,7 @@ Component: 03. Face recognition
 """
 
 import csv
-from asyncio import gather, to_thread
+from asyncio import Queue, Semaphore, Task, create_task, gather, to_thread
 from pathlib import Path
 
 import bounded_channel
@@ -14,6 +14,7 @@ from option_and_result import NONE, Option, Some
 from store import Writable
 
 from microcontroller_application.interfaces.message_types import (
+    Detection,
     FromHumanDetectionToPersonIdentification,
     FromPersonIdentificationToControl,
     UserSlot,
@@ -22,6 +23,9 @@ from microcontroller_application.log import get_logger
 
 LOGGER = get_logger(__name__)
 
+# How many frames can have their faces being recognized at once by default
+MAXIMUM_IN_FLIGHT = 2
+
 
 async def run(
     *,
@@ -33,8 +37,16 @@ async def run(
     trusted_users_folder: Path,
     user_face_encodings: dict[UserSlot, list[list[float]]],
     use_demo_data: bool,
+    maximum_in_flight: int = MAXIMUM_IN_FLIGHT,
 ):
-    "Run the face recognition component"
+    """
+    Run the face recognition component
+
+    Faces are recognized in the frames human detection sends as they come in,
+    so a frame's can be recognized while an earlier one's are still being,
+    with up to `maximum_in_flight` frames at once. Who's in each frame is still sent on
+    in the order the frames came in.
+    """
 
     LOGGER.debug("startup")
 
@@ -58,45 +70,123 @@ async def run(
                 "not restoring %s's face encodings because none are saved", user_slot
             )
 
-    async for message in from_human_detection:
-        LOGGER.debug("received %r", message)
-
-        if use_demo_data:
-            number_of_humans = len(message.images_of_humans)
-
-            if number_of_humans == 0:
-                people = []
-            elif number_of_humans == 1:
-                people = [Some(UserSlot.TWO)]
-            elif number_of_humans == 2:
-                people = [Some(UserSlot.TWO), NONE()]
-            else:
-                people = [NONE() for _ in range(number_of_humans)]
-        else:
-            people = await gather(
-                *[
-                    find_matching_face(image, user_face_encodings)
-                    for image in message.images_of_humans
-                ]
+    # Who each person being tracked was recognized as,
+    # so their face doesn't need recognizing again while they're followed
+    # (by camera ID and track ID, since each camera has its own tracks)
+    recognized_tracks: dict[tuple[int, int], UserSlot] = {}
+
+    # Frames whose faces are being recognized (in the order they came in),
+    # with room for only so many at once
+    in_flight = Semaphore(maximum_in_flight)
+    recognizing: Queue[
+        Option[tuple[FromHumanDetectionToPersonIdentification, Task]]
+    ] = Queue()
+
+    async def start_recognizing():
+        async for message in from_human_detection:
+            LOGGER.debug("received %r", message)
+
+            await in_flight.acquire()
+
+            recognition = create_task(
+                recognize(
+                    message, recognized_tracks, user_face_encodings, use_demo_data
+                )
             )
+            await recognizing.put(Some((message, recognition)))
+
+        await recognizing.put(NONE())
 
-        LOGGER.debug("figured out %r", people)
+    async def send_in_order():
+        while (entry := await recognizing.get()).is_some():
+            message, recognition = entry.unwrap()
 
-        identified_people_store.set(people)
+            try:
+                people = await recognition
+            finally:
+                in_flight.release()
 
-        await to_control.send(
-            FromPersonIdentificationToControl(identified_people=people)
-        )
+            # Anyone who isn't tracked anymore could be someone else next time
+            tracked = {
+                (detection.camera_id, detection.track_id)
+                for detection in message.detections
+            }
+            for track in set(recognized_tracks) - tracked:
+                del recognized_tracks[track]
+
+            LOGGER.debug("figured out %r", people)
+
+            identified_people_store.set(people)
+
+            await to_control.send(
+                FromPersonIdentificationToControl(
+                    identified_people=people,
+                    frame_id=message.frame_id,
+                    captured_at=message.captured_at,
+                )
+            )
+
+    await gather(start_recognizing(), send_in_order())
 
     LOGGER.debug("shutdown")
 
 
+async def recognize(
+    message: FromHumanDetectionToPersonIdentification,
+    recognized_tracks: dict[tuple[int, int], UserSlot],
+    user_face_encodings: dict[UserSlot, list[list[float]]],
+    use_demo_data: bool,
+) -> list[Option[UserSlot]]:
+    "Who each person found in a frame is, if they're a trusted user"
+
+    if use_demo_data:
+        number_of_humans = len(message.detections)
+
+        if number_of_humans == 0:
+            return []
+        if number_of_humans == 1:
+            return [Some(UserSlot.TWO)]
+        if number_of_humans == 2:
+            return [Some(UserSlot.TWO), NONE()]
+
+        return [NONE() for _ in range(number_of_humans)]
+
+    return await gather(
+        *[
+            identify(detection, recognized_tracks, user_face_encodings)
+            for detection in message.detections
+        ]
+    )
+
+
+async def identify(
+    detection: Detection,
+    recognized_tracks: dict[tuple[int, int], UserSlot],
+    user_face_encodings: dict[UserSlot, list[list[float]]],
+) -> Option[UserSlot]:
+    "Recognize someone's face, unless they were already recognized on the same track"
+
+    track = (detection.camera_id, detection.track_id)
+
+    if track in recognized_tracks:
+        return Some(recognized_tracks[track])
+
+    person = await find_matching_face(detection.image, user_face_encodings)
+
+    # Strangers (or faces turned away) are looked at again next time
+    if person.is_some():
+        recognized_tracks[track] = person.unwrap()
+
+    return person
+
+
 async def find_matching_face(
     image_of_person: np.ndarray,
     user_face_encodings: dict[UserSlot, list[list[float]]] = {},
 ) -> Option[UserSlot]:
+    # Copied since the crops are read-only, and dlib only takes images it could write to
     this_image_face_encodings = await to_thread(
-        face_recognition.face_encodings, image_of_person
+        face_recognition.face_encodings, image_of_person.copy()
     )
 
     for this_image_face_encoding in this_image_face_encodings:
@@ -1,6 +1,9 @@
 """
 Module: 05. Preferences
 Component: 05. Add new trusted people
+
+Faces are enrolled from the camera's most detailed profile,
+which it's asked for until enrollment is over.
 """
 
 from asyncio import to_thread
@@ -11,6 +14,9 @@ import bounded_channel
 import face_recognition
 
 from microcontroller_application.interfaces.message_types import (
+    CameraConsumer,
+    CameraProfile,
+    FromCameraConsumerToEnvironment,
     FromHumanDetectionToPersonIdentification,
     FromPreferencesToControl,
     FromPreferencesToProxy,
@@ -22,6 +28,9 @@ from microcontroller_application.log import get_logger
 
 LOGGER = get_logger(__name__)
 
+# Enrollment only needs a few good frames
+ENROLLMENT_FRAMES_PER_SECOND = 4.0
+
 
 async def run(
     *,
@@ -29,6 +38,9 @@ async def run(
         FromHumanDetectionToPersonIdentification
     ],
     from_proxy_add_new_user: bounded_channel.Receiver[FromProxyToPersonIdentification],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
     trusted_users_folder: Path,
     user_face_encodings: dict[UserSlot, list[list[float]]],
 ):
@@ -43,26 +55,36 @@ async def run(
             "going to add the %r trusted user from current camera info", user_slot
         )
 
+        await to_environment_camera_demand.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.ENROLLMENT,
+                ENROLLMENT_FRAMES_PER_SECOND,
+                CameraProfile.HIGH_DETAIL,
+            )
+        )
+
         limit = 30
 
         for attempt in range(limit):
             LOGGER.debug("on attempt %d", attempt)
 
             current_humans = (await from_human_detection.recv()).unwrap()
-            images_of_humans = current_humans.images_of_humans
+            detections = current_humans.detections
 
-            number_of_humans = len(images_of_humans)
+            number_of_humans = len(detections)
             if number_of_humans != 1:
                 LOGGER.warning("%d humans were in frame though", number_of_humans)
                 continue
 
             # It’s a list, but we know it has one entry (one human),
             # so get the one and only element
-            image_of_person = images_of_humans[0]
+            image_of_person = detections[0].image
 
             LOGGER.debug("now looking for faces")
+            # Copied since the crops are read-only,
+            # and dlib only takes images it could write to
             face_encodings = await to_thread(
-                face_recognition.face_encodings, image_of_person
+                face_recognition.face_encodings, image_of_person.copy()
             )
 
             number_of_faces = len(face_encodings)
@@ -96,4 +118,10 @@ async def run(
         else:
             LOGGER.error("failed to ever find a human")
 
+        await to_environment_camera_demand.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.ENROLLMENT, 0, CameraProfile.HIGH_DETAIL
+            )
+        )
+
     LOGGER.debug("shutdown")
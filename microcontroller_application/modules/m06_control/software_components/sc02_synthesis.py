@@ -21,6 +21,8 @@ That resulting brightness value is given to the aggregation module
 from asyncio import gather, get_event_loop, sleep
 from bisect import bisect, bisect_left
 from datetime import datetime, timedelta
+from time import monotonic
+from typing import Callable, TypeVar
 
 import bounded_channel
 from option_and_result import NONE, Option, Some
@@ -47,6 +49,13 @@ from utils.stores import derived_with_time, values
 
 LOGGER = get_logger(__name__)
 
+T = TypeVar("T")
+U = TypeVar("U")
+
+# How many frames' results from activity recognition or person identification
+# can be waiting for the other's
+MAXIMUM_WAITING_FRAMES = 8
+
 
 async def run(
     *,
@@ -72,21 +81,32 @@ async def run(
             ambient_brightness = message.ambient_brightness
             ambient_brightness_store.set(Some(ambient_brightness))
 
-    activities_store: Writable[Option[list[Activity]], None] = writable(NONE())
+    # What everyone's doing and who they are, only ever from the same frame
+    # (activity recognition and person identification finish them at different times)
+    people_store: Writable[
+        Option[tuple[list[Activity], list[IdentifiedPerson]]], None
+    ] = writable(NONE())
+    results_by_frame = ResultsByFrame()
 
     async def put_activities_in_store():
         async for message in from_activity_recognition:
-            activities = message.activities_of_humans
-            activities_store.set(Some(activities))
+            joined = results_by_frame.add_activities(
+                message.frame_id, message.activities_of_humans
+            )
 
-    identified_people_store: Writable[Option[list[IdentifiedPerson]], None] = writable(
-        NONE()
-    )
+            if joined.is_some():
+                log_latency(message.frame_id, message.captured_at)
+                people_store.set(joined)
 
     async def put_trusted_people_in_store():
         async for message in from_person_identification:
-            identified_people = message.identified_people
-            identified_people_store.set(Some(identified_people))
+            joined = results_by_frame.add_identified_people(
+                message.frame_id, message.identified_people
+            )
+
+            if joined.is_some():
+                log_latency(message.frame_id, message.captured_at)
+                people_store.set(joined)
 
     preferences_store: Writable[Option[dict[UserSlot, Preferences]], None] = writable(
         NONE()
@@ -105,11 +125,17 @@ async def run(
     synthesized_brightness_store = derived_with_time(
         [
             ambient_brightness_store,
-            activities_store,
-            identified_people_store,
+            people_store,
             preferences_store,
         ],
-        synthesize_if_initialized,
+        lambda ambient_brightness_option, people_option, preferences_option: (
+            synthesize_if_initialized(
+                ambient_brightness_option,
+                people_option.map(lambda people: people[0]),
+                people_option.map(lambda people: people[1]),
+                preferences_option,
+            )
+        ),
         loop=loop,
         # Recalculate at least every 15 seconds
         get_max_period=lambda: timedelta(seconds=15),
@@ -136,6 +162,98 @@ async def run(
     LOGGER.debug("shutdown")
 
 
+class ResultsByFrame:
+    """
+    Activity recognition's and person identification's results,
+    paired up by the frame they're for
+
+    Whichever comes in first for a frame waits for the other's,
+    and once a frame's are paired, anything for earlier frames is dropped
+    (since it's out of date). Only the most recent few frames' can be waiting,
+    so a frame that one of them never sends results for is eventually given up on.
+    """
+
+    def __init__(self, *, maximum_waiting: int = MAXIMUM_WAITING_FRAMES):
+        self.maximum_waiting = maximum_waiting
+
+        self._activities: dict[int, list[Activity]] = {}
+        self._identified_people: dict[int, list[IdentifiedPerson]] = {}
+        self._last_paired: Option[int] = NONE()
+
+    def add_activities(
+        self, frame_id: int, activities: list[Activity]
+    ) -> Option[tuple[list[Activity], list[IdentifiedPerson]]]:
+        "The frame's activities and identified people, once both are in"
+
+        return self._add(
+            frame_id, activities, self._activities, self._identified_people
+        ).map(lambda identified_people: (activities, identified_people))
+
+    def add_identified_people(
+        self, frame_id: int, identified_people: list[IdentifiedPerson]
+    ) -> Option[tuple[list[Activity], list[IdentifiedPerson]]]:
+        "The frame's activities and identified people, once both are in"
+
+        return self._add(
+            frame_id, identified_people, self._identified_people, self._activities
+        ).map(lambda activities: (activities, identified_people))
+
+    def _add(
+        self, frame_id: int, results: T, waiting: dict[int, T], other: dict[int, U]
+    ) -> Option[U]:
+        """
+        The other results for the frame, if they're in
+        (with `waiting` being where these kind of results wait, and `other` the other)
+        """
+
+        # Results only ever go unpaired by being dropped here: for a frame at or before
+        # the last one paired, for the oldest frame when too many are waiting,
+        # and (below) for frames before one that was paired.
+        # Human detection sends each frame to both, so that's only when one's fallen behind
+        if self._last_paired.is_some() and frame_id <= self._last_paired.unwrap():
+            LOGGER.debug("dropped results for frame %d since they're late", frame_id)
+            return NONE()
+
+        if frame_id not in other:
+            waiting[frame_id] = results
+
+            while len(waiting) > self.maximum_waiting:
+                del waiting[min(waiting)]
+
+            return NONE()
+
+        other_results = other[frame_id]
+
+        self._last_paired = Some(frame_id)
+        forget_up_to(waiting, frame_id)
+        forget_up_to(other, frame_id)
+
+        return Some(other_results)
+
+
+def log_latency(
+    frame_id: int, captured_at: float, *, clock: Callable[[], float] = monotonic
+) -> float:
+    "Log how long it took from the frame being captured to its results being joined"
+
+    seconds = clock() - captured_at
+
+    LOGGER.info(
+        "results for frame %d were joined %.0f ms after it was captured",
+        frame_id,
+        1000 * seconds,
+    )
+
+    return seconds
+
+
+def forget_up_to(results_by_frame: dict[int, T], frame_id: int):
+    "Drop the results for the frame and every frame before it"
+
+    for earlier_frame_id in [key for key in results_by_frame if key <= frame_id]:
+        del results_by_frame[earlier_frame_id]
+
+
 def synthesize_if_initialized(
     ambient_brightness_option: Option[float],
     activities_option: Option[list[Activity]],
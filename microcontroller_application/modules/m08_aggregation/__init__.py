@@ -12,6 +12,7 @@ from typing import Callable
 import bounded_channel
 
 from microcontroller_application.interfaces.message_types import (
+    FromCameraConsumerToEnvironment,
     FromAggregationToProxyCameraFrame,
     FromAggregationToProxyDutyCycle,
     FromAggregationToProxyHistory,
@@ -24,6 +25,7 @@ from microcontroller_application.interfaces.message_types import (
     FromProxyToAggregationRequestDutyCycle,
 )
 from microcontroller_application.log import get_logger
+from utils import watch
 
 from .software_components import (
     sc03_current_state,
@@ -45,7 +47,7 @@ async def run(
     from_control_duty_cycle: bounded_channel.Receiver[
         FromControlToAggregationDutyCycle
     ],
-    from_environment: bounded_channel.Receiver[FromEnvironmentToAggregation],
+    from_environment: watch.Receiver[FromEnvironmentToAggregation],
     from_proxy_camera_feed_interest: bounded_channel.Receiver[
         FromProxyToAggregationCameraFeedInterest
     ],
@@ -61,6 +63,9 @@ async def run(
     to_proxy_camera_frame: bounded_channel.Sender[FromAggregationToProxyCameraFrame],
     to_proxy_duty_cycle: bounded_channel.Sender[FromAggregationToProxyDutyCycle],
     to_proxy_history: bounded_channel.Sender[FromAggregationToProxyHistory],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
     history_folder: Path,
     get_current_time: Callable[[], datetime],
 ):
@@ -68,13 +73,16 @@ async def run(
 
     LOGGER.debug("startup")
 
+    # Both of these components get their own receiver for camera frames
+    # so that each of them sees every new frame
     sc03_current_state_task = sc03_current_state.run(
-        from_environment=from_environment,
+        from_environment=from_environment.clone(),
         from_control_duty_cycle=from_control_duty_cycle,
         from_proxy_camera_feed_interest=from_proxy_camera_feed_interest,
         from_proxy_request_duty_cycle=from_proxy_request_duty_cycle,
         to_proxy_camera_frame=to_proxy_camera_frame,
         to_proxy_duty_cycle=to_proxy_duty_cycle,
+        to_environment_camera_demand=to_environment_camera_demand,
     )
 
     sc04_history_compaction_task = sc04_history_compaction.run(
@@ -90,8 +98,9 @@ async def run(
     )
 
     sc06_camera_recording_task = sc06_camera_recording.run(
-        from_environment=from_environment,
+        from_environment=from_environment.clone(),
         from_proxy_record_the_camera=from_proxy_record_the_camera,
+        to_environment_camera_demand=to_environment_camera_demand,
         get_current_time=get_current_time,
         history_folder=history_folder,
     )
@@ -112,6 +121,7 @@ async def run(
     del from_environment
     del from_proxy_request_duty_cycle
     del to_proxy_duty_cycle
+    del to_environment_camera_demand
 
     # End of dropping extra references
 
@@ -15,31 +15,39 @@ It's a similar story with the camera feed from the environment module.
 When requested (from the proxy module
 (because of a user request while browsing the frontend website)
 ), it is given.
+The camera is only asked for frames while at least one user wants the feed.
 """
 
 
-from asyncio import Event, gather
+from asyncio import Event, gather, to_thread
 
 import bounded_channel
 from option_and_result import NONE, Option, Some
-from PIL import Image
 
 from microcontroller_application.interfaces.message_types import (
+    CameraConsumer,
+    CameraProfile,
     FromAggregationToProxyCameraFrame,
     FromAggregationToProxyDutyCycle,
+    FromCameraConsumerToEnvironment,
     FromControlToAggregationDutyCycle,
     FromEnvironmentToAggregation,
     FromProxyToAggregationCameraFeedInterest,
     FromProxyToAggregationRequestDutyCycle,
 )
 from microcontroller_application.log import get_logger
+from utils import watch
+from utils.frames import JpegQuality
 
 LOGGER = get_logger(__name__)
 
+# How smooth the live feed is for users watching it
+LIVE_FEED_FRAMES_PER_SECOND = 12.0
+
 
 async def run(
     *,
-    from_environment: bounded_channel.Receiver[FromEnvironmentToAggregation],
+    from_environment: watch.Receiver[FromEnvironmentToAggregation],
     from_control_duty_cycle: bounded_channel.Receiver[
         FromControlToAggregationDutyCycle
     ],
@@ -51,6 +59,9 @@ async def run(
     ],
     to_proxy_camera_frame: bounded_channel.Sender[FromAggregationToProxyCameraFrame],
     to_proxy_duty_cycle: bounded_channel.Sender[FromAggregationToProxyDutyCycle],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
 ):
     "Run the current state software component"
 
@@ -66,6 +77,7 @@ async def run(
             from_environment=from_environment,
             from_proxy_camera_feed_interest=from_proxy_camera_feed_interest,
             to_proxy_camera_frame=to_proxy_camera_frame,
+            to_environment_camera_demand=to_environment_camera_demand,
         ),
     )
 
@@ -104,11 +116,14 @@ async def run_current_state_for_duty_cycle(
 
 async def run_current_state_for_camera_feed(
     *,
-    from_environment: bounded_channel.Receiver[FromEnvironmentToAggregation],
+    from_environment: watch.Receiver[FromEnvironmentToAggregation],
     from_proxy_camera_feed_interest: bounded_channel.Receiver[
         FromProxyToAggregationCameraFeedInterest
     ],
     to_proxy_camera_frame: bounded_channel.Sender[FromAggregationToProxyCameraFrame],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
 ):
 
     users_interested_in_camera_feed: set[str] = set()
@@ -122,6 +137,7 @@ async def run_current_state_for_camera_feed(
             from_proxy_camera_feed_interest=from_proxy_camera_feed_interest,
             any_user_interested_in_the_camera_feed=any_user_interested_in_the_camera_feed,
             users_interested_in_camera_feed=users_interested_in_camera_feed,
+            to_environment_camera_demand=to_environment_camera_demand,
         ),
         forward_camera_feed(
             from_environment=from_environment,
@@ -139,8 +155,13 @@ async def receive_proxy_messages(
     ],
     any_user_interested_in_the_camera_feed: Event,
     users_interested_in_camera_feed: set[str],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
 ):
     async for message in from_proxy_camera_feed_interest:
+        anyone_was_interested = bool(users_interested_in_camera_feed)
+
         if message.wants_camera_feed:
             users_interested_in_camera_feed.add(message.user_id)
         else:
@@ -151,28 +172,61 @@ async def receive_proxy_messages(
         else:
             any_user_interested_in_the_camera_feed.clear()
 
+        # Only tell the camera when the first user starts watching or the last one stops
+        if bool(users_interested_in_camera_feed) != anyone_was_interested:
+            await to_environment_camera_demand.send(
+                FromCameraConsumerToEnvironment(
+                    CameraConsumer.LIVE_FEED,
+                    LIVE_FEED_FRAMES_PER_SECOND
+                    if users_interested_in_camera_feed
+                    else 0,
+                    CameraProfile.STREAMING,
+                )
+            )
+
 
 async def forward_camera_feed(
     *,
-    from_environment: bounded_channel.Receiver[FromEnvironmentToAggregation],
+    from_environment: watch.Receiver[FromEnvironmentToAggregation],
     to_proxy_camera_frame: bounded_channel.Sender[FromAggregationToProxyCameraFrame],
     any_user_interested_in_the_camera_feed: Event,
     users_interested_in_camera_feed: set[str],
 ):
+    # What was last forwarded, so that frames that look the same as it
+    # aren't encoded and sent to the same users all over again
+    last_forwarded: Option[tuple[int, frozenset[str]]] = NONE()
+    skipped_count = 0
+
     while True:
         await any_user_interested_in_the_camera_feed.wait()
-        # TODO: swap this out with the puller / pusher construct I need to implement
+        # This waits for a frame newer than the last one forwarded
         environment_message_option = await from_environment.recv()
         # TODO: there's no reason I can think of this would be a None variant
         environment_message = environment_message_option.unwrap()
 
-        frame = environment_message.frame
-        # Convert the frame (a numpy array) to a displayable image
-        image = Image.fromarray(frame)
+        with environment_message.frame as frame:
+            key = (frame.key_frame_id, frozenset(users_interested_in_camera_feed))
+
+            if last_forwarded.is_some() and last_forwarded.unwrap() == key:
+                skipped_count += 1
+
+                if skipped_count % 1000 == 0:
+                    LOGGER.info(
+                        "skipped forwarding %d unchanged camera frames so far",
+                        skipped_count,
+                    )
+
+                continue
+
+            # Encode the frame (a numpy array) as a displayable image
+            # (off the event loop, since that takes a while)
+            jpeg = await to_thread(frame.jpeg, JpegQuality.STREAMING)
+
+        last_forwarded = Some(key)
 
         await to_proxy_camera_frame.send(
             FromAggregationToProxyCameraFrame(
-                image,
+                jpeg,
                 # So the proxy module knows who to send the live images to
                 list(users_interested_in_camera_feed),
             )
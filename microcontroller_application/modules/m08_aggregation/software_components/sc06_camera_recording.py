@@ -1,31 +1,45 @@
 """
 Module: 08. Aggregation
 Component: 06. Camera recording
+
+The camera is only asked for frames while recording,
+and a recording is finished as soon as it's stopped.
 """
 
-from asyncio import Event, gather
+from asyncio import FIRST_COMPLETED, Event, create_task, gather, to_thread, wait
 from datetime import datetime
 from pathlib import Path
 from typing import Callable
 
 import bounded_channel
-from PIL import Image
+from option_and_result import NONE, Option, Some
 
 from microcontroller_application.interfaces.message_types import (
+    CameraConsumer,
+    CameraProfile,
+    FromCameraConsumerToEnvironment,
     FromEnvironmentToAggregation,
     FromProxyToAggregationRecordTheCamera,
 )
 from microcontroller_application.log import get_logger
+from utils import watch
+from utils.frames import JpegQuality, release_frame_of
 
 LOGGER = get_logger(__name__)
 
+# Recordings are kept at the camera's full rate (which is the most this can get)
+RECORDING_FRAMES_PER_SECOND = 24.0
+
 
 async def run(
     *,
-    from_environment: bounded_channel.Receiver[FromEnvironmentToAggregation],
+    from_environment: watch.Receiver[FromEnvironmentToAggregation],
     from_proxy_record_the_camera: bounded_channel.Receiver[
         FromProxyToAggregationRecordTheCamera
     ],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
     get_current_time: Callable[[], datetime],
     history_folder: Path,
 ):
@@ -34,17 +48,21 @@ async def run(
     LOGGER.debug("startup")
 
     recording = Event()
+    stopped = Event()
 
     await gather(
         receive_proxy_messages(
             from_proxy_record_the_camera=from_proxy_record_the_camera,
+            to_environment_camera_demand=to_environment_camera_demand,
             recording=recording,
+            stopped=stopped,
         ),
         record_camera_feed(
             from_environment=from_environment,
             get_current_time=get_current_time,
             history_folder=history_folder,
             recording=recording,
+            stopped=stopped,
         ),
     )
 
@@ -56,37 +74,61 @@ async def receive_proxy_messages(
     from_proxy_record_the_camera: bounded_channel.Receiver[
         FromProxyToAggregationRecordTheCamera
     ],
+    to_environment_camera_demand: bounded_channel.Sender[
+        FromCameraConsumerToEnvironment
+    ],
     recording: Event,
+    stopped: Event,
 ):
     async for message in from_proxy_record_the_camera:
+        if message.should_record == recording.is_set():
+            continue
+
         if message.should_record:
+            stopped.clear()
             recording.set()
         else:
             recording.clear()
+            stopped.set()
+
+        await to_environment_camera_demand.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.RECORDING,
+                RECORDING_FRAMES_PER_SECOND if message.should_record else 0,
+                CameraProfile.HIGH_DETAIL,
+            )
+        )
 
 
 async def record_camera_feed(
     *,
-    from_environment: bounded_channel.Receiver[FromEnvironmentToAggregation],
+    from_environment: watch.Receiver[FromEnvironmentToAggregation],
     get_current_time: Callable[[], datetime],
     history_folder: Path,
     recording: Event,
+    stopped: Event,
 ):
+    "Save every frame while recording, then assemble them into a video once stopped"
 
     frame_number = 0
-    recording_folder = None
+    recording_folder: Option[Path] = NONE()
+
+    # The JPEG of the last frame that changed, kept to be written again
+    # for every frame that looks the same as it
+    last_key_frame_jpeg: Option[tuple[int, bytes]] = NONE()
+    reused_jpeg_count = 0
 
     while True:
-        await recording.wait()
+        # A recording is about to be started
+        # (but one that's underway still needs finishing off if it was just stopped)
+        if recording_folder.is_none():
+            await recording.wait()
 
-        # A recording has just been started this frame
-        if recording_folder is None:
             now = get_current_time()
 
             LOGGER.info("starting a camera recording session for %s", now)
 
-            # TODO: switch to Option rather than a bare None
-            recording_folder = (
+            recording_folder = Some(
                 history_folder
                 / str(now.year)
                 / str(now.month)
@@ -97,36 +139,95 @@ async def record_camera_feed(
                 / str(now.second)
             )
 
-            recording_folder.mkdir(exist_ok=True, parents=True)
+            recording_folder.unwrap().mkdir(exist_ok=True, parents=True)
+
+        # Grab the next camera frame (skipping any that were replaced in the meantime)
+        environment_message_option = await recv_unless_stopped(
+            from_environment, stopped
+        )
+
+        # The recording was stopped (or the camera's gone), so finish it off now
+        # rather than waiting for a frame that may never come
+        if environment_message_option.is_none():
+            folder = recording_folder.unwrap()
+
+            # Assemble a video from the captured frames
+            await assemble_video(list(folder.iterdir()), folder / "video.mkv")
+
+            LOGGER.info(
+                "%d of the %d frames recorded were unchanged and reused an earlier JPEG",
+                reused_jpeg_count,
+                frame_number,
+            )
 
-        # Grab the current camera frame
-        environment_message_option = await from_environment.recv()
-        environment_message = (
-            environment_message_option.unwrap()
-        )  # TODO: I presume this can never be None?
+            # Reset the recording information
+            frame_number = 0
+            recording_folder = NONE()
+            reused_jpeg_count = 0
+
+            if not stopped.is_set():
+                LOGGER.debug("the camera feed has closed")
+                return
+
+            continue
+
+        with environment_message_option.unwrap().frame as frame:
+            if (
+                last_key_frame_jpeg.is_some()
+                and last_key_frame_jpeg.unwrap()[0] == frame.key_frame_id
+            ):
+                # Nothing's changed, so the last encoding is as good as a new one
+                jpeg = last_key_frame_jpeg.unwrap()[1]
+                reused_jpeg_count += 1
+            else:
+                # Encode the frame (a numpy array) as a displayable image
+                # (off the event loop, since that takes a while)
+                jpeg = await to_thread(frame.jpeg, JpegQuality.RECORDING)
+                last_key_frame_jpeg = Some((frame.key_frame_id, jpeg))
 
-        frame = environment_message.frame
-        # Convert the frame (a numpy array) to a displayable image
-        image = Image.fromarray(frame)
         # Save the image in the recording folder with the frame number as the name
-        destination = recording_folder / f"{frame_number}.jpeg"
-        image.save(destination, quality=90)
+        destination = recording_folder.unwrap() / f"{frame_number}.jpeg"
+        destination.write_bytes(jpeg)
 
         LOGGER.info("saved current frame to %s", destination)
 
         frame_number += 1
 
-        # The recording was stopped during this frame.
-        if not recording.is_set():
-            # Get a list of all the files in the recording folder
-            all_frames = list(recording_folder.iterdir())
 
-            # Assemble a video from the captured frames
-            await assemble_video(all_frames, recording_folder / "video.mkv")
+async def recv_unless_stopped(
+    from_environment: watch.Receiver[FromEnvironmentToAggregation],
+    stopped: Event,
+) -> Option[FromEnvironmentToAggregation]:
+    """
+    Receive the next camera frame, or `NONE()` if the recording stops
+    (or the channel closes) before one arrives
+    """
 
-            # Reset the recording information
-            frame_number = 0
-            recording_folder = None
+    receiving = create_task(from_environment.recv())
+    stopping = create_task(stopped.wait())
+
+    try:
+        await wait({receiving, stopping}, return_when=FIRST_COMPLETED)
+    finally:
+        stopping.cancel()
+
+        # Cancelling a receive that hasn't finished never loses a frame,
+        # since it's only taken off the channel once the receive finishes
+        if not receiving.done():
+            receiving.cancel()
+
+    if not receiving.done():
+        return NONE()
+
+    environment_message_option = receiving.result()
+
+    # Both finished together, but the frame came too late to be part of the recording
+    if stopped.is_set() and environment_message_option.is_some():
+        release_frame_of(environment_message_option.unwrap())
+
+        return NONE()
+
+    return environment_message_option
 
 
 async def assemble_video(
@@ -254,7 +254,7 @@ async def convert_from_aggregation_camera_frame(
         converted_message = {
             "UserSpecificData": [
                 {
-                    "CameraFrame": {"image": image_to_bytes(message.frame)},
+                    "CameraFrame": {"image": message.jpeg},
                 },
                 message.user_ids,
             ],
@@ -0,0 +1,331 @@
+"""
+Unit test
+Module: 01. Environment
+Component: 02. Camera driver
+"""
+
+from asyncio import create_task, gather, get_running_loop, sleep, wait_for
+
+import bounded_channel
+import numpy as np
+import pytest
+from option_and_result import NONE, Some
+
+from microcontroller_application.interfaces.message_types import (
+    CameraConsumer,
+    CameraProfile,
+    FromCameraConsumerToEnvironment,
+)
+from microcontroller_application.modules.m01_environment.software_components.sc02_camera_driver import (
+    CameraDemand,
+    PROFILE_RESOLUTIONS,
+    CameraStatistics,
+    ChangeDetector,
+    capture_frames,
+    distribute_frame,
+    receive_camera_demand,
+)
+from utils import watch
+from utils.asynchronous import in_dedicated_thread
+from utils.frames import FramePool, release_frame_of, retain_frame_of
+
+
+@pytest.mark.asyncio
+async def test_frames_are_captured_off_the_event_loop_and_reused():
+    demand = CameraDemand()
+    demand.update(CameraConsumer.HUMAN_DETECTION, 200, CameraProfile.DETECTION)
+
+    to_human_detection, from_environment_camera_frame = watch.channel(
+        retain=retain_frame_of, release=release_frame_of
+    )
+    # Nothing is receiving from this one, which shouldn't hold anything up
+    to_aggregation, _from_environment = watch.channel(
+        retain=retain_frame_of, release=release_frame_of
+    )
+
+    loop = get_running_loop()
+
+    def capture_into(frame):
+        frame.array[:] = frame.frame_id % 256
+        return True
+
+    def publish(frame):
+        loop.call_soon_threadsafe(
+            lambda: distribute_frame(
+                frame,
+                to_human_detection=to_human_detection,
+                to_aggregation=Some(to_aggregation),
+            )
+        )
+
+    capture_task = create_task(
+        in_dedicated_thread(
+            lambda stop: capture_frames(
+                stop,
+                capture_into=capture_into,
+                change_resolution=lambda _resolution: None,
+                pool_capacity=4,
+                maximum_frames_per_second=Some(1000.0),
+                demand=demand,
+                # Every frame is different from the last one here
+                change_detector=ChangeDetector(threshold=0.002),
+                statistics=CameraStatistics(),
+                publish=publish,
+            ),
+            name="test camera capture",
+        )
+    )
+
+    last_frame_id = -1
+
+    for _ in range(20):
+        message = (
+            await wait_for(from_environment_camera_frame.recv(), timeout=5)
+        ).unwrap()
+
+        with message.frame as frame:
+            assert frame.frame_id > last_frame_id
+            assert (frame.array == frame.frame_id % 256).all()
+            last_frame_id = frame.frame_id
+
+    capture_task.cancel()
+    await sleep(0.05)
+
+    # Far more frames were captured than there are buffers in the pool
+    assert last_frame_id >= 19
+
+
+def test_frames_that_look_the_same_are_marked_unchanged():
+    pool = FramePool(shape=(120, 160, 3), capacity=1)
+    change_detector = ChangeDetector(threshold=0.01)
+    random = np.random.default_rng(0)
+
+    background = random.integers(0, 200, (120, 160, 3), dtype=np.uint8)
+
+    def capture(pixels):
+        frame = pool.acquire().unwrap()
+        frame.array[:] = pixels
+        change_detector.check(frame)
+        frame.release()
+        return frame
+
+    first = capture(background)
+    assert not first.unchanged
+    assert first.key_frame_id == first.frame_id
+
+    # A little sensor noise doesn't count as a change
+    noise = random.integers(0, 3, background.shape, dtype=np.uint8)
+    second = capture(background + noise)
+    assert second.unchanged
+    assert second.key_frame_id == first.frame_id
+
+    # But something walking into view does
+    with_someone = background.copy()
+    with_someone[20:100, 60:90] = 255
+    third = capture(with_someone)
+    assert not third.unchanged
+    assert third.key_frame_id == third.frame_id
+    assert third.change_score > 0.1
+
+    # And later frames are compared against that one
+    fourth = capture(with_someone)
+    assert fourth.unchanged
+    assert fourth.key_frame_id == third.frame_id
+
+
+def test_a_threshold_of_zero_never_marks_frames_unchanged():
+    pool = FramePool(shape=(60, 80, 3), capacity=1)
+    change_detector = ChangeDetector(threshold=0)
+
+    for _ in range(3):
+        with pool.acquire().unwrap() as frame:
+            frame.array[:] = 100
+            change_detector.check(frame)
+
+            assert not frame.unchanged
+
+
+def test_the_first_frame_is_a_change_whatever_the_threshold():
+    pool = FramePool(shape=(60, 80, 3), capacity=1)
+    change_detector = ChangeDetector(threshold=1)
+
+    with pool.acquire().unwrap() as frame:
+        change_detector.check(frame)
+
+        assert not frame.unchanged
+        assert frame.change_score == 1
+
+    with pytest.raises(ValueError):
+        ChangeDetector(threshold=1.5)
+
+
+def test_the_fastest_rate_in_demand_wins():
+    demand = CameraDemand()
+    assert demand.frames_per_second() == 0
+
+    assert demand.profile() == NONE()
+
+    demand.update(CameraConsumer.HUMAN_DETECTION, 4, CameraProfile.DETECTION)
+    demand.update(CameraConsumer.LIVE_FEED, 12, CameraProfile.STREAMING)
+    assert demand.frames_per_second() == 12
+    assert demand.profile() == Some(CameraProfile.STREAMING)
+
+    demand.update(CameraConsumer.RECORDING, 2, CameraProfile.HIGH_DETAIL)
+    # The most detailed profile wins even though it's not the fastest
+    assert demand.frames_per_second() == 12
+    assert demand.profile() == Some(CameraProfile.HIGH_DETAIL)
+
+    demand.update(CameraConsumer.RECORDING, 0, CameraProfile.HIGH_DETAIL)
+    demand.update(CameraConsumer.LIVE_FEED, 0, CameraProfile.STREAMING)
+    assert demand.frames_per_second() == 4
+    assert demand.profile() == Some(CameraProfile.DETECTION)
+
+    demand.update(CameraConsumer.HUMAN_DETECTION, 0, CameraProfile.DETECTION)
+    assert demand.frames_per_second() == 0
+    assert demand.profile() == NONE()
+
+
+@pytest.mark.asyncio
+async def test_nothing_is_captured_until_frames_are_in_demand():
+    demand = CameraDemand()
+    statistics = CameraStatistics()
+
+    captured = []
+
+    def capture_into(frame):
+        captured.append(frame.frame_id)
+        return True
+
+    capture_task = create_task(
+        in_dedicated_thread(
+            lambda stop: capture_frames(
+                stop,
+                capture_into=capture_into,
+                change_resolution=lambda _resolution: None,
+                pool_capacity=2,
+                maximum_frames_per_second=Some(100.0),
+                demand=demand,
+                change_detector=ChangeDetector(threshold=0),
+                statistics=statistics,
+                publish=lambda frame: frame.release(),
+            ),
+            name="test camera capture",
+        )
+    )
+
+    await sleep(0.2)
+    assert not captured
+
+    demand.update(CameraConsumer.RECORDING, 100, CameraProfile.DETECTION)
+    await sleep(0.2)
+    assert captured
+    assert statistics.warm_ups == 1
+    assert 0 < statistics.last_warm_up_seconds < 0.2
+
+    demand.update(CameraConsumer.RECORDING, 0, CameraProfile.DETECTION)
+    await sleep(0.1)
+    captured_before_idling = len(captured)
+    await sleep(0.2)
+    assert len(captured) == captured_before_idling
+
+    capture_task.cancel()
+    await sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_frames_are_captured_in_the_most_detailed_profile_in_demand():
+    demand = CameraDemand()
+    demand.update(CameraConsumer.HUMAN_DETECTION, 100, CameraProfile.DETECTION)
+    statistics = CameraStatistics()
+
+    resolutions = []
+    shapes = []
+
+    def publish(frame):
+        shapes.append(frame.array.shape)
+        frame.release()
+
+    capture_task = create_task(
+        in_dedicated_thread(
+            lambda stop: capture_frames(
+                stop,
+                capture_into=lambda _frame: True,
+                change_resolution=resolutions.append,
+                pool_capacity=2,
+                maximum_frames_per_second=Some(100.0),
+                demand=demand,
+                change_detector=ChangeDetector(threshold=0),
+                statistics=statistics,
+                publish=publish,
+            ),
+            name="test camera capture",
+        )
+    )
+
+    await sleep(0.2)
+    demand.update(CameraConsumer.RECORDING, 10, CameraProfile.HIGH_DETAIL)
+    await sleep(0.3)
+
+    capture_task.cancel()
+    await sleep(0.05)
+
+    detection_width, detection_height = PROFILE_RESOLUTIONS[CameraProfile.DETECTION]
+    high_detail_width, high_detail_height = PROFILE_RESOLUTIONS[
+        CameraProfile.HIGH_DETAIL
+    ]
+
+    assert resolutions == [
+        PROFILE_RESOLUTIONS[CameraProfile.DETECTION],
+        PROFILE_RESOLUTIONS[CameraProfile.HIGH_DETAIL],
+    ]
+    assert shapes[0] == (detection_height, detection_width, 3)
+    assert shapes[-1] == (high_detail_height, high_detail_width, 3)
+
+    assert statistics.profile_switches == 2
+    assert statistics.frames_by_profile[CameraProfile.DETECTION] > 0
+    assert statistics.frames_by_profile[CameraProfile.HIGH_DETAIL] > 0
+
+
+@pytest.mark.asyncio
+async def test_each_camera_only_captures_for_whoever_asked_it():
+    demands = [CameraDemand(), CameraDemand()]
+    to_environment, from_camera_consumers = bounded_channel.channel(8)
+
+    receiving = create_task(
+        receive_camera_demand(
+            from_camera_consumers=from_camera_consumers, demands=demands
+        )
+    )
+
+    (
+        await to_environment.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.HUMAN_DETECTION, 4, CameraProfile.DETECTION, 1
+            )
+        )
+    ).unwrap()
+    # The main camera by default
+    (
+        await to_environment.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.RECORDING, 2, CameraProfile.HIGH_DETAIL
+            )
+        )
+    ).unwrap()
+    # There's no third camera
+    (
+        await to_environment.send(
+            FromCameraConsumerToEnvironment(
+                CameraConsumer.HUMAN_DETECTION, 4, CameraProfile.DETECTION, 2
+            )
+        )
+    ).unwrap()
+
+    await sleep(0.05)
+
+    assert demands[0].profile() == Some(CameraProfile.HIGH_DETAIL)
+    assert demands[1].profile() == Some(CameraProfile.DETECTION)
+    assert not receiving.done()
+
+    receiving.cancel()
+    await gather(receiving, return_exceptions=True)
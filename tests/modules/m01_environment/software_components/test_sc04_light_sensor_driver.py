@@ -0,0 +1,176 @@
+"""
+Unit test
+Module: 01. Environment
+Component: 04. Light sensor driver
+"""
+
+from asyncio import create_task, gather, sleep, wait_for
+from itertools import count
+from time import monotonic
+
+import bounded_channel
+import pytest
+
+from microcontroller_application.modules.m01_environment.fake_hardware import (
+    FakeTSL2591,
+)
+from microcontroller_application.modules.m01_environment.sampling_scheduler import (
+    SamplingScheduler,
+)
+from microcontroller_application.modules.m01_environment.software_components.sc04_light_sensor_driver import (
+    LUX_TO_LUMENS_CONVERSION_FACTOR,
+    LightSensorStatistics,
+    sample_light_sensor,
+)
+from utils.smoothing import Deadband
+
+
+async def longest_gap_between_ticks(seconds: float) -> float:
+    "How long the event loop was ever kept from running this over some time"
+
+    longest_gap = 0.0
+    last_tick = monotonic()
+    end = last_tick + seconds
+
+    while monotonic() < end:
+        await sleep(0.005)
+
+        now = monotonic()
+        longest_gap = max(longest_gap, now - last_tick)
+        last_tick = now
+
+    return longest_gap
+
+
+@pytest.mark.asyncio
+async def test_slow_reads_never_block_the_event_loop():
+    # Like a 300 ms integration time
+    light_sensor = FakeTSL2591(lambda: 170.0, read_seconds=0.3)
+    statistics = LightSensorStatistics()
+    to_control, from_environment = bounded_channel.channel(32)
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    sample_task = create_task(
+        sample_light_sensor(
+            light_sensor,
+            to_control=to_control,
+            scheduler=scheduler,
+            period_seconds=0.3,
+            read_timeout_seconds=1,
+            deadband=Deadband(relative_tolerance=0, heartbeat_seconds=30),
+            statistics=statistics,
+        )
+    )
+    del to_control
+
+    assert await longest_gap_between_ticks(0.8) < 0.1
+
+    message = (await wait_for(from_environment.recv(), timeout=5)).unwrap()
+    assert message.ambient_brightness == pytest.approx(
+        170 * LUX_TO_LUMENS_CONVERSION_FACTOR
+    )
+
+    sample_task.cancel()
+    scheduler_task.cancel()
+    await gather(sample_task, scheduler_task, return_exceptions=True)
+
+    assert statistics.reads >= 2
+    assert statistics.average_read_milliseconds() >= 300
+
+
+@pytest.mark.asyncio
+async def test_reads_that_fail_or_time_out_are_counted_and_skipped():
+    readings = count()
+
+    def lux_source():
+        reading = next(readings)
+
+        if reading == 1:
+            raise RuntimeError("Overflow reading light channels!")
+
+        return 100.0
+
+    light_sensor = FakeTSL2591(lux_source, read_seconds=0.01)
+    statistics = LightSensorStatistics()
+    to_control, from_environment = bounded_channel.channel(32)
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    sample_task = create_task(
+        sample_light_sensor(
+            light_sensor,
+            to_control=to_control,
+            scheduler=scheduler,
+            period_seconds=0.05,
+            read_timeout_seconds=0.1,
+            deadband=Deadband(relative_tolerance=0, heartbeat_seconds=0),
+            statistics=statistics,
+        )
+    )
+    del to_control
+
+    await sleep(0.2)
+
+    # Then the sensor gets stuck
+    light_sensor.read_seconds = 0.5
+    assert await longest_gap_between_ticks(0.4) < 0.1
+
+    sample_task.cancel()
+    scheduler_task.cancel()
+    await gather(sample_task, scheduler_task, return_exceptions=True)
+
+    assert statistics.failures == 1
+    assert statistics.timeouts == 1
+
+    # Only the good readings were passed along
+    while (message_result := from_environment.try_recv()).is_ok():
+        assert message_result.unwrap().ambient_brightness == pytest.approx(
+            100 * LUX_TO_LUMENS_CONVERSION_FACTOR
+        )
+
+
+@pytest.mark.asyncio
+async def test_only_readings_that_changed_are_passed_along():
+    lux = 100.0
+
+    light_sensor = FakeTSL2591(lambda: lux, read_seconds=0)
+    statistics = LightSensorStatistics()
+    to_control, from_environment = bounded_channel.channel(32)
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    sample_task = create_task(
+        sample_light_sensor(
+            light_sensor,
+            to_control=to_control,
+            scheduler=scheduler,
+            period_seconds=0.01,
+            read_timeout_seconds=1,
+            deadband=Deadband(relative_tolerance=0.05, heartbeat_seconds=30),
+            statistics=statistics,
+        )
+    )
+    del to_control
+
+    await sleep(0.2)
+
+    # The lights are switched on
+    lux = 1000.0
+    await sleep(0.3)
+
+    sample_task.cancel()
+    scheduler_task.cancel()
+    await gather(sample_task, scheduler_task, return_exceptions=True)
+
+    brightnesses = []
+    while (message_result := from_environment.try_recv()).is_ok():
+        brightnesses.append(message_result.unwrap().ambient_brightness)
+
+    # The first reading, a handful while the smoothing catches up, and nothing after
+    assert brightnesses[0] == pytest.approx(100 * LUX_TO_LUMENS_CONVERSION_FACTOR)
+    assert brightnesses[-1] > 900 * LUX_TO_LUMENS_CONVERSION_FACTOR
+    assert len(brightnesses) < 20
+
+    assert statistics.passed_along == len(brightnesses)
+    assert statistics.recomputations_avoided > statistics.passed_along
@@ -0,0 +1,152 @@
+"""
+Unit test
+Module: 01. Environment
+Component: 06. Motion sensor driver
+"""
+
+from asyncio import create_task, gather, sleep, to_thread, wait_for
+from time import monotonic
+
+import bounded_channel
+import pytest
+from store import writable
+
+from microcontroller_application.modules.m01_environment.fake_hardware import (
+    FakeGPIO,
+)
+from microcontroller_application.modules.m01_environment.sampling_scheduler import (
+    SamplingScheduler,
+)
+from microcontroller_application.modules.m01_environment.software_components.sc06_motion_sensor_driver import (
+    MOTION_PIN,
+    POLLING_PERIOD_SECONDS,
+    POLLING_PERIOD_WHILE_OCCUPIED_SECONDS,
+    poll_motion_sensor,
+    watch_motion_sensor_edges,
+)
+
+
+@pytest.mark.asyncio
+async def test_edges_are_passed_along_right_away_without_bounces():
+    gpio = FakeGPIO()
+    to_human_detection, from_environment_motion = bounded_channel.channel(32)
+
+    watch_task = create_task(
+        watch_motion_sensor_edges(
+            gpio,
+            to_human_detection=to_human_detection,
+            pin=MOTION_PIN,
+            debounce_seconds=0.05,
+        )
+    )
+    del to_human_detection
+
+    # The state before any edges
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    assert not message.new_state
+
+    # Edges come from a thread other than the event loop's, like with RPi.GPIO
+    edge_at = monotonic()
+    await to_thread(gpio.bounce, MOTION_PIN, [1, 0, 1, 0, 1])
+
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    latency = monotonic() - edge_at
+
+    assert message.new_state
+    # Far sooner than the 0.3 seconds between polls
+    assert latency < 0.1
+
+    # All that bouncing settled on motion, so nothing else is passed along
+    await sleep(0.1)
+    assert from_environment_motion.try_recv().is_err()
+
+    await to_thread(gpio.set_input, MOTION_PIN, 0)
+
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    assert not message.new_state
+
+    watch_task.cancel()
+    await sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_bouncing_that_settles_on_the_other_state_is_passed_along_after():
+    gpio = FakeGPIO()
+    to_human_detection, from_environment_motion = bounded_channel.channel(32)
+
+    watch_task = create_task(
+        watch_motion_sensor_edges(
+            gpio,
+            to_human_detection=to_human_detection,
+            pin=MOTION_PIN,
+            debounce_seconds=0.1,
+        )
+    )
+    del to_human_detection
+
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    assert not message.new_state
+
+    await to_thread(gpio.set_input, MOTION_PIN, 1)
+
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    assert message.new_state
+
+    # While it's still being debounced, it drops back to no motion
+    await to_thread(gpio.bounce, MOTION_PIN, [0, 1, 0])
+
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    assert not message.new_state
+
+    watch_task.cancel()
+    await sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_polling_speeds_up_while_the_room_is_occupied():
+    gpio = FakeGPIO()
+    to_human_detection, from_environment_motion = bounded_channel.channel(32)
+    scheduler = SamplingScheduler()
+    occupied_store = writable(False)
+
+    scheduler_task = create_task(scheduler.run())
+    poll_task = create_task(
+        poll_motion_sensor(
+            gpio,
+            to_human_detection=to_human_detection,
+            scheduler=scheduler,
+            occupied_store=occupied_store,
+            pin=MOTION_PIN,
+        )
+    )
+    del to_human_detection
+
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    assert not message.new_state
+
+    def requested_period_seconds():
+        (report,) = scheduler.report()
+        return 1 / report.requested_per_second
+
+    assert requested_period_seconds() == pytest.approx(POLLING_PERIOD_SECONDS)
+
+    occupied_store.set(True)
+    await sleep(0)
+
+    assert requested_period_seconds() == pytest.approx(
+        POLLING_PERIOD_WHILE_OCCUPIED_SECONDS
+    )
+
+    # Noticed within the shorter period
+    gpio.set_input(MOTION_PIN, 1)
+    message = (await wait_for(from_environment_motion.recv(), timeout=5)).unwrap()
+    assert message.new_state
+
+    occupied_store.set(False)
+    await sleep(0)
+
+    assert requested_period_seconds() == pytest.approx(POLLING_PERIOD_SECONDS)
+
+    poll_task.cancel()
+    scheduler_task.cancel()
+    await gather(poll_task, scheduler_task, return_exceptions=True)
@@ -0,0 +1,81 @@
+"""
+Unit test
+Module: 01. Environment
+Component: 08. Occupancy sensor driver
+"""
+
+from asyncio import create_task, sleep, wait_for
+
+import bounded_channel
+import pytest
+from store import get, writable
+
+from microcontroller_application.modules.m01_environment.fake_hardware import (
+    FakeOccupancySensor,
+)
+from microcontroller_application.modules.m01_environment.software_components.sc08_occupancy_sensor_driver import (
+    LineParser,
+    read_occupancy_sensor,
+)
+
+
+def test_lines_are_split_out_as_they_arrive():
+    parser = LineParser()
+
+    assert parser.feed(b"$JYBSS,1, ") == []
+    assert parser.feed(b", , *\r\n$JYBSS,0, , , *\r\n$JY") == [
+        b"$JYBSS,1, , , *",
+        b"$JYBSS,0, , , *",
+    ]
+    assert parser.feed(b"BSS,1, , , *\r\n") == [b"$JYBSS,1, , , *"]
+
+
+def test_noise_without_line_endings_is_discarded():
+    parser = LineParser(maximum_line_length=16)
+
+    assert parser.feed(b"\xff" * 20) == []
+    assert parser.feed(b"$JYBSS,1\r\n") == [b"$JYBSS,1"]
+
+
+@pytest.mark.asyncio
+async def test_occupancy_changes_are_passed_along_as_lines_arrive():
+    sensor = FakeOccupancySensor()
+    to_human_detection, from_environment_occupancy = bounded_channel.channel(32)
+    occupied_store = writable(False)
+
+    read_task = create_task(
+        read_occupancy_sensor(
+            sensor.port_file_descriptor,
+            to_human_detection=to_human_detection,
+            occupied_store=occupied_store,
+        )
+    )
+    del to_human_detection
+
+    # Something else on the event loop keeps running while nothing arrives
+    ticks = 0
+    for _ in range(10):
+        await sleep(0.01)
+        ticks += 1
+    assert ticks == 10
+
+    sensor.send_occupancy(True)
+    message = (await wait_for(from_environment_occupancy.recv(), timeout=5)).unwrap()
+    assert message.new_state
+    assert get(occupied_store)
+
+    # Repeats of the same state aren't passed along, and a line split in half still counts
+    sensor.send_occupancy(True)
+    sensor.send(b"$JYBSS,0, ")
+    await sleep(0.05)
+    assert from_environment_occupancy.try_recv().is_err()
+
+    sensor.send(b", , *\r\n")
+    message = (await wait_for(from_environment_occupancy.recv(), timeout=5)).unwrap()
+    assert not message.new_state
+
+    # Once the sensor goes away, reading stops
+    sensor.unplug()
+    await wait_for(read_task, timeout=5)
+
+    sensor.close()
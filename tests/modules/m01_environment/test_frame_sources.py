@@ -0,0 +1,156 @@
+"""
+Unit test
+Module: 01. Environment
+Frame sources
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+from option_and_result import NONE, Some
+from PIL import Image
+
+from microcontroller_application.modules.m01_environment.frame_sources import (
+    ImageFolderFrameSource,
+    SyntheticFrameSource,
+    VideoFileFrameSource,
+    parse_frame_source,
+    parse_frames_per_second,
+)
+from utils.frames import FramePool
+
+THIS_FILE = Path(__file__)
+
+MODULE_FOLDER = THIS_FILE.parent
+MODULES_FOLDER = MODULE_FOLDER.parent
+
+IMAGES_01 = MODULES_FOLDER / "m08_aggregation" / "test_data" / "images_01"
+
+
+def test_image_folder_is_replayed_in_numeric_order_and_loops():
+    source = ImageFolderFrameSource(IMAGES_01, frames_per_second=NONE())
+    source.open()
+
+    width, height = source.resolution
+    pool = FramePool(shape=(height, width, 3), capacity=1)
+
+    number_of_images = len(list(IMAGES_01.iterdir()))
+
+    for index in [*range(number_of_images), 0]:
+        with pool.acquire().unwrap() as frame:
+            assert source.capture_into(frame)
+
+            expected = np.asarray(Image.open(IMAGES_01 / f"{index}.jpg"))
+            assert (frame.array == expected).all()
+
+    source.close()
+
+
+def test_image_folder_runs_out_without_looping():
+    source = ImageFolderFrameSource(
+        IMAGES_01,
+        frames_per_second=NONE(),
+        resolution=Some((64, 36)),
+        loop=False,
+    )
+    source.open()
+
+    pool = FramePool(shape=(36, 64, 3), capacity=1)
+
+    captured = 0
+    while True:
+        with pool.acquire().unwrap() as frame:
+            if not source.capture_into(frame):
+                break
+        captured += 1
+
+    assert captured == len(list(IMAGES_01.iterdir()))
+
+
+def test_video_file_is_converted_to_rgb(tmp_path: Path):
+    path = tmp_path / "red.avi"
+
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter.fourcc(*"MJPG"), 10, (32, 24))
+    if not writer.isOpened():
+        pytest.skip("this OpenCV build can't write videos")
+
+    for _ in range(3):
+        # Pure red in OpenCV's BGR order
+        writer.write(np.full((24, 32, 3), (0, 0, 255), dtype=np.uint8))
+    writer.release()
+
+    source = VideoFileFrameSource(path, frames_per_second=Some(10.0), loop=False)
+    source.open()
+
+    assert source.resolution == (32, 24)
+
+    pool = FramePool(shape=(24, 32, 3), capacity=1)
+
+    for _ in range(3):
+        with pool.acquire().unwrap() as frame:
+            assert source.capture_into(frame)
+
+            red, green, blue = frame.array.reshape(-1, 3).mean(axis=0)
+            assert red > 200 and green < 50 and blue < 50
+
+    with pool.acquire().unwrap() as frame:
+        assert not source.capture_into(frame)
+
+    source.close()
+
+
+def test_synthetic_frames_move():
+    source = SyntheticFrameSource(frames_per_second=NONE(), resolution=(160, 120))
+    source.open()
+
+    pool = FramePool(shape=(120, 160, 3), capacity=2)
+
+    first = pool.acquire().unwrap()
+    second = pool.acquire().unwrap()
+
+    assert source.capture_into(first)
+    assert source.capture_into(second)
+
+    assert not (first.array == second.array).all()
+
+
+def test_resolution_can_change_between_frames():
+    for source in [
+        SyntheticFrameSource(frames_per_second=NONE(), resolution=(160, 120)),
+        ImageFolderFrameSource(IMAGES_01, frames_per_second=NONE()),
+    ]:
+        source.open()
+
+        for resolution in [(160, 120), (64, 48)]:
+            source.change_resolution(resolution)
+            assert source.resolution == resolution
+
+            width, height = resolution
+            pool = FramePool(shape=(height, width, 3), capacity=1)
+
+            with pool.acquire().unwrap() as frame:
+                assert source.capture_into(frame)
+
+        source.close()
+
+
+def test_parsing_descriptions():
+    assert isinstance(
+        parse_frame_source("synthetic", frames_per_second=NONE()),
+        SyntheticFrameSource,
+    )
+    assert isinstance(
+        parse_frame_source("images:somewhere", frames_per_second=NONE()),
+        ImageFolderFrameSource,
+    )
+
+    with pytest.raises(ValueError):
+        parse_frame_source("webcam", frames_per_second=NONE())
+
+    assert parse_frames_per_second("free").is_none()
+    assert parse_frames_per_second("12.5") == Some(12.5)
+
+    with pytest.raises(ValueError):
+        parse_frames_per_second("0")
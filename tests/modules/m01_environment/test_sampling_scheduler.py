@@ -0,0 +1,165 @@
+"""
+Unit test
+Module: 01. Environment
+"""
+
+from asyncio import create_task, gather, sleep, wait_for
+
+import pytest
+
+from microcontroller_application.modules.m01_environment.sampling_scheduler import (
+    SamplingScheduler,
+)
+
+
+def reports_by_name(scheduler: SamplingScheduler):
+    return {report.name: report for report in scheduler.report()}
+
+
+@pytest.mark.asyncio
+async def test_each_sensor_is_sampled_at_its_own_rate():
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    samples = {"fast": 0, "slow": 0}
+
+    def sampler(name: str):
+        async def sample():
+            samples[name] += 1
+
+        return sample
+
+    fast_task = create_task(scheduler.sample_forever("fast", 0.02, sampler("fast")))
+    slow_task = create_task(scheduler.sample_forever("slow", 0.1, sampler("slow")))
+
+    await sleep(0.5)
+
+    reports = reports_by_name(scheduler)
+
+    fast_task.cancel()
+    slow_task.cancel()
+    scheduler_task.cancel()
+    await gather(fast_task, slow_task, scheduler_task, return_exceptions=True)
+
+    # About 25 and 5, give or take a loaded computer
+    assert 15 <= samples["fast"] <= 27
+    assert 3 <= samples["slow"] <= 6
+
+    assert reports["fast"].requested_per_second == pytest.approx(50)
+    assert reports["fast"].actual_per_second == pytest.approx(50, rel=0.3)
+    assert reports["slow"].actual_per_second == pytest.approx(10, rel=0.3)
+    assert reports["fast"].overruns == 0
+    assert reports["fast"].samples == samples["fast"]
+
+    # Sensors that stopped aren't reported anymore
+    assert scheduler.report() == []
+
+
+@pytest.mark.asyncio
+async def test_slow_samples_are_skipped_instead_of_piling_up():
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    running = 0
+    most_running = 0
+
+    async def sample():
+        nonlocal running, most_running
+
+        running += 1
+        most_running = max(most_running, running)
+        await sleep(0.1)
+        running -= 1
+
+    sample_task = create_task(scheduler.sample_forever("slow", 0.02, sample))
+
+    await sleep(0.5)
+
+    report = reports_by_name(scheduler)["slow"]
+
+    sample_task.cancel()
+    scheduler_task.cancel()
+    await gather(sample_task, scheduler_task, return_exceptions=True)
+
+    assert most_running == 1
+    assert report.overruns > report.samples
+    assert report.actual_per_second < report.requested_per_second / 2
+
+
+@pytest.mark.asyncio
+async def test_the_period_can_be_changed_while_sampling():
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    samples = 0
+
+    async def sample():
+        nonlocal samples
+        samples += 1
+
+    sample_task = create_task(scheduler.sample_forever("sensor", 1, sample))
+
+    await sleep(0.1)
+    assert samples == 1
+
+    # Without waiting for the rest of the long period
+    scheduler.set_period("sensor", 0.02)
+    await sleep(0.3)
+
+    report = reports_by_name(scheduler)["sensor"]
+
+    sample_task.cancel()
+    scheduler_task.cancel()
+    await gather(sample_task, scheduler_task, return_exceptions=True)
+
+    assert samples >= 10
+    assert report.requested_per_second == pytest.approx(50)
+
+
+@pytest.mark.asyncio
+async def test_an_exception_from_a_sample_stops_its_sampler():
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    async def sample():
+        raise RuntimeError("the sensor is unplugged")
+
+    with pytest.raises(RuntimeError, match="unplugged"):
+        await wait_for(scheduler.sample_forever("sensor", 0.01, sample), timeout=5)
+
+    # Another with the same name can be added after
+    with pytest.raises(RuntimeError, match="unplugged"):
+        await wait_for(scheduler.sample_forever("sensor", 0.01, sample), timeout=5)
+
+    scheduler_task.cancel()
+    await gather(scheduler_task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_a_sensor_added_again_is_only_sampled_on_its_own_schedule():
+    scheduler = SamplingScheduler()
+    scheduler_task = create_task(scheduler.run())
+
+    samples = 0
+
+    async def sample():
+        nonlocal samples
+        samples += 1
+
+    first_task = create_task(scheduler.sample_forever("sensor", 1, sample))
+    await sleep(0.5)
+
+    # Replaced before the scheduler gets to clear out the old one's next read
+    first_task.cancel()
+    second_task = create_task(scheduler.sample_forever("sensor", 1, sample))
+    await gather(first_task, return_exceptions=True)
+
+    # The old one's next read would've been due while the new one waits for its own
+    await sleep(0.7)
+
+    second_task.cancel()
+    scheduler_task.cancel()
+    await gather(second_task, scheduler_task, return_exceptions=True)
+
+    # Once by each
+    assert samples == 2
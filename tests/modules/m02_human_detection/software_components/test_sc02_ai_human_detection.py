@@ -5,13 +5,47 @@ Component: 02. AI human detection
 """
 
 
+from asyncio import create_task, wait_for
+from time import monotonic
 from pathlib import Path
 
 from datetime import datetime, timedelta, timezone
+import bounded_channel
+import numpy as np
 import pytest
+from option_and_result import NONE, Some
 
+from microcontroller_application.interfaces.message_types import (
+    CameraConsumer,
+    CameraProfile,
+    FromCameraConsumerToEnvironment,
+    FromEnvironmentToHumanDetectionCameraFrame,
+    FromHumanDetectionToActivityRecognition,
+    FromHumanDetectionToPersonIdentification,
+)
 
 from microcontroller_application.log import get_logger
+from microcontroller_application.modules.m02_human_detection.detection_scheduler import (
+    ACTIVE_INTERVAL_SECONDS,
+    DetectionScheduler,
+)
+from microcontroller_application.modules.m02_human_detection.person_detectors import (
+    HOGPersonDetector,
+)
+from microcontroller_application.modules.m02_human_detection.person_tracker import (
+    PersonTracker,
+)
+from microcontroller_application.modules.m02_human_detection.software_components.sc02_ai_human_detection import (
+    TRACKING_FRAMES_PER_SECOND,
+    Camera,
+    current_results,
+    do_human_detection,
+    follow_people_between_scans,
+    in_the_room,
+    send_to_both,
+)
+from utils import watch
+from utils.frames import FramePool, release_frame_of, retain_frame_of
 
 THIS_FILE = Path(__file__)
 
@@ -54,3 +88,287 @@ async def test_no_humans_without_blocking():
 
     ...
     assert False, "test hasn't been programmed yet"  # TODO
+
+
+class FakeDetectionPool:
+    "Finds the same (overlapping) people wherever it looks"
+
+    def __init__(self, processes: int = 2):
+        self.person_detector = HOGPersonDetector()
+        self.processes = processes
+        self.looked_at: list[tuple[int, ...]] = []
+        self.batch_sizes: list[int] = []
+
+    async def detect(self, image: np.ndarray):
+        self.looked_at.append(image.shape)
+
+        return (
+            np.array([[10, 20, 30, 60], [12, 21, 30, 60], [50, 0, 40, 80]]),
+            np.array([0.9, 1.5, 0.8]),
+        )
+
+    async def detect_batch(self, images: list[np.ndarray]):
+        self.batch_sizes.append(len(images))
+
+        return [await self.detect(image) for image in images]
+
+
+class FakeFrame:
+    frame_id = 7
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def grayscale(self) -> np.ndarray:
+        return self.array[:, :, 0]
+
+
+@pytest.mark.asyncio
+async def test_detections_say_where_people_are():
+    # Each pixel says where it is, so the crops can be checked
+    height, width = 100, 80
+    y, x = np.mgrid[0:height, 0:width]
+    array = np.dstack([x, y, np.zeros_like(x)]).astype(np.uint8)
+
+    detections, crops = await do_human_detection(
+        FakeDetectionPool(), FakeFrame(array), NONE(), PersonTracker()
+    )
+
+    # The less confident of the overlapping pair is gone, and the rest are most confident first
+    assert [detection.box for detection in detections] == [
+        (12, 21, 42, 81),
+        # Clipped to the frame
+        (50, 0, 80, 80),
+    ]
+    assert [detection.confidence for detection in detections] == [1.5, 0.8]
+    assert {detection.frame_id for detection in detections} == {7}
+    assert [detection.track_id for detection in detections] == [0, 1]
+
+    # Both the same shape as the box, so scaled up to fill the whole crop
+    assert crops.shape == (2, 384, 192, 3)
+    image = detections[0].image
+    assert image.base is crops
+    # The top left pixel of the crop is the top left corner of the box
+    assert image[0, 0].tolist() == [12, 21, 0]
+    assert image[-1, -1].tolist() == [41, 80, 0]
+
+
+@pytest.mark.asyncio
+async def test_people_found_in_regions_are_where_they_are_in_the_frame():
+    array = np.zeros((200, 300, 3), dtype=np.uint8)
+    detection_pool = FakeDetectionPool()
+
+    detections, _crops = await do_human_detection(
+        detection_pool, FakeFrame(array), Some([(100, 50, 200, 190)]), PersonTracker()
+    )
+
+    # Only the region was looked at
+    assert detection_pool.looked_at == [(140, 100)]
+    assert [detection.box for detection in detections] == [
+        (112, 71, 142, 131),
+        (150, 50, 190, 130),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_regions_are_looked_at_in_a_batch_for_each_worker():
+    array = np.zeros((200, 300, 3), dtype=np.uint8)
+    detection_pool = FakeDetectionPool(processes=2)
+
+    detections, _crops = await do_human_detection(
+        detection_pool,
+        FakeFrame(array),
+        Some([(0, 0, 90, 90), (100, 100, 190, 190), (200, 0, 290, 90)]),
+        PersonTracker(),
+    )
+
+    assert sorted(detection_pool.batch_sizes) == [1, 2]
+    # Each still where it was found in its own region
+    assert sorted(detection.box[:2] for detection in detections) == [
+        (12, 21),
+        (50, 0),
+        (112, 121),
+        (150, 100),
+        (212, 21),
+        (250, 0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_everyone_each_camera_saw_is_in_the_room():
+    results = []
+
+    for camera_id in range(2):
+        # Each camera's frame is a different shade
+        array = np.full((200, 300, 3), 100 * camera_id, dtype=np.uint8)
+
+        results.append(
+            await do_human_detection(
+                FakeDetectionPool(),
+                FakeFrame(array),
+                NONE(),
+                PersonTracker(),
+                camera_id=camera_id,
+            )
+        )
+
+    detections, crops = in_the_room(results)
+
+    assert [(detection.camera_id, detection.track_id) for detection in detections] == [
+        (0, 0),
+        (0, 1),
+        (1, 0),
+        (1, 1),
+    ]
+    assert crops.shape == (4, 384, 192, 3)
+    assert not crops.flags.writeable
+    assert all(detection.image.base is crops for detection in detections)
+    assert detections[2].image.max() == 100
+
+    # With just one camera, there's nothing to merge
+    assert in_the_room(results[:1]) is results[0]
+
+
+def room_with_someone_at(x: int, y: int) -> np.ndarray:
+    # Plain walls, and someone with enough texture to follow
+    frame = np.full((480, 640, 3), 100, dtype=np.uint8)
+    frame[y : y + 160, x : x + 80] = np.random.default_rng(0).integers(
+        0, 255, size=(160, 80, 1)
+    )
+
+    return frame
+
+
+@pytest.mark.asyncio
+async def test_people_are_followed_between_scans_while_there_are_any():
+    frame_sender, frame_receiver = watch.channel(
+        retain=retain_frame_of, release=release_frame_of
+    )
+    demand_sender, demand_receiver = bounded_channel.channel(8)
+
+    camera = Camera(
+        camera_id=0,
+        from_environment_camera_frame=frame_receiver,
+        foreground_gate=NONE(),
+        person_tracker=PersonTracker(),
+        detection_cache=NONE(),
+        detection_mask=NONE(),
+    )
+
+    pool = FramePool(shape=(480, 640, 3), capacity=3)
+
+    async def send_frame(array: np.ndarray):
+        frame = pool.acquire().unwrap()
+        frame.array[:] = array
+
+        frame_sender.send(FromEnvironmentToHumanDetectionCameraFrame(frame=frame))
+        await wait_for(frame_sender.wait_until_received(), timeout=5)
+
+    # What a scan found
+    camera.person_tracker.follow(room_with_someone_at(100, 100)[:, :, 0])
+    camera.person_tracker.detected(
+        np.array([[100, 100, 180, 260]]), np.array([1.0]), looked_in=NONE()
+    )
+    camera.people_to_follow.set()
+
+    following = create_task(
+        follow_people_between_scans(
+            camera=camera, to_environment_camera_demand=demand_sender
+        )
+    )
+
+    # Frames are asked for while there's someone to follow
+    assert (await wait_for(demand_receiver.recv(), timeout=5)).unwrap() == (
+        FromCameraConsumerToEnvironment(
+            CameraConsumer.PERSON_TRACKING,
+            TRACKING_FRAMES_PER_SECOND,
+            CameraProfile.DETECTION,
+            0,
+        )
+    )
+
+    for step in range(1, 4):
+        await send_frame(room_with_someone_at(100 + 8 * step, 100))
+
+    # Followed to the last one that was received
+    (track,) = camera.person_tracker.tracks
+    assert track.box[0] > 100
+
+    # Once they're gone, the camera can idle again
+    await send_frame(np.full((480, 640, 3), 100, dtype=np.uint8))
+
+    assert (await wait_for(demand_receiver.recv(), timeout=5)).unwrap() == (
+        FromCameraConsumerToEnvironment(
+            CameraConsumer.PERSON_TRACKING, 0, CameraProfile.DETECTION, 0
+        )
+    )
+    assert not camera.people_to_follow.is_set()
+
+    following.cancel()
+
+
+def test_cameras_whose_latest_scan_is_too_old_are_left_out():
+    detection_scheduler = DetectionScheduler(cpu_budget=1, cameras=2)
+
+    cameras = []
+    for camera_id in range(2):
+        frame_receiver = watch.channel()[1]
+        cameras.append(
+            Camera(
+                camera_id=camera_id,
+                from_environment_camera_frame=frame_receiver,
+                foreground_gate=NONE(),
+                person_tracker=PersonTracker(),
+                detection_cache=NONE(),
+                detection_mask=NONE(),
+            )
+        )
+
+        # Both saw things moving
+        detection_scheduler.finished(
+            seconds=0.1, change=0.2, people=True, camera_id=camera_id
+        )
+
+    crops = np.empty((0, 384, 192, 3), dtype=np.uint8)
+
+    # Just scanned
+    cameras[0].latest = Some((monotonic(), [], crops))
+    # And not for longer than a turn each and one more would take
+    cameras[1].latest = Some((monotonic() - 4 * ACTIVE_INTERVAL_SECONDS, [], crops))
+
+    assert len(current_results(cameras, detection_scheduler)) == 1
+
+    cameras[1].latest = Some((monotonic() - ACTIVE_INTERVAL_SECONDS, [], crops))
+
+    assert len(current_results(cameras, detection_scheduler)) == 2
+
+
+def test_results_are_sent_to_both_or_neither_without_waiting():
+    """
+    When person identification has fallen behind,
+    then a frame's results are dropped for activity recognition too,
+    instead of waiting for it to catch up
+    """
+
+    to_activity_recognition, from_activity_recognition = bounded_channel.channel(2)
+    to_person_identification, from_person_identification = bounded_channel.channel(1)
+
+    crops = np.empty((0, 384, 192, 3), dtype=np.uint8)
+
+    def send(frame_id: int) -> bool:
+        return send_to_both(
+            to_activity_recognition,
+            FromHumanDetectionToActivityRecognition([], crops, frame_id, monotonic()),
+            to_person_identification,
+            FromHumanDetectionToPersonIdentification([], crops, frame_id, monotonic()),
+        )
+
+    assert send(1)
+    assert not send(2)
+
+    assert from_person_identification.try_recv().unwrap().frame_id == 1
+    assert send(3)
+
+    assert [
+        from_activity_recognition.try_recv().unwrap().frame_id for _ in range(2)
+    ] == [1, 3]
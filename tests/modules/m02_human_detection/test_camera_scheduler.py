@@ -0,0 +1,62 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+from collections import Counter
+
+import pytest
+
+from microcontroller_application.modules.m02_human_detection.camera_scheduler import (
+    CameraScheduler,
+)
+
+
+def scan(camera_scheduler: CameraScheduler, changes: list[float], times: int):
+    "Which cameras were scanned, with each camera always seeing the same change"
+
+    scanned = []
+
+    for _ in range(times):
+        camera_id = camera_scheduler.next_camera()
+        camera_scheduler.finished(camera_id, seconds=0.5, change=changes[camera_id])
+        scanned.append(camera_id)
+
+    return scanned
+
+
+def test_cameras_seeing_as_much_change_take_turns():
+    camera_scheduler = CameraScheduler(3)
+
+    assert scan(camera_scheduler, [0.2, 0.2, 0.2], 6) == [0, 1, 2, 0, 1, 2]
+
+
+def test_cameras_seeing_more_change_are_scanned_more():
+    camera_scheduler = CameraScheduler(2)
+
+    scanned = Counter(scan(camera_scheduler, [0.45, 0.0], 100))
+
+    # Weights of 0.5 and 0.05
+    assert scanned[0] == pytest.approx(100 * 10 / 11, abs=2)
+    # But the quiet camera is still looked at now and then
+    assert scanned[1] >= 5
+
+
+def test_a_camera_that_was_quiet_is_looked_at_soon_after_it_sees_change():
+    camera_scheduler = CameraScheduler(2)
+
+    # Only the first camera's seen anything for a long time
+    scan(camera_scheduler, [0.5, 0.0], 100)
+
+    # Now someone walks into view of the second (which isn't known until it's scanned)
+    scanned = scan(camera_scheduler, [0.0, 0.5], 12)
+
+    first_look = scanned.index(1)
+    assert first_look <= 4
+    # And from then on, it's the one that's mostly looked at
+    assert scanned[first_look:].count(1) >= 0.8 * len(scanned[first_look:])
+
+
+def test_there_has_to_be_a_camera():
+    with pytest.raises(ValueError):
+        CameraScheduler(0)
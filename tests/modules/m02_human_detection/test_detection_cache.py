@@ -0,0 +1,124 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+from imagehash import phash
+from PIL import Image
+
+from microcontroller_application.modules.m02_human_detection.detection_cache import (
+    HASH_IMAGE_SIZE,
+    CachedDetection,
+    DetectionCache,
+    hamming_distance,
+    normalized,
+    perceptual_hash,
+)
+
+THIS_FILE = Path(__file__)
+
+MODULE_FOLDER = THIS_FILE.parent
+
+# Frames from the room's camera
+TEST_IMAGES_FOLDER = (
+    MODULE_FOLDER.parent / "m08_aggregation" / "test_data" / "images_01"
+)
+
+
+def cached(seconds: float) -> CachedDetection:
+    return CachedDetection(
+        boxes=np.array([[0, 0, 0.125, 0.25]]),
+        confidences=np.array([1.0]),
+        seconds=seconds,
+    )
+
+
+def test_the_hash_is_the_same_as_imagehash():
+    for path in sorted(TEST_IMAGES_FOLDER.glob("*.jpg")):
+        # Already shrunk the same way, so the only difference is the rest of the hashing
+        image = (
+            Image.open(path)
+            .convert("L")
+            .resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.LANCZOS)
+        )
+
+        expected = int(str(phash(image)), 16)
+
+        assert perceptual_hash(np.asarray(image)) == expected, path
+
+
+def room(seed: int) -> np.ndarray:
+    # Furniture and walls, as big blurry blocks
+    random = np.random.default_rng(seed)
+    blocks = random.integers(0, 255, size=(9, 16), dtype=np.uint8)
+
+    return cv2.GaussianBlur(
+        cv2.resize(blocks, (1280, 720), interpolation=cv2.INTER_NEAREST), (31, 31), 0
+    )
+
+
+def test_the_same_scene_has_close_hashes_and_different_ones_do_not():
+    grayscale = room(seed=0)
+
+    # Sensor noise and a bit of compression
+    random = np.random.default_rng(1)
+    noisy = np.clip(grayscale + random.normal(0, 4, grayscale.shape), 0, 255)
+    _, jpeg = cv2.imencode(
+        ".jpg", noisy.astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 60]
+    )
+    recompressed = cv2.imdecode(jpeg, cv2.IMREAD_GRAYSCALE)
+
+    assert (
+        hamming_distance(perceptual_hash(grayscale), perceptual_hash(recompressed)) <= 2
+    )
+    assert (
+        hamming_distance(perceptual_hash(grayscale), perceptual_hash(room(seed=2))) > 10
+    )
+
+
+def test_close_enough_hashes_reuse_results():
+    detection_cache = DetectionCache(size=4, tolerance=2)
+
+    detection_cache.put(0b1111_0000, cached(seconds=0.5))
+
+    # 2 bits off
+    hit = detection_cache.get(0b1111_0011)
+    assert hit.unwrap().boxes.tolist() == [[0, 0, 0.125, 0.25]]
+
+    # 3 bits off
+    assert detection_cache.get(0b1111_0111).is_none()
+
+    assert detection_cache.statistics.hit_rate() == 0.5
+    assert detection_cache.statistics.saved_seconds == 0.5
+
+
+def test_the_least_recently_used_are_forgotten():
+    detection_cache = DetectionCache(size=2, tolerance=0)
+
+    detection_cache.put(1, cached(seconds=1))
+    detection_cache.put(2, cached(seconds=2))
+
+    # Used, so it's the most recently used now
+    assert detection_cache.get(1).is_some()
+
+    detection_cache.put(4, cached(seconds=4))
+
+    assert detection_cache.get(2).is_none()
+    assert detection_cache.get(1).is_some()
+    assert detection_cache.get(4).is_some()
+
+
+def test_boxes_fit_any_resolution_the_scene_is_seen_at():
+    # Found at the detection resolution
+    boxes = normalized([np.array([128, 96, 192, 288])], (384, 512))
+
+    # And reused at the high detail one
+    cached_detection = CachedDetection(
+        boxes=boxes, confidences=np.array([1.0]), seconds=1
+    )
+
+    assert cached_detection.boxes_in((960, 1280, 3)).tolist() == [[320, 240, 480, 720]]
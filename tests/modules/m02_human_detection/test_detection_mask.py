@@ -0,0 +1,125 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+import json
+
+import numpy as np
+import pytest
+from option_and_result import Some
+
+from microcontroller_application.modules.m02_human_detection.detection_mask import (
+    load_detection_mask,
+    mask_path_for_camera,
+    parse_detection_mask,
+)
+from microcontroller_application.modules.m02_human_detection.foreground_gate import (
+    WARM_UP_FRAMES,
+    ForegroundGate,
+)
+
+# The bottom half, but not the TV in its top right
+MASK = {
+    "include": [[[0, 0.5], [1, 0.5], [1, 1], [0, 1]]],
+    "exclude": [[[0.75, 0.5], [1, 0.5], [1, 0.75], [0.75, 0.75]]],
+}
+
+
+def test_masks_are_drawn_at_the_frames_size():
+    detection_mask = parse_detection_mask(MASK)
+
+    rasterized_mask = detection_mask.rasterize((400, 800))
+
+    assert rasterized_mask.bitmap.shape == (400, 800)
+    assert rasterized_mask.bounds == (0, 200, 800, 400)
+    # Only drawn once
+    assert detection_mask.rasterize((400, 800)) is rasterized_mask
+
+    assert rasterized_mask.bitmap[100, 100] == 0
+    assert rasterized_mask.bitmap[300, 100] == 255
+    assert rasterized_mask.bitmap[250, 700] == 0
+    assert rasterized_mask.bitmap[350, 700] == 255
+
+
+def test_regions_are_kept_inside_the_mask():
+    rasterized_mask = parse_detection_mask(MASK).rasterize((400, 800))
+
+    regions = rasterized_mask.clip(
+        [(10, 10, 100, 100), (10, 150, 100, 250), (300, 300, 310, 310)],
+        minimum_size=(64, 128),
+    )
+
+    # The first isn't even partly in it, so it's left out
+    assert regions == [
+        # Cut off at the top of the mask, then grown back to the minimum size
+        (10, 200, 100, 328),
+        # Grown to the minimum size
+        (273, 241, 337, 369),
+    ]
+
+
+def test_people_standing_somewhere_excluded_are_thrown_out():
+    rasterized_mask = parse_detection_mask(MASK).rasterize((400, 800))
+
+    included = rasterized_mask.includes_feet(
+        np.array(
+            [
+                # Standing on the floor
+                [100, 150, 160, 390],
+                # Someone on the TV
+                [650, 200, 700, 290],
+                # Floating near the ceiling
+                [100, 0, 160, 100],
+            ]
+        )
+    )
+
+    assert included.tolist() == [True, False, False]
+
+
+def test_movement_outside_the_mask_is_ignored():
+    rasterized_mask = parse_detection_mask(MASK).rasterize((480, 640))
+
+    random = np.random.default_rng(0)
+    room = random.integers(80, 120, size=(480, 640), dtype=np.uint8)
+
+    foreground_gate = ForegroundGate()
+    for _ in range(WARM_UP_FRAMES + 5):
+        foreground_gate.regions(room, minimum_size=(64, 128))
+
+    # The TV changed channel
+    frame = room.copy()
+    frame[250:350, 500:620] = 255
+
+    regions = foreground_gate.regions(
+        frame, minimum_size=(64, 128), mask=Some(rasterized_mask.bitmap)
+    )
+
+    assert regions.unwrap() == []
+
+
+def test_masks_are_optional_but_have_to_make_sense(tmp_path):
+    assert load_detection_mask(tmp_path / "missing.json").is_none()
+
+    path = tmp_path / "mask.json"
+    path.write_text(json.dumps(MASK), encoding="utf8")
+    assert load_detection_mask(path).unwrap().exclude == [
+        [(0.75, 0.5), (1, 0.5), (1, 0.75), (0.75, 0.75)]
+    ]
+
+    with pytest.raises(ValueError):
+        parse_detection_mask({"include": [[[0, 0], [1, 1]]]})
+
+    with pytest.raises(ValueError):
+        parse_detection_mask({"include": [[[0, 0], [2, 0], [1, 1]]]})
+
+    with pytest.raises(ValueError):
+        parse_detection_mask({"ignore": []})
+
+
+def test_each_camera_has_its_own_mask(tmp_path):
+    path = tmp_path / "human-detection-mask.json"
+
+    assert mask_path_for_camera(path, 0) == path
+    assert mask_path_for_camera(path, 2) == tmp_path / "human-detection-mask-2.json"
@@ -0,0 +1,104 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+from asyncio import gather
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from microcontroller_application.modules.m02_human_detection.detection_pool import (
+    DetectionPool,
+)
+from microcontroller_application.modules.m02_human_detection.person_detectors import (
+    HOGPersonDetector,
+)
+
+THIS_FILE = Path(__file__)
+
+MODULE_FOLDER = THIS_FILE.parent
+
+# Frames from the room's camera
+TEST_IMAGES_FOLDER = (
+    MODULE_FOLDER.parent / "m08_aggregation" / "test_data" / "images_01"
+)
+
+
+@pytest.mark.asyncio
+async def test_workers_find_the_same_people_as_in_process():
+    grayscale = cv2.imread(str(TEST_IMAGES_FOLDER / "0.jpg"), cv2.IMREAD_GRAYSCALE)
+
+    # Low enough that HOG finds something in this empty room
+    person_detector = HOGPersonDetector(scale=0.75, confidence_threshold=0)
+
+    in_process = HOGPersonDetector(scale=0.75, confidence_threshold=0)
+    in_process.load()
+    ((expected_boxes, expected_weights),) = in_process.detect_batch([grayscale])
+
+    detection_pool = DetectionPool(person_detector, processes=1, maximum_in_flight=2)
+
+    try:
+        boxes, weights = await detection_pool.detect(grayscale)
+    finally:
+        detection_pool.close()
+
+    assert len(boxes) > 0
+    assert boxes.tolist() == expected_boxes.tolist()
+    assert weights == pytest.approx(expected_weights)
+
+
+@pytest.mark.asyncio
+async def test_requests_past_the_in_flight_limit_wait_their_turn():
+    small = np.zeros((192, 256), dtype=np.uint8)
+    # Bigger than the shared memory made for the small ones
+    big = np.zeros((384, 512), dtype=np.uint8)
+
+    detection_pool = DetectionPool(
+        HOGPersonDetector(), processes=2, maximum_in_flight=2
+    )
+
+    try:
+        results = await gather(
+            *(detection_pool.detect(image) for image in [small, small, big, small])
+        )
+    finally:
+        detection_pool.close()
+
+    for (boxes, weights) in results:
+        assert boxes.shape == (0, 4)
+        assert len(weights) == 0
+
+    # Only ever one block of shared memory per request in flight
+    assert detection_pool._shared_memory.qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_a_batch_finds_the_same_people_as_one_image_at_a_time():
+    grayscale = cv2.imread(str(TEST_IMAGES_FOLDER / "0.jpg"), cv2.IMREAD_GRAYSCALE)
+
+    # Different sizes, packed into the same shared memory
+    images = [grayscale, grayscale[:, : grayscale.shape[1] // 2], grayscale[::2, ::2]]
+
+    detection_pool = DetectionPool(
+        HOGPersonDetector(scale=0.75, confidence_threshold=0),
+        processes=1,
+        maximum_in_flight=2,
+    )
+
+    try:
+        one_at_a_time = [await detection_pool.detect(image) for image in images]
+        batched = await detection_pool.detect_batch(images)
+        assert await detection_pool.detect_batch([]) == []
+    finally:
+        detection_pool.close()
+
+    assert len(batched) == len(images)
+
+    for ((boxes, weights), (expected_boxes, expected_weights)) in zip(
+        batched, one_at_a_time
+    ):
+        assert boxes.tolist() == expected_boxes.tolist()
+        assert weights == pytest.approx(expected_weights)
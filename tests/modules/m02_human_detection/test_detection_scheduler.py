@@ -0,0 +1,130 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+from asyncio import create_task, gather, sleep, wait_for
+
+import pytest
+
+from microcontroller_application.modules.m02_human_detection.detection_scheduler import (
+    ACTIVE_INTERVAL_SECONDS,
+    IDLE_INTERVAL_SECONDS,
+    OCCUPIED_INTERVAL_SECONDS,
+    DetectionScheduler,
+)
+
+
+@pytest.mark.asyncio
+async def test_requests_while_scanning_are_coalesced_into_one_more_scan():
+    detection_scheduler = DetectionScheduler(cpu_budget=1)
+
+    detection_scheduler.request()
+    await wait_for(detection_scheduler.wait(), timeout=1)
+
+    # Motion a few times during the scan
+    for _ in range(3):
+        detection_scheduler.request()
+
+    detection_scheduler.finished(seconds=0.01, change=0, people=False)
+
+    # One more scan straight away
+    await wait_for(detection_scheduler.wait(), timeout=1)
+    detection_scheduler.finished(seconds=0.01, change=0, people=False)
+
+    # But not another
+    next_scan = create_task(detection_scheduler.wait())
+    await sleep(0.05)
+    assert not next_scan.done()
+
+    next_scan.cancel()
+    await gather(next_scan, return_exceptions=True)
+
+    report = detection_scheduler.report()
+    assert report.scans == 2
+    assert report.requests == 4
+    assert report.coalesced == 3
+
+
+@pytest.mark.asyncio
+async def test_scans_are_kept_within_the_budget():
+    detection_scheduler = DetectionScheduler(cpu_budget=0.5)
+
+    detection_scheduler.request()
+    await detection_scheduler.wait()
+    detection_scheduler.finished(seconds=0.1, change=0, people=False)
+
+    # Asked for straight away, but scanning for 0.1 s only fits half the time
+    # with another 0.1 s gap
+    detection_scheduler.request()
+    next_scan = create_task(detection_scheduler.wait())
+
+    await sleep(0.05)
+    assert not next_scan.done()
+
+    await wait_for(next_scan, timeout=1)
+
+    report = detection_scheduler.report()
+    assert report.budgeted_scans_per_minute == pytest.approx(300)
+
+
+def test_the_interval_follows_what_the_scans_see():
+    detection_scheduler = DetectionScheduler(cpu_budget=1)
+
+    def interval() -> float:
+        return detection_scheduler.report().interval_seconds
+
+    assert interval() == IDLE_INTERVAL_SECONDS
+
+    # Someone walked in
+    detection_scheduler.finished(seconds=0.1, change=0.2, people=True)
+    assert interval() == ACTIVE_INTERVAL_SECONDS
+
+    # And sat down
+    intervals = []
+    for _ in range(5):
+        detection_scheduler.finished(seconds=0.1, change=0, people=True)
+        intervals.append(interval())
+
+    # Backing off gradually
+    assert intervals == [4, 8, OCCUPIED_INTERVAL_SECONDS, 15, 15]
+
+    # And left
+    for _ in range(10):
+        detection_scheduler.finished(seconds=0.1, change=0, people=False)
+
+    assert interval() == IDLE_INTERVAL_SECONDS
+
+    # The occupancy sensor's enough for it to check more often
+    detection_scheduler.set_occupied(True)
+    assert interval() == OCCUPIED_INTERVAL_SECONDS
+    assert detection_scheduler.report().requests == 1
+
+
+def test_each_camera_has_its_own_interval_and_the_soonest_counts():
+    detection_scheduler = DetectionScheduler(cpu_budget=1, cameras=2)
+
+    # Someone's moving in front of the first camera, and the second sees nobody
+    detection_scheduler.finished(seconds=0.1, change=0.2, people=True, camera_id=0)
+    detection_scheduler.finished(seconds=0.1, change=0, people=False, camera_id=1)
+
+    assert detection_scheduler.interval_seconds_of(0) == ACTIVE_INTERVAL_SECONDS
+    assert detection_scheduler.interval_seconds_of(1) == IDLE_INTERVAL_SECONDS
+
+    # Whichever finished last, scans are still due as soon as the first camera needs one
+    assert detection_scheduler.report().interval_seconds == ACTIVE_INTERVAL_SECONDS
+
+    # The occupancy sensor is for the whole room
+    detection_scheduler.set_occupied(True)
+    assert detection_scheduler.interval_seconds_of(1) == OCCUPIED_INTERVAL_SECONDS
+
+    with pytest.raises(ValueError):
+        DetectionScheduler(cpu_budget=1, cameras=0)
+
+
+def test_the_budget_has_to_make_sense():
+    with pytest.raises(ValueError):
+        DetectionScheduler(cpu_budget=0)
+
+    with pytest.raises(ValueError):
+        DetectionScheduler(cpu_budget=1.5)
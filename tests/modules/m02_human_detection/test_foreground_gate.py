@@ -0,0 +1,66 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+import numpy as np
+
+from microcontroller_application.modules.m02_human_detection.foreground_gate import (
+    WARM_UP_FRAMES,
+    ForegroundGate,
+)
+
+MINIMUM_SIZE = (64, 128)
+
+
+def empty_room() -> np.ndarray:
+    # Some texture, so the background model has something to learn
+    random = np.random.default_rng(0)
+    return random.integers(80, 120, size=(480, 640), dtype=np.uint8)
+
+
+def test_the_whole_frame_is_scanned_until_the_background_is_learned():
+    foreground_gate = ForegroundGate()
+
+    for _ in range(WARM_UP_FRAMES):
+        assert foreground_gate.regions(
+            empty_room(), minimum_size=MINIMUM_SIZE
+        ).is_none()
+
+    assert foreground_gate.statistics.full_frames == WARM_UP_FRAMES
+
+
+def test_nothing_is_scanned_when_nothing_moved():
+    foreground_gate = ForegroundGate()
+
+    for _ in range(WARM_UP_FRAMES + 5):
+        regions = foreground_gate.regions(empty_room(), minimum_size=MINIMUM_SIZE)
+
+    assert regions.unwrap() == []
+    assert foreground_gate.statistics.empty == 5
+
+
+def test_only_around_what_moved_is_scanned():
+    foreground_gate = ForegroundGate()
+
+    for _ in range(WARM_UP_FRAMES + 5):
+        foreground_gate.regions(empty_room(), minimum_size=MINIMUM_SIZE)
+
+    # Someone walked in
+    frame = empty_room()
+    frame[200:320, 400:440] = 255
+
+    regions = foreground_gate.regions(frame, minimum_size=MINIMUM_SIZE).unwrap()
+
+    assert len(regions) == 1
+    ((x_start, y_start, x_end, y_end),) = regions
+
+    # With room to spare around them
+    assert x_start < 400 and 440 < x_end
+    assert y_start < 200 and 320 < y_end
+    assert x_end - x_start >= MINIMUM_SIZE[0]
+    assert y_end - y_start >= MINIMUM_SIZE[1]
+
+    # But nowhere near the whole frame
+    assert (x_end - x_start) * (y_end - y_start) < 640 * 480 / 4
+    assert 0 < foreground_gate.statistics.average_fraction_scanned() < 1
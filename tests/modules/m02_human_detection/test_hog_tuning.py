@@ -0,0 +1,132 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from microcontroller_application.modules.m02_human_detection.hog_tuning import (
+    HOGTuning,
+    SweepResult,
+    at_detection_resolution,
+    load_hog_tuning,
+    match,
+    recommend,
+    recorded_frames,
+    save_hog_tuning,
+    sweep,
+)
+from microcontroller_application.modules.m02_human_detection.person_detectors import (
+    HOGParameters,
+)
+
+TEST_IMAGE = "tests/modules/m08_aggregation/test_data/images_01/0.jpg"
+
+
+def result(p90_milliseconds, true_positives, false_positives, false_negatives):
+    return SweepResult(
+        HOGTuning(1.0, 0.0, HOGParameters()),
+        p90_milliseconds,
+        p90_milliseconds,
+        p90_milliseconds,
+        true_positives,
+        false_positives,
+        false_negatives,
+    )
+
+
+def test_each_person_is_only_found_once():
+    labelled = np.array([[0, 0, 100, 200], [300, 0, 400, 200]])
+    found = np.array(
+        [
+            # Both on the first person, but only one counts
+            [5, 5, 105, 205],
+            [0, 10, 100, 210],
+            # Nowhere near anyone
+            [600, 0, 700, 200],
+        ]
+    )
+
+    assert match(found, labelled) == (1, 2, 1)
+    assert match(found[:0], labelled) == (0, 0, 2)
+    assert match(found, labelled[:0]) == (0, 3, 0)
+
+
+def test_the_fastest_settings_about_as_accurate_as_the_best_are_recommended():
+    most_accurate = result(100, 10, 0, 0)
+    almost_as_accurate = result(40, 10, 1, 0)
+    fastest = result(10, 5, 5, 5)
+
+    assert most_accurate.f1_score() == 1
+    assert recommend([most_accurate, almost_as_accurate, fastest]) is (
+        almost_as_accurate
+    )
+
+
+def test_tuning_is_saved_and_loaded(tmp_path):
+    path = tmp_path / "tuning.json"
+    assert load_hog_tuning(path).is_none()
+
+    tuning = HOGTuning(0.5, 0.3, HOGParameters((16, 16), (8, 8), 1.1))
+    save_hog_tuning(path, tuning)
+
+    assert load_hog_tuning(path).unwrap() == tuning
+
+    path.write_text(json.dumps({"scale": 2}), encoding="utf8")
+    with pytest.raises(ValueError):
+        load_hog_tuning(path)
+
+    # OpenCV would only complain about this once people are looked for
+    save_hog_tuning(path, HOGTuning(0.5, 0.3, HOGParameters((12, 12), (8, 8), 1.1)))
+    with pytest.raises(ValueError, match="stride"):
+        load_hog_tuning(path)
+
+
+def test_every_combination_is_measured():
+    image = cv2.imread(TEST_IMAGE, cv2.IMREAD_GRAYSCALE)
+    image = cv2.resize(image, (320, 180))
+
+    results = sweep(
+        [image, image],
+        [np.zeros((0, 4)), np.zeros((0, 4))],
+        win_strides=[(8, 8), (16, 16)],
+        paddings=[(0, 0)],
+        pyramid_scales=[1.2],
+        scales=[1.0, 0.5],
+        confidence_thresholds=[0.5, 100],
+    )
+
+    assert len(results) == 2 * 2 * 2
+    assert all(
+        0 <= result.p50_milliseconds <= result.p90_milliseconds for result in results
+    )
+    # Nobody's there, so anything found is a false positive
+    assert all(
+        result.true_positives == result.false_negatives == 0 for result in results
+    )
+    assert all(
+        result.false_positives == 0
+        for result in results
+        if result.tuning.confidence_threshold == 100
+    )
+
+
+def test_recordings_are_swept_at_the_resolution_detection_looks_at(tmp_path: Path):
+    # Saved by camera recording, and by other tools
+    for name in ["0.jpeg", "1.jpg", "labels.json"]:
+        (tmp_path / name).touch()
+
+    assert [path.name for path in recorded_frames(tmp_path)] == ["0.jpeg", "1.jpg"]
+
+    # Recorded in high detail
+    image = np.zeros((960, 1280), dtype=np.uint8)
+
+    resized, boxes = at_detection_resolution(image, np.array([[100, 200, 300, 600]]))
+
+    assert resized.shape == (384, 512)
+    assert boxes.tolist() == [[40, 80, 120, 240]]
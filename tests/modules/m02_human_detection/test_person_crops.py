@@ -0,0 +1,43 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+import numpy as np
+import pytest
+
+from microcontroller_application.modules.m02_human_detection.person_crops import (
+    crop_people,
+)
+
+
+def test_people_are_cropped_into_one_read_only_batch():
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    # A red person and a wide green one
+    image[0:100, 0:50] = [255, 0, 0]
+    image[100:150, 100:300] = [0, 255, 0]
+
+    crops = crop_people(image, [(0, 0, 50, 100), (100, 100, 300, 150)], size=(40, 80))
+
+    assert crops.shape == (2, 80, 40, 3)
+    assert crops.dtype == np.uint8
+    assert crops.flags.c_contiguous
+
+    # The same shape as the crop, so it fills it
+    assert (crops[0] == [255, 0, 0]).all()
+
+    # Shrunk to fit the width, in the middle, with black above and below
+    assert (crops[1, 35:45] == [0, 255, 0]).all()
+    assert (crops[1, :30] == 0).all()
+    assert (crops[1, 50:] == 0).all()
+
+    with pytest.raises(ValueError):
+        crops[0, 0, 0] = 0
+
+
+def test_nobody_is_an_empty_batch():
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+
+    assert crop_people(image, [], size=(40, 80)).shape == (0, 80, 40, 3)
+    # Boxes clipped down to nothing are left black
+    assert not crop_people(image, [(300, 0, 300, 100)], size=(40, 80)).any()
@@ -0,0 +1,375 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+from os import getenv
+from pathlib import Path
+from time import perf_counter
+
+import cv2
+import numpy as np
+import pytest
+
+from microcontroller_application.log import get_logger
+from microcontroller_application.modules.m02_human_detection.person_detectors import (
+    HOG_CONFIDENCE_THRESHOLD,
+    HOG_WINDOW_SIZE,
+    DNNPersonDetector,
+    HOGPersonDetector,
+    PersonDetector,
+    detect_people,
+    non_max_suppression,
+    parse_input_size,
+    parse_person_detector,
+    parse_ssd_output,
+    parse_yolo_output,
+    regions_around,
+)
+from option_and_result import NONE, Some
+
+THIS_FILE = Path(__file__)
+
+MODULE_FOLDER = THIS_FILE.parent
+
+# Frames from the room's camera (with nobody in them)
+TEST_IMAGES_FOLDER = (
+    MODULE_FOLDER.parent / "m08_aggregation" / "test_data" / "images_01"
+)
+
+LOGGER = get_logger(__name__)
+
+
+class FakeHOG:
+    "Finds people wherever it's told to, in images of a given size"
+
+    def __init__(self, boxes_by_size: dict[tuple[int, int], list[list[int]]]):
+        self.boxes_by_size = boxes_by_size
+        self.scanned_sizes: list[tuple[int, int]] = []
+
+    def detectMultiScale(self, image, winStride, padding, scale):
+        size = (image.shape[1], image.shape[0])
+        self.scanned_sizes.append(size)
+
+        boxes = self.boxes_by_size.get(size, [])
+
+        return np.array(boxes, dtype=int).reshape(-1, 4), np.ones(len(boxes))
+
+
+def test_boxes_are_remapped_to_full_resolution():
+    hog = FakeHOG({(256, 192): [[8, 16, 64, 128]]})
+    grayscale = np.zeros((384, 512), dtype=np.uint8)
+
+    boxes, weights = detect_people(hog, grayscale, scale=0.5, coarse_to_fine=False)
+
+    assert hog.scanned_sizes == [(256, 192)]
+    assert boxes.tolist() == [[16, 32, 128, 256]]
+    assert weights.tolist() == [1]
+
+
+def test_coarse_to_fine_only_rescans_around_coarse_hits():
+    hog = FakeHOG(
+        {
+            # Two people close together, and something that isn't a person
+            (256, 192): [[8, 16, 64, 128], [40, 16, 64, 128], [200, 10, 50, 100]],
+            # A closer look around the first two
+            (272, 384): [[20, 10, 120, 250]],
+        }
+    )
+    grayscale = np.zeros((384, 512), dtype=np.uint8)
+
+    boxes, _weights = detect_people(hog, grayscale, scale=0.5, coarse_to_fine=True)
+
+    # The two close together are scanned again as one region
+    assert hog.scanned_sizes[0] == (256, 192)
+    assert sorted(hog.scanned_sizes[1:]) == [(200, 384), (272, 384)]
+
+    # In full resolution coordinates, and the third was only a coarse mistake
+    assert boxes.tolist() == [[20, 10, 120, 250]]
+
+
+def test_regions_around_small_boxes_still_fit_the_window():
+    regions = regions_around(np.array([[100, 100, 10, 10]]), image_size=(512, 384))
+
+    ((x_start, y_start, x_end, y_end),) = regions
+    assert x_end - x_start >= HOG_WINDOW_SIZE[0]
+    assert y_end - y_start >= HOG_WINDOW_SIZE[1]
+
+
+def intersection_over_union(a, b) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+
+    overlap_width = max(min(ax + aw, bx + bw) - max(ax, bx), 0)
+    overlap_height = max(min(ay + ah, by + bh) - max(ay, by), 0)
+    overlap = overlap_width * overlap_height
+
+    return overlap / (aw * ah + bw * bh - overlap)
+
+
+def test_detection_scales_report():
+    "How long each detection scale takes and how much of full resolution's detections it finds"
+
+    hog = cv2.HOGDescriptor()
+    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    images = [
+        cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        for path in sorted(TEST_IMAGES_FOLDER.glob("*.jpg"))[:4]
+    ]
+
+    def detect_all(scale: float, coarse_to_fine: bool):
+        started = perf_counter()
+
+        results = [
+            detect_people(hog, image, scale=scale, coarse_to_fine=coarse_to_fine)
+            for image in images
+        ]
+
+        return (perf_counter() - started) / len(images), results
+
+    full_resolution_seconds, references = detect_all(1, False)
+
+    report = {}
+
+    for (scale, coarse_to_fine) in [(0.75, False), (0.5, False), (0.5, True)]:
+        seconds, results = detect_all(scale, coarse_to_fine)
+
+        found = 0
+        expected = 0
+
+        for (reference_boxes, reference_weights), (boxes, _weights) in zip(
+            references, results
+        ):
+            for (reference_box, weight) in zip(reference_boxes, reference_weights):
+                if weight < HOG_CONFIDENCE_THRESHOLD:
+                    continue
+
+                expected += 1
+                found += any(
+                    intersection_over_union(reference_box, box) >= 0.5 for box in boxes
+                )
+
+        report[(scale, coarse_to_fine)] = seconds
+
+        # The test images hardly have anyone in them, so there may be nothing to find
+        LOGGER.info(
+            "scale %s%s: %.0f ms per image (%.1f times faster than full resolution), "
+            "found %d of %d people found at full resolution",
+            scale,
+            " (coarse to fine)" if coarse_to_fine else "",
+            1000 * seconds,
+            full_resolution_seconds / seconds,
+            found,
+            expected,
+        )
+
+    LOGGER.info("full resolution: %.0f ms per image", 1000 * full_resolution_seconds)
+
+    assert report[(0.5, False)] < full_resolution_seconds
+
+
+def test_ssd_outputs_are_scaled_to_each_image_in_the_batch():
+    output = np.array(
+        [
+            [
+                [
+                    # Image, class, confidence, then corners
+                    [0, 0, 0.9, 0.1, 0.2, 0.3, 0.8],
+                    [0, 0, 0.3, 0.1, 0.2, 0.3, 0.8],
+                    [0, 5, 0.9, 0.1, 0.2, 0.3, 0.8],
+                    [1, 0, 0.7, 0.5, 0.0, 1.2, 1.0],
+                ]
+            ]
+        ]
+    )
+
+    (first, second) = parse_ssd_output(
+        output,
+        image_sizes=[(100, 100), (200, 100)],
+        person_class_id=0,
+        confidence_threshold=0.5,
+    )
+
+    assert first[0].tolist() == [[10, 20, 20, 60]]
+    assert first[1] == pytest.approx([0.9])
+
+    # Clipped to the image
+    assert second[0].tolist() == [[100, 0, 100, 100]]
+
+
+@pytest.mark.parametrize("version", ["v5", "v8"])
+def test_yolo_outputs_are_scaled_and_overlaps_suppressed(version: str):
+    def row(center_x, center_y, width, height, person_score, other_score=0.0):
+        scores = [person_score, other_score] + [0.0] * 78
+
+        if version == "v5":
+            return [center_x, center_y, width, height, 1.0] + scores
+
+        return [center_x, center_y, width, height] + scores
+
+    output = np.array(
+        [
+            row(100, 100, 40, 80, 0.9),
+            # The same person again
+            row(102, 101, 40, 80, 0.8),
+            row(250, 200, 40, 80, 0.6),
+            # Not a person
+            row(50, 50, 20, 20, 0.1, 0.9),
+        ]
+    )
+
+    if version == "v8":
+        output = output.T
+
+    boxes, confidences = parse_yolo_output(
+        output[np.newaxis],
+        input_size=(320, 320),
+        image_size=(640, 480),
+        person_class_id=0,
+        confidence_threshold=0.5,
+    )
+
+    assert boxes.tolist() == [[160, 90, 80, 120], [460, 240, 80, 120]]
+    assert confidences == pytest.approx([0.9, 0.6])
+
+
+def test_detectors_are_parsed_from_descriptions(tmp_path: Path):
+    hog = parse_person_detector(
+        "hog",
+        confidence_threshold=NONE(),
+        input_size=NONE(),
+        scale=0.5,
+        coarse_to_fine=True,
+        threads=2,
+    )
+
+    assert isinstance(hog, HOGPersonDetector)
+    assert hog.confidence_threshold == HOG_CONFIDENCE_THRESHOLD
+    assert hog.input_size((512, 384)) == (256, 192)
+    assert not hog.needs_color
+
+    model_path = tmp_path / "model.onnx"
+    model_path.touch()
+
+    dnn = parse_person_detector(
+        f"dnn:{model_path}",
+        confidence_threshold=Some(0.4),
+        input_size=Some(parse_input_size("416x416")),
+        scale=1,
+        coarse_to_fine=False,
+        threads=2,
+    )
+
+    assert isinstance(dnn, DNNPersonDetector)
+    assert dnn.input_size((512, 384)) == (416, 416)
+    assert dnn.confidence_threshold == 0.4
+    assert dnn.needs_color
+    # Told nothing about how it was trained, so the usual COCO class for its output
+    assert dnn.person_class_id.is_none()
+    assert dnn.pixel_scale == pytest.approx(1 / 255)
+
+    mobilenet_ssd = parse_person_detector(
+        f"dnn:{model_path}",
+        confidence_threshold=NONE(),
+        input_size=NONE(),
+        scale=1,
+        coarse_to_fine=False,
+        threads=1,
+        person_class_id=Some(15),
+        pixel_scale=Some(0.007843),
+        pixel_mean=Some(127.5),
+    )
+
+    assert isinstance(mobilenet_ssd, DNNPersonDetector)
+    assert mobilenet_ssd.person_class_id.unwrap() == 15
+    assert mobilenet_ssd.pixel_scale == 0.007843
+    assert mobilenet_ssd.pixel_mean == 127.5
+
+    # Only neural networks are trained with classes and pixel scales
+    with pytest.raises(ValueError):
+        parse_person_detector(
+            "hog",
+            confidence_threshold=NONE(),
+            input_size=NONE(),
+            scale=1,
+            coarse_to_fine=False,
+            threads=1,
+            person_class_id=Some(1),
+        )
+
+    for description in ["dnn", f"dnn:{tmp_path / 'missing.onnx'}", "yolo"]:
+        with pytest.raises(ValueError):
+            parse_person_detector(
+                description,
+                confidence_threshold=NONE(),
+                input_size=NONE(),
+                scale=1,
+                coarse_to_fine=False,
+                threads=1,
+            )
+
+
+def test_person_detectors_report():
+    """
+    How fast each backend gets through the recorded frames, and how many people
+    it sees in them (all of which are mistakes, since the room's empty)
+
+    A neural network is only included if PERSON_DETECTOR_TEST_MODEL
+    is the path to an ONNX file.
+    """
+
+    color_images = [
+        cv2.cvtColor(cv2.imread(str(path)), cv2.COLOR_BGR2RGB)
+        for path in sorted(TEST_IMAGES_FOLDER.glob("*.jpg"))[:4]
+    ]
+    grayscale_images = [
+        cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) for image in color_images
+    ]
+
+    person_detectors: dict[str, PersonDetector] = {
+        "hog": HOGPersonDetector(),
+        "hog at half scale": HOGPersonDetector(scale=0.5),
+    }
+
+    model_path = getenv("PERSON_DETECTOR_TEST_MODEL")
+    if model_path is not None:
+        person_detectors["dnn"] = DNNPersonDetector(Path(model_path))
+
+    for (name, person_detector) in person_detectors.items():
+        person_detector.load()
+
+        images = color_images if person_detector.needs_color else grayscale_images
+
+        started = perf_counter()
+        results = person_detector.detect_batch(images)
+        seconds = perf_counter() - started
+
+        false_positives = sum(len(boxes) for (boxes, _weights) in results)
+
+        LOGGER.info(
+            "%s: %.1f frames per second, %.2f false positives per frame",
+            name,
+            len(images) / seconds,
+            false_positives / len(images),
+        )
+
+        assert len(results) == len(images)
+
+
+def test_only_the_most_confident_of_overlapping_boxes_are_kept():
+    boxes = np.array([[0, 0, 64, 128], [4, 4, 64, 128], [200, 0, 64, 128]])
+    # HOG's weights can be above 1 (and aren't probabilities)
+    weights = np.array([0.5, 2.5, 0.1])
+
+    kept_boxes, kept_weights = non_max_suppression(boxes, weights)
+
+    assert kept_boxes.tolist() == [[4, 4, 64, 128], [200, 0, 64, 128]]
+    assert kept_weights.tolist() == [2.5, 0.1]
+
+    # Nobody to narrow down
+    kept_boxes, kept_weights = non_max_suppression(
+        np.empty((0, 4), dtype=int), np.empty(0)
+    )
+    assert kept_boxes.shape == (0, 4)
+    assert len(kept_weights) == 0
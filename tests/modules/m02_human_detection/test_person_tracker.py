@@ -0,0 +1,128 @@
+"""
+Unit test
+Module: 02. Human detection
+"""
+
+import numpy as np
+from option_and_result import NONE, Some
+
+from microcontroller_application.modules.m02_human_detection.person_tracker import (
+    MAXIMUM_SECONDS_TRACKED,
+    PersonTracker,
+    intersection_over_union,
+)
+
+
+def room_with_people_at(*corners: tuple[int, int]) -> np.ndarray:
+    # Plain walls, and people with enough texture to follow
+    frame = np.full((480, 640), 100, dtype=np.uint8)
+
+    random = np.random.default_rng(0)
+    for (x, y) in corners:
+        frame[y : y + 160, x : x + 80] = random.integers(0, 255, size=(160, 80))
+
+    return frame
+
+
+def test_people_are_followed_as_they_move():
+    person_tracker = PersonTracker()
+
+    assert person_tracker.follow(room_with_people_at((100, 100)))
+    person_tracker.detected(
+        np.array([[100, 100, 180, 260]]), np.array([1.2]), looked_in=NONE()
+    )
+    (track,) = person_tracker.tracks
+
+    # Moving a bit every frame
+    for step in range(1, 4):
+        assert person_tracker.follow(
+            room_with_people_at((100 + 6 * step, 100 + 2 * step))
+        )
+
+    (followed,) = person_tracker.tracks
+    assert followed.track_id == track.track_id
+    assert np.allclose(followed.box, [118, 106, 198, 266], atol=2)
+
+    assert person_tracker.covers([(150, 150, 200, 200)])
+    assert not person_tracker.covers([(150, 150, 200, 200), (500, 300, 600, 400)])
+
+    assert person_tracker.statistics.frames == 4
+    assert person_tracker.statistics.lost == 0
+
+
+def test_people_who_disappear_are_lost():
+    person_tracker = PersonTracker()
+
+    person_tracker.follow(room_with_people_at((100, 100)))
+    person_tracker.detected(
+        np.array([[100, 100, 180, 260]]), np.array([1.2]), looked_in=NONE()
+    )
+
+    # Gone, leaving just the walls
+    assert not person_tracker.follow(np.full((480, 640), 100, dtype=np.uint8))
+
+    assert person_tracker.tracks == []
+    assert person_tracker.statistics.lost == 1
+
+    # Even if that was between scans, they're looked for again
+    assert person_tracker.needs_detection()
+
+
+def test_people_stay_put_when_the_resolution_changes():
+    person_tracker = PersonTracker()
+
+    person_tracker.follow(room_with_people_at((100, 100)))
+    person_tracker.detected(
+        np.array([[100, 100, 180, 260]]), np.array([1.2]), looked_in=NONE()
+    )
+
+    # Something else asked for twice the detail (and nobody moved)
+    assert person_tracker.follow(
+        np.kron(room_with_people_at((100, 100)), np.ones((2, 2), dtype=np.uint8))
+    )
+
+    (track,) = person_tracker.tracks
+    assert np.allclose(track.box, [200, 200, 360, 520], atol=2)
+
+
+def test_people_found_again_keep_their_track_id():
+    now = 0.0
+    person_tracker = PersonTracker(clock=lambda: now)
+
+    person_tracker.follow(room_with_people_at((100, 100), (400, 100)))
+    person_tracker.detected(
+        np.array([[100, 100, 180, 260], [400, 100, 480, 260]]),
+        np.array([1.2, 0.9]),
+        looked_in=NONE(),
+    )
+    first, second = (track.track_id for track in person_tracker.tracks)
+
+    person_tracker.follow(room_with_people_at((100, 100), (400, 100)))
+    assert not person_tracker.needs_detection()
+
+    # However many scans there've been since
+    now += MAXIMUM_SECONDS_TRACKED
+    assert person_tracker.needs_detection()
+
+    # The second person was only looked for near where they were, and found a bit to the side,
+    # and someone new walked in
+    person_tracker.detected(
+        np.array([[410, 100, 490, 260], [250, 300, 330, 460]]),
+        np.array([1.0, 0.8]),
+        looked_in=Some([(380, 80, 600, 480)]),
+    )
+
+    track_ids = {track.track_id for track in person_tracker.tracks}
+    # The first person wasn't looked for so is still tracked
+    assert first in track_ids
+    assert second in track_ids
+    assert len(track_ids) == 3
+    assert not person_tracker.needs_detection()
+
+
+def test_intersection_over_union():
+    overlaps = intersection_over_union(
+        [[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]]
+    )
+
+    assert overlaps.tolist() == [[1.0, 50 / 150, 0.0]]
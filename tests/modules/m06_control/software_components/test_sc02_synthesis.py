@@ -6,8 +6,13 @@ Component: 02. Synthesis
 
 from datetime import datetime
 
+from option_and_result import NONE, Some
+
+from microcontroller_application.interfaces.message_types import Activity, UserSlot
 from microcontroller_application.modules.m06_control.software_components.sc02_synthesis import (
+    ResultsByFrame,
     calculate_synthesized_light_brightness,
+    log_latency,
 )
 
 
@@ -66,3 +71,45 @@ def test_nobody_is_there_and_no_preferences_forcing_light_on_3():
     )
 
     assert calculation == 0
+
+
+def test_results_are_only_paired_up_for_the_same_frame():
+    """
+    When person identification is a frame behind activity recognition,
+    then each frame's activities are paired with who was in that frame,
+    not whoever was identified most recently
+    """
+
+    results_by_frame = ResultsByFrame()
+
+    assert results_by_frame.add_activities(1, [Activity.WORKING]).is_none()
+    assert results_by_frame.add_activities(2, [Activity.LYING]).is_none()
+
+    assert results_by_frame.add_identified_people(1, [Some(UserSlot.ONE)]) == Some(
+        ([Activity.WORKING], [Some(UserSlot.ONE)])
+    )
+    assert results_by_frame.add_identified_people(2, [NONE()]) == Some(
+        ([Activity.LYING], [NONE()])
+    )
+
+
+def test_results_for_frames_that_are_out_of_date_are_dropped():
+    results_by_frame = ResultsByFrame(maximum_waiting=2)
+
+    # Person identification never finishes frame 1
+    results_by_frame.add_activities(1, [Activity.WORKING])
+    results_by_frame.add_activities(2, [])
+    results_by_frame.add_identified_people(2, [])
+
+    assert results_by_frame.add_identified_people(1, [NONE()]).is_none()
+
+    # Nor frames 3 and 4, which are given up on once there are too many waiting
+    for frame_id in range(3, 6):
+        results_by_frame.add_activities(frame_id, [Activity.NEITHER])
+
+    assert results_by_frame.add_identified_people(3, [NONE()]).is_none()
+    assert results_by_frame.add_identified_people(5, [NONE()]).is_some()
+
+
+def test_latency_is_from_the_frame_being_captured():
+    assert log_latency(1, 10.0, clock=lambda: 10.25) == 0.25
@@ -4,6 +4,7 @@ Module: 06. Control
 """
 
 from asyncio import create_task
+from time import monotonic
 
 import pytest
 import bounded_channel
@@ -42,13 +43,19 @@ async def test_integration_1():
 
     # Unwrap means to fail the test if an error is returned
     (
-        await i05_sender.send(FromActivityRecognitionToControl(activities_of_humans=[]))
+        await i05_sender.send(
+            FromActivityRecognitionToControl(
+                activities_of_humans=[], frame_id=0, captured_at=monotonic()
+            )
+        )
     ).unwrap()
 
     (
         await i06_sender.send(
             FromPersonIdentificationToControl(
                 identified_people=[],
+                frame_id=0,
+                captured_at=monotonic(),
             )
         )
     ).unwrap()
@@ -4,7 +4,7 @@ Module: 08. Aggregation
 Component: 06. Camera recording
 """
 
-from asyncio import create_task, sleep
+from asyncio import Event, create_task, sleep, wait_for
 from datetime import datetime
 from pathlib import Path
 from shutil import rmtree
@@ -16,6 +16,9 @@ import pytest
 from PIL import Image
 
 from microcontroller_application.interfaces.message_types import (
+    CameraConsumer,
+    CameraProfile,
+    FromCameraConsumerToEnvironment,
     FromEnvironmentToAggregation,
     FromProxyToAggregationRecordTheCamera,
 )
@@ -23,6 +26,8 @@ from microcontroller_application.log import get_logger
 from microcontroller_application.modules.m08_aggregation.software_components import (
     sc06_camera_recording,
 )
+from utils import watch
+from utils.frames import FramePool, release_frame_of, retain_frame_of
 
 THIS_FILE = Path(__file__)
 
@@ -57,17 +62,22 @@ async def test_camera_recording_01():
     (
         from_environment_sender,
         from_environment_receiver,
-    ) = bounded_channel.channel(32)
+    ) = watch.channel(retain=retain_frame_of, release=release_frame_of)
     (
         from_proxy_record_the_camera_sender,
         from_proxy_record_the_camera_receiver,
     ) = bounded_channel.channel(32)
+    (
+        to_environment_camera_demand_sender,
+        to_environment_camera_demand_receiver,
+    ) = bounded_channel.channel(32)
 
     test_timestamp = datetime(year=2022, month=8, day=17, hour=6, minute=43, second=25)
 
     sc06_camera_recording_coro = sc06_camera_recording.run(
         from_environment=from_environment_receiver,
         from_proxy_record_the_camera=from_proxy_record_the_camera_receiver,
+        to_environment_camera_demand=to_environment_camera_demand_sender,
         get_current_time=lambda: test_timestamp,
         history_folder=history_folder,
     )
@@ -75,6 +85,7 @@ async def test_camera_recording_01():
     # Start of dropping extra references
     del from_environment_receiver
     del from_proxy_record_the_camera_receiver
+    del to_environment_camera_demand_sender
     # End of dropping extra references
 
     sc06_camera_recording_task = create_task(sc06_camera_recording_coro)
@@ -89,22 +100,36 @@ async def test_camera_recording_01():
         # Unwrap means to fail the test if an error is returned
     ).unwrap()
 
+    # The camera is asked for frames once recording starts
+    camera_demand = (
+        await wait_for(to_environment_camera_demand_receiver.recv(), timeout=5)
+    ).unwrap()
+    assert camera_demand == FromCameraConsumerToEnvironment(
+        CameraConsumer.RECORDING,
+        sc06_camera_recording.RECORDING_FRAMES_PER_SECOND,
+        CameraProfile.HIGH_DETAIL,
+    )
+
+    first_image = np.asarray(Image.open(all_images_in_order[0]))
+    pool = FramePool(shape=first_image.shape, capacity=len(all_images_in_order))
+
     for input_image_path in all_images_in_order:
         LOGGER.debug("sending %s", input_image_path)
 
         image = Image.open(input_image_path)
 
-        frame = np.asarray(image)
+        frame = pool.acquire().unwrap()
+        frame.array[:] = np.asarray(image)
 
         # Pretend that this image really came from the camera
-        (
-            await from_environment_sender.send(
-                FromEnvironmentToAggregation(
-                    frame=frame,
-                )
+        from_environment_sender.send(
+            FromEnvironmentToAggregation(
+                frame=frame,
             )
-            # Fail the test if an error is returned
-        ).unwrap()
+        )
+        # Only the newest frame is kept, so make sure this one gets recorded
+        # before replacing it with the next one
+        await wait_for(from_environment_sender.wait_until_received(), timeout=5)
 
     # Stop the recording
     (
@@ -113,6 +138,14 @@ async def test_camera_recording_01():
         )
     ).unwrap()
 
+    # And then it can idle once recording stops
+    camera_demand = (
+        await wait_for(to_environment_camera_demand_receiver.recv(), timeout=5)
+    ).unwrap()
+    assert camera_demand == FromCameraConsumerToEnvironment(
+        CameraConsumer.RECORDING, 0, CameraProfile.HIGH_DETAIL
+    )
+
     # Filesystems are weird - a short break like this is probably needed
     await sleep(0.5)
 
@@ -160,3 +193,125 @@ async def test_camera_recording_01():
     del from_environment_sender
     del from_proxy_record_the_camera_sender
     # End of dropping extra references
+
+
+@pytest.mark.asyncio
+async def test_camera_recording_finishes_as_soon_as_it_is_stopped(monkeypatch):
+    image_set = TEST_DATA_FOLDER / "images_01"
+
+    all_images_in_order = sorted(image_set.iterdir(), key=stem_as_number)
+
+    history_folder = Path(
+        ".test_artifacts/m08_aggregation/software_components/recording_02"
+    )
+    history_folder.mkdir(parents=True, exist_ok=True)
+
+    # Remove artifacts from previous test runs to prevent interference
+    rmtree(history_folder)
+
+    assembled: list[Path] = []
+    video_assembled = Event()
+
+    async def fake_assemble_video(_input_images: list[Path], output: Path):
+        assembled.append(output)
+        video_assembled.set()
+
+    monkeypatch.setattr(sc06_camera_recording, "assemble_video", fake_assemble_video)
+
+    (
+        from_environment_sender,
+        from_environment_receiver,
+    ) = watch.channel(retain=retain_frame_of, release=release_frame_of)
+    (
+        from_proxy_record_the_camera_sender,
+        from_proxy_record_the_camera_receiver,
+    ) = bounded_channel.channel(32)
+    (
+        to_environment_camera_demand_sender,
+        to_environment_camera_demand_receiver,
+    ) = bounded_channel.channel(32)
+
+    timestamps = iter(
+        [
+            datetime(year=2022, month=8, day=17, hour=6, minute=43, second=25),
+            datetime(year=2022, month=8, day=17, hour=6, minute=44, second=0),
+        ]
+    )
+
+    record_task = create_task(
+        sc06_camera_recording.record_camera_feed(
+            from_environment=from_environment_receiver,
+            get_current_time=lambda: next(timestamps),
+            history_folder=history_folder,
+            recording=(recording := Event()),
+            stopped=(stopped := Event()),
+        )
+    )
+    proxy_task = create_task(
+        sc06_camera_recording.receive_proxy_messages(
+            from_proxy_record_the_camera=from_proxy_record_the_camera_receiver,
+            to_environment_camera_demand=to_environment_camera_demand_sender,
+            recording=recording,
+            stopped=stopped,
+        )
+    )
+
+    # Start of dropping extra references
+    del from_environment_receiver
+    del from_proxy_record_the_camera_receiver
+    del to_environment_camera_demand_sender
+    # End of dropping extra references
+
+    first_image = np.asarray(Image.open(all_images_in_order[0]))
+    pool = FramePool(shape=first_image.shape, capacity=2)
+
+    def send_frame():
+        frame = pool.acquire().unwrap()
+        frame.array[:] = first_image
+
+        from_environment_sender.send(FromEnvironmentToAggregation(frame=frame))
+
+    async def record(should_record: bool):
+        (
+            await from_proxy_record_the_camera_sender.send(
+                FromProxyToAggregationRecordTheCamera(should_record=should_record)
+            )
+        ).unwrap()
+        (
+            await wait_for(to_environment_camera_demand_receiver.recv(), timeout=5)
+        ).unwrap()
+
+    await record(True)
+
+    send_frame()
+    await wait_for(from_environment_sender.wait_until_received(), timeout=5)
+
+    # The video's assembled without needing another frame to come in first
+    await record(False)
+    await wait_for(video_assembled.wait(), timeout=5)
+
+    first_recording = (
+        history_folder / "2022" / "8" / "17" / "videos" / "6" / "43" / "25"
+    )
+    assert assembled == [first_recording / "video.mkv"]
+
+    # A frame that comes in after the recording stopped isn't part of it
+    send_frame()
+    await sleep(0.1)
+
+    assert sorted(path.name for path in first_recording.iterdir()) == ["0.jpeg"]
+
+    # Closing the camera feed finishes the recording off rather than crashing
+    await record(True)
+    video_assembled.clear()
+
+    from_environment_sender.close()
+    await wait_for(record_task, timeout=5)
+
+    assert video_assembled.is_set()
+    assert assembled[-1] == (
+        history_folder / "2022" / "8" / "17" / "videos" / "6" / "44" / "0" / "video.mkv"
+    )
+
+    del from_proxy_record_the_camera_sender
+    await wait_for(proxy_task, timeout=5)
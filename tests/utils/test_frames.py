@@ -0,0 +1,113 @@
+from io import BytesIO
+from threading import Thread
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.frames import FramePool, JpegQuality
+
+
+def test_released_frames_are_reused():
+    pool = FramePool(shape=(4, 6, 3), capacity=2)
+
+    first = pool.acquire().unwrap()
+    second = pool.acquire().unwrap()
+
+    assert pool.available() == 0
+    assert pool.acquire(timeout=0.01).is_none()
+
+    first_buffer = first.array
+    first.release()
+
+    third = pool.acquire().unwrap()
+
+    # Same memory, but a different frame
+    assert third.array is first_buffer
+    assert third.frame_id > second.frame_id
+
+    second.release()
+    third.release()
+
+    assert pool.available() == 2
+
+
+def test_frame_ids_are_unique_across_pools():
+    # Like two cameras, or one camera before and after switching resolution
+    pools = [FramePool(shape=(4, 6, 3), capacity=2) for _ in range(2)]
+
+    frames = [pool.acquire().unwrap() for pool in pools for _ in range(2)]
+
+    assert len({frame.frame_id for frame in frames}) == 4
+
+    for frame in frames:
+        frame.release()
+
+
+def test_frame_is_only_returned_after_every_reference_is_released():
+    pool = FramePool(shape=(2, 2), capacity=1)
+
+    frame = pool.acquire().unwrap()
+    frame.retain()
+    frame.retain()
+
+    frame.release()
+    frame.release()
+    assert pool.available() == 0
+
+    with frame:
+        pass
+    assert pool.available() == 1
+
+    with pytest.raises(RuntimeError):
+        frame.array
+
+    with pytest.raises(RuntimeError):
+        frame.release()
+
+
+def test_acquire_waits_for_a_release_from_another_thread():
+    pool = FramePool(shape=(2, 2), capacity=1)
+
+    frame = pool.acquire().unwrap()
+
+    releaser = Thread(target=frame.release)
+    releaser.start()
+
+    assert pool.acquire(timeout=5).is_some()
+
+    releaser.join()
+
+
+def test_derived_products_are_computed_once_and_evicted_on_release():
+    pool = FramePool(shape=(48, 64, 3), capacity=1)
+
+    frame = pool.acquire().unwrap()
+    frame.array[:] = (255, 0, 0)
+
+    grayscale = frame.grayscale()
+    assert grayscale.shape == (48, 64)
+    # Red's share of luma
+    assert abs(int(grayscale[0, 0]) - 76) <= 1
+    assert frame.grayscale() is grayscale
+
+    # Nobody can change what the other consumers are sharing
+    with pytest.raises(ValueError):
+        grayscale[0, 0] = 0
+
+    assert frame.half_resolution().shape == (24, 32, 3)
+
+    jpeg = frame.jpeg(JpegQuality.STREAMING)
+    assert frame.jpeg(JpegQuality.STREAMING) is jpeg
+    assert frame.jpeg(JpegQuality.RECORDING) != jpeg
+
+    decoded = np.asarray(Image.open(BytesIO(jpeg)))
+    assert decoded.shape == (48, 64, 3)
+
+    frame.release()
+
+    # The next frame in the same buffer starts from scratch
+    next_frame = pool.acquire().unwrap()
+    next_frame.array[:] = 0
+
+    assert next_frame.grayscale()[0, 0] == 0
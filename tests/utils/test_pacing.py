@@ -0,0 +1,43 @@
+from math import isclose
+
+from utils.pacing import FrameRateGovernor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def test_governor_is_paced_by_the_wall_clock():
+    clock = FakeClock()
+    governor = FrameRateGovernor(10, clock=clock, sleep_for=clock.sleep)
+
+    governor.wait()
+    # The work for each frame takes some time,
+    # which shouldn't add on top of the frame period
+    clock.now += 0.03
+    governor.wait()
+    clock.now += 0.07
+    governor.wait()
+
+    assert isclose(clock.now, 100.2)
+
+
+def test_governor_skips_frames_it_fell_behind_on():
+    clock = FakeClock()
+    governor = FrameRateGovernor(10, clock=clock, sleep_for=clock.sleep)
+
+    governor.wait()
+    clock.now += 0.35
+
+    assert governor.wait() == 2
+
+    # And then it's back on schedule rather than bursting to catch up
+    governor.wait()
+    assert isclose(clock.now, 100.4)
@@ -0,0 +1,65 @@
+from math import isclose
+
+import pytest
+
+from utils.smoothing import Deadband, ExponentialMovingAverage, RollingMedian
+
+
+def test_exponential_moving_average_follows_changes_gradually():
+    average = ExponentialMovingAverage(0.5)
+
+    assert average.update(100) == 100
+    assert isclose(average.update(200), 150)
+    assert isclose(average.update(200), 175)
+
+
+def test_exponential_moving_average_without_smoothing():
+    average = ExponentialMovingAverage(1)
+
+    average.update(100)
+    assert average.update(3) == 3
+
+    with pytest.raises(ValueError):
+        ExponentialMovingAverage(0)
+
+
+def test_rolling_median_ignores_a_spike():
+    median = RollingMedian(3)
+
+    assert median.update(10) == 10
+    assert median.update(12) == 11
+    assert median.update(5000) == 12
+    assert median.update(11) == 12
+    assert median.update(13) == 13
+
+
+def test_deadband_passes_along_big_changes_and_heartbeats():
+    now = 0.0
+
+    deadband = Deadband(
+        relative_tolerance=0.05,
+        absolute_tolerance=1,
+        heartbeat_seconds=30,
+        clock=lambda: now,
+    )
+
+    assert deadband.should_pass_along(100)
+    assert not deadband.should_pass_along(104)
+    assert not deadband.should_pass_along(96)
+    assert deadband.should_pass_along(106)
+
+    # Compared against 106 now
+    assert not deadband.should_pass_along(102)
+
+    now = 30.0
+    assert deadband.should_pass_along(102)
+
+
+def test_deadband_near_zero_uses_the_absolute_tolerance():
+    deadband = Deadband(
+        relative_tolerance=0.05, absolute_tolerance=1, heartbeat_seconds=30
+    )
+
+    assert deadband.should_pass_along(0)
+    assert not deadband.should_pass_along(0.5)
+    assert deadband.should_pass_along(1.5)
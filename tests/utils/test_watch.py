@@ -0,0 +1,89 @@
+from asyncio import create_task, sleep, wait_for
+
+import pytest
+from option_and_result import NONE, Some
+
+from utils import watch
+from utils.frames import FramePool
+
+
+@pytest.mark.asyncio
+async def test_receivers_skip_to_the_newest_value():
+    sender, receiver = watch.channel()
+
+    sender.send(1)
+    sender.send(2)
+    sender.send(3)
+
+    assert await receiver.recv() == Some(3)
+    # Nothing newer yet
+    assert receiver.try_recv() == NONE()
+
+    later = create_task(receiver.recv())
+    await sleep(0)
+    sender.send(4)
+
+    assert await wait_for(later, timeout=1) == Some(4)
+
+
+@pytest.mark.asyncio
+async def test_every_receiver_sees_the_newest_value():
+    sender, first_receiver = watch.channel()
+    second_receiver = first_receiver.clone()
+
+    sender.send("a")
+
+    assert await first_receiver.recv() == Some("a")
+    assert await second_receiver.recv() == Some("a")
+
+    late_receiver = sender.subscribe()
+    assert late_receiver.try_recv() == NONE()
+
+
+@pytest.mark.asyncio
+async def test_closing_wakes_up_receivers():
+    sender, receiver = watch.channel()
+
+    waiting = create_task(receiver.recv())
+    await sleep(0)
+
+    del sender
+
+    assert await wait_for(waiting, timeout=1) == NONE()
+
+
+@pytest.mark.asyncio
+async def test_sender_can_wait_until_the_value_is_received():
+    sender, receiver = watch.channel()
+
+    sender.send(1)
+
+    waiting = create_task(sender.wait_until_received())
+    await sleep(0)
+    assert not waiting.done()
+
+    await receiver.recv()
+    await wait_for(waiting, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_only_the_newest_frame_is_held():
+    pool = FramePool(shape=(2, 2), capacity=3)
+
+    sender, receiver = watch.channel(
+        retain=lambda frame: frame.retain(), release=lambda frame: frame.release()
+    )
+
+    for _ in range(10):
+        sender.send(pool.acquire().unwrap())
+
+    # Replaced frames went back to the pool
+    assert pool.available() == 2
+
+    frame = (await receiver.recv()).unwrap()
+    sender.close()
+
+    # The receiver still has its own reference
+    assert pool.available() == 2
+    frame.release()
+    assert pool.available() == 3
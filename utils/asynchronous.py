@@ -1,7 +1,17 @@
 """Utilities for working with async things"""
 
-from asyncio import CancelledError, create_task, wait, FIRST_COMPLETED
-from typing import Any, Coroutine
+from asyncio import (
+    CancelledError,
+    Future,
+    create_task,
+    get_running_loop,
+    wait,
+    FIRST_COMPLETED,
+)
+from threading import Event, Thread
+from typing import Any, Callable, Coroutine, TypeVar
+
+T = TypeVar("T")
 
 
 async def at_least_one(coros: list[Coroutine[Any, Any, Any]]):
@@ -28,3 +38,43 @@ async def at_least_one(coros: list[Coroutine[Any, Any, Any]]):
     # which is undesired, so cancel all those tasks:
     for task in pending:
         task.cancel()
+
+
+async def in_dedicated_thread(function: Callable[[Event], T], *, name: str) -> T:
+    """
+    Run a long-lived blocking function on a thread of its own
+    (rather than tying up one of the default executor's threads forever)
+
+    The function is given a threading Event that gets set when it should stop,
+    which happens if this coroutine is cancelled.
+    """
+
+    loop = get_running_loop()
+    future: Future[T] = loop.create_future()
+    stop = Event()
+
+    def settle(outcome: Callable[[], None]):
+        if not future.done():
+            outcome()
+
+    def target():
+        try:
+            result = function(stop)
+        except BaseException as exception:  # pylint: disable=broad-except
+            outcome = lambda: future.set_exception(exception)
+        else:
+            outcome = lambda: future.set_result(result)
+
+        try:
+            loop.call_soon_threadsafe(settle, outcome)
+        except RuntimeError:
+            # The event loop already closed so nobody is waiting for this anymore
+            pass
+
+    thread = Thread(target=target, name=name, daemon=True)
+    thread.start()
+
+    try:
+        return await future
+    finally:
+        stop.set()
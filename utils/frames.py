@@ -0,0 +1,221 @@
+"""Utilities for passing camera frames around without reallocating them"""
+
+from enum import Enum
+from io import BytesIO
+from itertools import count
+from threading import Condition
+from time import monotonic
+from typing import Any, Callable, Hashable, Optional, Protocol, TypeVar
+
+import cv2
+import numpy as np
+from option_and_result import NONE, Option, Some
+from PIL import Image
+
+P = TypeVar("P")
+
+# Shared by every pool (and taking the next one is atomic)
+FRAME_IDS = count()
+
+
+class JpegQuality(Enum):
+    "The JPEG qualities frames are encoded at, named after what they're for"
+
+    STREAMING = 50
+    RECORDING = 90
+
+
+class Frame:
+    """
+    A reference-counted handle to one of a `FramePool`'s preallocated buffers
+
+    Whoever holds a reference has to `release` it when they're done with it
+    (or use it as a context manager), at which point the buffer goes back
+    to the pool to be captured into again.
+    Giving the frame to another consumer means calling `retain` for them first.
+
+    Products derived from the frame (like a grayscale version or a JPEG of it)
+    are computed the first time any consumer asks for them and then shared
+    with every other consumer, until the frame is released for good.
+    """
+
+    def __init__(
+        self, pool: "FramePool", index: int, frame_id: int, captured_at: float
+    ):
+        self._pool = pool
+        self._index = index
+        self._references = 1
+
+        # Increases with every frame taken from any pool
+        # (so it's unique even with more than one camera)
+        self.frame_id = frame_id
+        # In the time.monotonic clock
+        self.captured_at = captured_at
+
+        # Whoever captures the frame can mark it as looking the same as an earlier one,
+        # in which case key_frame_id is that earlier frame's ID
+        # (so consumers can reuse whatever they already did for that one)
+        self.unchanged = False
+        self.change_score = 1.0
+        self.key_frame_id = frame_id
+
+        self._products: dict[Hashable, Any] = {}
+
+    @property
+    def array(self) -> np.ndarray:
+        "The pixels of this frame (only valid while a reference is held)"
+
+        if self._references <= 0:
+            raise RuntimeError(f"frame {self.frame_id} was used after being released")
+
+        return self._pool._buffers[self._index]
+
+    def retain(self) -> "Frame":
+        "Take out another reference to this frame"
+
+        with self._pool._condition:
+            if self._references <= 0:
+                raise RuntimeError(
+                    f"frame {self.frame_id} was retained after being released"
+                )
+
+            self._references += 1
+
+        return self
+
+    def release(self):
+        "Give back a reference to this frame"
+
+        with self._pool._condition:
+            if self._references <= 0:
+                raise RuntimeError(f"frame {self.frame_id} was released too many times")
+
+            self._references -= 1
+
+            if self._references == 0:
+                self._products.clear()
+                self._pool._give_back(self._index)
+
+    def grayscale(self) -> np.ndarray:
+        "The luma of this frame"
+
+        return self._memoized(
+            "grayscale", lambda: cv2.cvtColor(self.array, cv2.COLOR_RGB2GRAY)
+        )
+
+    def half_resolution(self) -> np.ndarray:
+        "The next level down the image pyramid (half the width and height)"
+
+        return self._memoized("half resolution", lambda: cv2.pyrDown(self.array))
+
+    def image(self) -> Image.Image:
+        "This frame as a PIL image (which is a copy, so it outlives the frame)"
+
+        return self._memoized("image", lambda: Image.fromarray(self.array))
+
+    def jpeg(self, quality: JpegQuality) -> bytes:
+        "This frame encoded as a JPEG"
+
+        def encode() -> bytes:
+            jpeg_bytes_io = BytesIO()
+            self.image().save(jpeg_bytes_io, format="jpeg", quality=quality.value)
+            return jpeg_bytes_io.getvalue()
+
+        return self._memoized(("jpeg", quality), encode)
+
+    def _memoized(self, key: Hashable, compute: Callable[[], P]) -> P:
+        # Products can be asked for from several threads at once.
+        # At worst, two of them compute the same product and one result is kept
+        with self._pool._condition:
+            if self._references <= 0:
+                raise RuntimeError(
+                    f"frame {self.frame_id} was used after being released"
+                )
+
+            if key in self._products:
+                return self._products[key]
+
+        product = compute()
+
+        # Derived arrays are shared, so nobody is allowed to change them
+        if isinstance(product, np.ndarray):
+            product.setflags(write=False)
+
+        with self._pool._condition:
+            if self._references <= 0:
+                # Released while this was being computed, so there's nobody to share it with
+                return product
+
+            return self._products.setdefault(key, product)
+
+    def __enter__(self) -> "Frame":
+        return self
+
+    def __exit__(self, *_exception_info):
+        self.release()
+
+    def __repr__(self):
+        return f"<Frame {self.frame_id} in buffer {self._index}>"
+
+
+class FramePool:
+    """
+    A fixed number of frame buffers allocated once up front and reused forever
+
+    Taking a frame out of the pool is thread safe, so a capture thread
+    can fill frames while the event loop hands them out to consumers.
+    """
+
+    def __init__(self, *, shape: tuple[int, ...], capacity: int, dtype=np.uint8):
+        if capacity < 1:
+            raise ValueError(f"a frame pool needs at least 1 buffer, not {capacity}")
+
+        self.shape = shape
+        self.capacity = capacity
+
+        self._buffers = [np.empty(shape, dtype=dtype) for _ in range(capacity)]
+        self._free = list(range(capacity))
+        self._condition = Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> Option[Frame]:
+        """
+        Take a free buffer out of the pool (with one reference held by the caller),
+        waiting up to `timeout` seconds for one to be released if all are in use
+        """
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._free, timeout):
+                return NONE()
+
+            index = self._free.pop()
+
+        return Some(Frame(self, index, next(FRAME_IDS), monotonic()))
+
+    def available(self) -> int:
+        "How many buffers are free right now"
+
+        with self._condition:
+            return len(self._free)
+
+    def _give_back(self, index: int):
+        # The condition's lock is already held by Frame.release
+        self._free.append(index)
+        self._condition.notify()
+
+
+class HoldsFrame(Protocol):
+    "A message with a frame in it"
+
+    frame: Frame
+
+
+def retain_frame_of(message: HoldsFrame):
+    "For reference counting messages with frames in them (like in a watch channel)"
+
+    message.frame.retain()
+
+
+def release_frame_of(message: HoldsFrame):
+    "For reference counting messages with frames in them (like in a watch channel)"
+
+    message.frame.release()
@@ -0,0 +1,58 @@
+"""Utilities for running loops at a steady rate"""
+
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+
+class FrameRateGovernor:
+    """
+    Paces a loop to a number of iterations per second by the wall clock
+
+    Sleeping a fixed amount after each iteration drifts slower by however long
+    the iteration itself took, but this schedules each iteration relative to
+    when the first one started instead.
+    """
+
+    def __init__(
+        self,
+        frames_per_second: float,
+        *,
+        clock: Callable[[], float] = monotonic,
+        sleep_for: Callable[[float], None] = sleep,
+    ):
+        if frames_per_second <= 0:
+            raise ValueError(
+                f"the frame rate needs to be positive, not {frames_per_second}"
+            )
+
+        self.period = 1 / frames_per_second
+
+        self._clock = clock
+        self._sleep_for = sleep_for
+        self._next_deadline: Optional[float] = None
+
+    def wait(self) -> int:
+        """
+        Block until the next frame is due,
+        returning how many frames were skipped because the loop fell behind
+        """
+
+        now = self._clock()
+
+        if self._next_deadline is None:
+            self._next_deadline = now
+
+        delay = self._next_deadline - now
+        skipped = 0
+
+        if delay > 0:
+            self._sleep_for(delay)
+        else:
+            # Rather than rushing out a burst of frames to catch up,
+            # give up on the ones that are already late
+            skipped = int(-delay // self.period)
+            self._next_deadline += skipped * self.period
+
+        self._next_deadline += self.period
+
+        return skipped
@@ -0,0 +1,109 @@
+"""Utilities for smoothing noisy readings one at a time, as they arrive"""
+
+from collections import deque
+from statistics import median
+from time import monotonic
+from typing import Callable
+
+from option_and_result import NONE, Option, Some
+
+
+class ExponentialMovingAverage:
+    """
+    Averages readings with the newest counting the most
+    and older ones counting exponentially less
+
+    `weight` is how much the newest reading counts (between 0 and 1):
+    1 means no smoothing at all and closer to 0 means smoother but slower to follow changes.
+    """
+
+    def __init__(self, weight: float):
+        if not 0 < weight <= 1:
+            raise ValueError(f"the weight needs to be between 0 and 1, not {weight}")
+
+        self.weight = weight
+        self._average: Option[float] = NONE()
+
+    def update(self, reading: float) -> float:
+        "Add a reading and get the new average"
+
+        if self._average.is_none():
+            average = reading
+        else:
+            average = self.weight * reading + (1 - self.weight) * self._average.unwrap()
+
+        self._average = Some(average)
+
+        return average
+
+
+class RollingMedian:
+    """
+    The median of the last few readings
+
+    Unlike an average, this ignores a reading that's wildly off from the others
+    (like a camera flash in front of a light sensor) instead of being dragged along by it.
+    """
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError(f"the window needs at least 1 reading, not {window}")
+
+        self._readings: deque[float] = deque(maxlen=window)
+
+    def update(self, reading: float) -> float:
+        "Add a reading and get the new median"
+
+        self._readings.append(reading)
+
+        return median(self._readings)
+
+
+class Deadband:
+    """
+    Decides whether a reading has changed enough since the last one passed along
+    to be worth passing along too
+
+    A reading is passed along when it's more than `relative_tolerance`
+    (like 0.05 for 5%) away from the last one passed along
+    (or `absolute_tolerance` away, whichever is more, so readings near 0 aren't all changes),
+    or when it's been `heartbeat_seconds` since the last one was passed along anyway.
+    """
+
+    def __init__(
+        self,
+        *,
+        relative_tolerance: float,
+        absolute_tolerance: float = 0.0,
+        heartbeat_seconds: float,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.relative_tolerance = relative_tolerance
+        self.absolute_tolerance = absolute_tolerance
+        self.heartbeat_seconds = heartbeat_seconds
+
+        self._clock = clock
+        # The last reading passed along and when (in the clock's time)
+        self._last: Option[tuple[float, float]] = NONE()
+
+    def should_pass_along(self, reading: float) -> bool:
+        "Whether to pass along this reading (which counts as passing it along if so)"
+
+        now = self._clock()
+
+        if self._last.is_some():
+            (last_reading, last_passed_along_at) = self._last.unwrap()
+
+            tolerance = max(
+                self.relative_tolerance * abs(last_reading), self.absolute_tolerance
+            )
+
+            if (
+                abs(reading - last_reading) <= tolerance
+                and now - last_passed_along_at < self.heartbeat_seconds
+            ):
+                return False
+
+        self._last = Some((reading, now))
+
+        return True
@@ -0,0 +1,198 @@
+"""
+A channel that only ever holds the newest value sent on it
+
+Unlike a bounded channel, sending never waits and never queues up old values:
+each send replaces whatever was there before.
+Every `Receiver` keeps track of the last value it saw, and receiving waits
+for a value newer than that one (skipping over any that were replaced in between).
+
+This suits camera frames, where a consumer always wants the freshest one
+and holding onto stale ones only wastes memory.
+
+Values that need to be reference counted (like frames from a `FramePool`)
+can be given `retain` and `release` functions:
+the channel releases a value once it's been replaced,
+and retains it once more for every receiver that receives it.
+"""
+
+from asyncio import Event
+from typing import AsyncIterator, Callable, Generic, TypeVar
+
+from option_and_result import NONE, Option, Some
+
+T = TypeVar("T")
+
+
+def no_op(_value):
+    pass
+
+
+class _Shared(Generic[T]):
+    def __init__(
+        self,
+        *,
+        retain: Callable[[T], object],
+        release: Callable[[T], object],
+    ):
+        self.value: Option[T] = NONE()
+        # Goes up by one with every value sent
+        self.version = 0
+        # The newest version that any receiver has received
+        self.received_version = 0
+        self.closed = False
+
+        # Replaced with a new event every time it's set
+        self.changed = Event()
+        self.received = Event()
+
+        self.retain = retain
+        self.release = release
+
+
+class Sender(Generic[T]):
+    "Replaces the value that the associated `Receiver`s see"
+
+    def __init__(self, shared: _Shared[T]):
+        self._shared = shared
+
+    def send(self, value: T):
+        """
+        Replace the current value (taking ownership of one reference to it, if it's counted)
+        and wake up every receiver waiting for a new one
+        """
+
+        shared = self._shared
+
+        if shared.closed:
+            shared.release(value)
+            return
+
+        previous = shared.value
+        shared.value = Some(value)
+        shared.version += 1
+
+        if previous.is_some():
+            shared.release(previous.unwrap())
+
+        changed, shared.changed = shared.changed, Event()
+        changed.set()
+
+    async def wait_until_received(self):
+        """
+        Wait until at least one receiver has received the newest value
+        (or the channel closes)
+
+        This lets a producer go exactly as fast as its fastest consumer.
+        """
+
+        shared = self._shared
+
+        while shared.received_version < shared.version and not shared.closed:
+            await shared.received.wait()
+
+    def subscribe(self) -> "Receiver[T]":
+        "Make a new receiver that will only see values sent after now"
+
+        return Receiver(self._shared, self._shared.version)
+
+    def close(self):
+        """
+        Close the channel, letting go of the current value,
+        after which receivers only receive `NONE()`
+        """
+
+        shared = self._shared
+
+        if shared.closed:
+            return
+
+        shared.closed = True
+
+        previous = shared.value.take()
+        if previous.is_some():
+            shared.release(previous.unwrap())
+
+        shared.changed.set()
+        shared.received.set()
+
+    def __del__(self):
+        self.close()
+
+
+class Receiver(Generic[T]):
+    "Receives the newest value from the associated `Sender`"
+
+    def __init__(self, shared: _Shared[T], seen_version: int):
+        self._shared = shared
+        self._seen_version = seen_version
+
+    async def recv(self) -> Option[T]:
+        """
+        Receives a value newer than the last one this receiver received
+        (which is retained for the caller, if it's counted)
+
+        This waits for the sender to send one if it hasn't yet,
+        and returns `NONE()` once the channel is closed.
+        """
+
+        while True:
+            received = self.try_recv()
+
+            if received.is_some() or self._shared.closed:
+                return received
+
+            await self._shared.changed.wait()
+
+    def try_recv(self) -> Option[T]:
+        "Receives a value newer than the last one this receiver received, if there is one"
+
+        shared = self._shared
+
+        if shared.closed or shared.version <= self._seen_version:
+            return NONE()
+
+        value = shared.value.unwrap()
+        shared.retain(value)
+
+        self._seen_version = shared.version
+
+        if shared.received_version < shared.version:
+            shared.received_version = shared.version
+
+            received, shared.received = shared.received, Event()
+            received.set()
+
+        return Some(value)
+
+    def clone(self) -> "Receiver[T]":
+        "Make another receiver that has seen the same values as this one"
+
+        return Receiver(self._shared, self._seen_version)
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        while True:
+            received = await self.recv()
+
+            if received.is_none():
+                return
+
+            yield received.unwrap()
+
+
+def channel(
+    *,
+    retain: Callable[[T], object] = no_op,
+    release: Callable[[T], object] = no_op,
+) -> tuple[Sender[T], Receiver[T]]:
+    """
+    Creates a channel that holds only the newest value sent on it
+
+    More receivers can be made with `Sender.subscribe` or `Receiver.clone`.
+    """
+
+    shared: _Shared[T] = _Shared(retain=retain, release=release)
+
+    sender = Sender(shared)
+    receiver = Receiver(shared, shared.version)
+
+    return (sender, receiver)